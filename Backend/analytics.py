@@ -0,0 +1,261 @@
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from sqlalchemy import select, func
+from config import get_logger, IST, ANALYTICS_LTP_TTL
+from models import ETF, InvestmentCycle, InvestmentSchedule
+from read_models import executed_cost_query
+from utils import get_security_details_batch, get_ltps_or_stale
+from metrics import record_cache
+
+logger = get_logger(__name__)
+
+XIRR_MAX_ITERATIONS = 100
+XIRR_TOLERANCE = 1e-9
+
+# Cached per portfolio version: columnar data, security ids and the last result.
+# "prices" is the last LTP snapshot as (security ids, ltps, stale ids, fetched at)
+_cache = {"version": None, "columns": None, "securities": None, "prices": None, "result_key": None, "result": None}
+_cache_lock = threading.Lock()
+
+def get_portfolio_version(session):
+    """
+    Cheap fingerprint of the executed schedules: row count and latest update.
+    Any execution, edit or reconciliation changes it.
+    """
+    count, last_updated = session.execute(
+        select(func.count(InvestmentSchedule.schedule_id), func.max(InvestmentSchedule.updated_at))
+        .where(InvestmentSchedule.status == "executed")
+    ).one()
+    return count, last_updated.isoformat() if last_updated else None
+
+def load_executed_columns(session):
+    """
+    Loads every executed schedule in one query and returns it as columnar
+    NumPy arrays plus an etf_id -> etf_name map. "cost" is the traded value
+    from executed_cost_query, the same "invested" the dashboard reports;
+    "amount" is the scheduled amount, so amount - cost is the cash left over
+    from rounding down to whole units.
+    """
+    rows = session.execute(
+        executed_cost_query(
+            InvestmentCycle.etf_id,
+            InvestmentSchedule.cycle_id,
+            InvestmentSchedule.execution_date,
+            InvestmentSchedule.amount,
+            InvestmentSchedule.quantity
+        ).order_by(InvestmentSchedule.cycle_id, InvestmentSchedule.week_number)
+    ).all()
+    etf_names = dict(session.execute(select(ETF.etf_id, ETF.etf_name)).all())
+
+    if rows:
+        etf_ids, cycle_ids, dates, amounts, quantities, costs = zip(*rows)
+    else:
+        etf_ids, cycle_ids, dates, amounts, quantities, costs = (), (), (), (), (), ()
+    columns = {
+        "etf_id": np.asarray(etf_ids, dtype=np.int64),
+        "cycle_id": np.asarray(cycle_ids, dtype=np.int64),
+        "date": np.asarray(dates, dtype="datetime64[D]"),
+        "amount": np.asarray(amounts, dtype=np.float64),
+        "cost": np.asarray(costs, dtype=np.float64),
+        "quantity": np.asarray([q or 0 for q in quantities], dtype=np.float64)
+    }
+    return columns, etf_names
+
+def vectorized_xirr(groups, n_groups, amounts, years, terminal_values):
+    """
+    Solves XIRR for every group at once with Newton's method.
+    Each row is an outflow of `amounts` made `years` before the valuation date;
+    each group ends with an inflow of terminal_values. Solves
+    sum(amount * (1 + r) ** years) = terminal_value per group.
+    Returns an array of annualised rates, NaN where no root was found.
+    """
+    rates = np.full(n_groups, 0.1)
+    invested = np.bincount(groups, weights=amounts, minlength=n_groups)
+    valid = (invested > 0) & (terminal_values > 0)
+    converged = ~valid
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(XIRR_MAX_ITERATIONS):
+            base = 1.0 + rates[groups]
+            growth = amounts * base ** years
+            f = np.bincount(groups, weights=growth, minlength=n_groups) - terminal_values
+            df = np.bincount(groups, weights=growth * years / base, minlength=n_groups)
+            step = np.where(df != 0, f / df, np.nan)
+            step[converged] = 0.0
+            rates = np.clip(rates - step, -0.9999, 1e6)
+            converged |= np.abs(step) < XIRR_TOLERANCE
+            if converged.all():
+                break
+    rates[~(converged & valid) | ~np.isfinite(rates)] = np.nan
+    return rates
+
+def _aggregate(groups, n_groups, columns, prices, years):
+    """
+    Sums one grouping. prices is NaN for rows whose ETF has no LTP, which
+    makes value, P&L, return and XIRR NaN for every group holding such a row.
+    """
+    invested = np.bincount(groups, weights=columns["cost"], minlength=n_groups)
+    uninvested = np.bincount(groups, weights=columns["amount"] - columns["cost"], minlength=n_groups)
+    quantity = np.bincount(groups, weights=columns["quantity"], minlength=n_groups)
+    with np.errstate(invalid="ignore"):
+        row_values = np.where(columns["quantity"] > 0, columns["quantity"] * prices, 0.0)
+    value = np.bincount(groups, weights=row_values, minlength=n_groups)
+    xirr = vectorized_xirr(groups, n_groups, columns["cost"], years, value)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_cost = np.where(quantity > 0, invested / quantity, 0.0)
+        return_percent = np.where(invested > 0, (value - invested) / invested * 100, 0.0)
+    return {
+        "invested": invested,
+        "uninvested": uninvested,
+        "quantity": quantity,
+        "value": value,
+        "avg_cost": avg_cost,
+        "unrealised": value - invested,
+        "return_percent": return_percent,
+        "xirr": xirr
+    }
+
+def _round_or_none(value, digits=2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+def compute_portfolio_analytics(session):
+    """
+    Per-cycle and per-ETF cost basis, P&L and XIRR over executed schedules.
+    Cost basis is the traded value of each executed week; cash left over from
+    rounding to whole units is reported separately as uninvested_cash. ETFs
+    without an LTP report null value, P&L, return and XIRR, as do the totals
+    when any held ETF lacks one. LTPs are fetched at most once every
+    ANALYTICS_LTP_TTL seconds, falling back to the last good price while the
+    broker is unavailable; results are cached per portfolio version and LTP
+    snapshot, so a repeat call within the TTL makes no broker request.
+    """
+    version = get_portfolio_version(session)
+    with _cache_lock:
+        record_cache("analytics_columns", _cache["version"] == version)
+        if _cache["version"] != version:
+            columns, etf_names = load_executed_columns(session)
+            _cache.update(version=version, columns=(columns, etf_names), securities=None, result_key=None, result=None)
+            logger.info("📊 Loaded %d executed schedules for analytics (version %s)", len(columns["amount"]), version)
+        columns, etf_names = _cache["columns"]
+        securities = _cache["securities"] or {}
+
+    # Only resolved ids are cached, so names missed during a scrip master
+    # outage are retried on the next call; the download runs outside the lock
+    held_names = [etf_names[etf_id] for etf_id in np.unique(columns["etf_id"]).tolist()]
+    unresolved = [name for name in held_names if name not in securities]
+    if unresolved:
+        resolved = get_security_details_batch(unresolved)
+        securities = {**securities, **{name: ids for name, ids in resolved.items() if ids[0] is not None}}
+        with _cache_lock:
+            if _cache["version"] == version:
+                _cache["securities"] = securities
+
+    etf_keys, etf_groups = np.unique(columns["etf_id"], return_inverse=True)
+    security_ids = {
+        etf_id: securities.get(etf_names[etf_id], (None, None))[0] for etf_id in etf_keys.tolist()
+    }
+    price_key = tuple(sorted({int(security_id) for security_id in security_ids.values() if security_id}))
+    with _cache_lock:
+        prices = _cache["prices"]
+        fresh = (
+            prices is not None and prices[0] == price_key
+            and time.monotonic() - prices[3] < ANALYTICS_LTP_TTL
+        )
+        record_cache("analytics_prices", fresh)
+        hit = fresh and _cache["result_key"] == (version, prices[3])
+        record_cache("analytics_result", hit)
+        if hit:
+            return _cache["result"]
+    if not fresh:
+        ltps, stale_ids = get_ltps_or_stale(list(price_key)) if price_key else ({}, [])
+        prices = (price_key, ltps, stale_ids, time.monotonic())
+        with _cache_lock:
+            _cache["prices"] = prices
+    _, ltps, stale_ids, fetched_at = prices
+    result_key = (version, fetched_at)
+    etf_prices = np.array(
+        [ltps.get(int(security_ids[etf_id]), np.nan) if security_ids[etf_id] else np.nan for etf_id in etf_keys.tolist()],
+        dtype=np.float64
+    )
+
+    today = np.datetime64(datetime.now(IST).date(), "D")
+    years = (today - columns["date"]).astype(np.float64) / 365.0
+    row_prices = etf_prices[etf_groups] if len(etf_keys) else np.zeros(0)
+
+    cycle_keys, cycle_groups = np.unique(columns["cycle_id"], return_inverse=True)
+    per_cycle = _aggregate(cycle_groups, len(cycle_keys), columns, row_prices, years)
+    per_etf = _aggregate(etf_groups, len(etf_keys), columns, row_prices, years)
+
+    # Each cycle belongs to exactly one ETF; map cycle -> ETF position via its first row
+    first_rows = np.unique(cycle_groups, return_index=True)[1]
+    cycle_etf = etf_groups[first_rows]
+    # First/last execution per cycle from the rows sorted by (cycle, date)
+    order = np.lexsort((columns["date"], cycle_groups))
+    sorted_groups = cycle_groups[order]
+    sorted_dates = columns["date"][order]
+    starts = np.flatnonzero(np.r_[True, np.diff(sorted_groups) != 0]) if len(sorted_groups) else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:] - 1, len(sorted_groups) - 1] if len(sorted_groups) else np.zeros(0, dtype=np.int64)
+    first_dates = sorted_dates[starts]
+    last_dates = sorted_dates[ends]
+
+    cycles_by_etf = {}
+    for i, cycle_id in enumerate(cycle_keys.tolist()):
+        cycles_by_etf.setdefault(int(cycle_etf[i]), []).append({
+            "cycle_id": cycle_id,
+            "invested": round(float(per_cycle["invested"][i]), 2),
+            "uninvested_cash": round(float(per_cycle["uninvested"][i]), 2),
+            "quantity": int(per_cycle["quantity"][i]),
+            "avg_cost_price": round(float(per_cycle["avg_cost"][i]), 2),
+            "current_value": _round_or_none(per_cycle["value"][i]),
+            "unrealised_pnl": _round_or_none(per_cycle["unrealised"][i]),
+            "return_percent": _round_or_none(per_cycle["return_percent"][i]),
+            "xirr_percent": _round_or_none(per_cycle["xirr"][i] * 100),
+            "first_execution": str(first_dates[i]),
+            "last_execution": str(last_dates[i])
+        })
+
+    etfs = []
+    for j, etf_id in enumerate(etf_keys.tolist()):
+        etfs.append({
+            "etf_id": etf_id,
+            "etf_name": etf_names[etf_id],
+            "security_id": security_ids[etf_id],
+            "ltp": _round_or_none(etf_prices[j]),
+            "invested": round(float(per_etf["invested"][j]), 2),
+            "uninvested_cash": round(float(per_etf["uninvested"][j]), 2),
+            "quantity": int(per_etf["quantity"][j]),
+            "avg_cost_price": round(float(per_etf["avg_cost"][j]), 2),
+            "current_value": _round_or_none(per_etf["value"][j]),
+            "unrealised_pnl": _round_or_none(per_etf["unrealised"][j]),
+            "return_percent": _round_or_none(per_etf["return_percent"][j]),
+            "xirr_percent": _round_or_none(per_etf["xirr"][j] * 100),
+            "cycles": cycles_by_etf.get(j, [])
+        })
+
+    all_groups = np.zeros(len(columns["amount"]), dtype=np.int64)
+    total = _aggregate(all_groups, 1, columns, row_prices, years)
+    result = {
+        "status": "success",
+        "as_of": datetime.now(IST).isoformat(),
+        "portfolio_version": {"executed_count": version[0], "last_updated": version[1]},
+        "totals": {
+            "invested": round(float(total["invested"][0]), 2),
+            "uninvested_cash": round(float(total["uninvested"][0]), 2),
+            "current_value": _round_or_none(total["value"][0]),
+            "unrealised_pnl": _round_or_none(total["unrealised"][0]),
+            "return_percent": _round_or_none(total["return_percent"][0]),
+            "xirr_percent": _round_or_none(total["xirr"][0] * 100)
+        },
+        "missing_prices": [etf_names[etf_id] for j, etf_id in enumerate(etf_keys.tolist()) if np.isnan(etf_prices[j])],
+        "stale_prices": [
+            etf_names[etf_id] for etf_id in etf_keys.tolist()
+            if security_ids[etf_id] and int(security_ids[etf_id]) in stale_ids
+        ],
+        "etfs": etfs
+    }
+
+    with _cache_lock:
+        if _cache["version"] == version:
+            _cache.update(result_key=result_key, result=result)
+    return result
@@ -1,57 +1,153 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_request_context, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO
-from flask.json.provider import DefaultJSONProvider
-import numpy as np
+import os
+import logging
 import threading
 import time
 from datetime import datetime
 import schedule
-from sqlalchemy import func
-from config import logger, IST
-from models import Session, ETF, InvestmentCycle, InvestmentSchedule
-from utils import get_security_details, get_ltp, dhan, get_balance
+from sqlalchemy import func, insert
+from config import get_logger, kv, log_throttled, IST, PROFILE_DIR, PROFILE_ALLOW_HEADER, DB_CALL_TIMEOUT
+from models import engine, Session, ReadSession, ETF, InvestmentCycle, InvestmentSchedule, read_session_factory, read_bind, pin_reads_to_primary
+from utils import get_security_details, get_security_details_batch, get_ltp_or_stale, get_ltps_or_stale, get_balance, get_holdings_or_stale, fan_out, queued_broker_calls
 from socketio_instance import socketio
-from trade import place_cnc_market_buy_order, execute_weekly_trade, schedule_weekly_trades, unschedule_jobs_for_cycle
+from json_provider import make_json_provider, stream_json_array
+from export import EXPORT_KINDS, PARQUET_AVAILABLE, build_query, iter_csv, iter_parquet
+from analytics import compute_portfolio_analytics
+from read_models import load_etfs, load_cycles_by_etf, load_etf_detail, load_invested_by_etf
+import metrics
+import profiling
+import resilience
+from trade import schedule_weekly_trades, unschedule_jobs_for_cycle, plan_weekly_schedule, register_trade_jobs, apply_schedule_diff, trade_job_tag, register_reconcile_job, run_pending_jobs, RUNNABLE_STATUSES
+
+logger = get_logger(__name__)
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}, r"/socket.io/*": {"origins": "*"}})
 socketio.init_app(app)
 
-# Custom JSON Provider to handle NumPy types
-class CustomJSONProvider(DefaultJSONProvider):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        if isinstance(obj, np.floating):
-            return float(obj)
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super().default(obj)
+app.json = make_json_provider(app)
+
+def _metrics_label():
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "scheduler" if threading.current_thread().name == "scheduler" else "background"
+
+metrics.instrument_sessions(Session, _metrics_label)
+if ReadSession is not Session:
+    metrics.instrument_sessions(ReadSession, _metrics_label)
+metrics.Gauge("scheduler_jobs", "Jobs registered with the scheduler", callback=lambda: len(schedule.jobs))
+metrics.Gauge("broker_executor_queue_depth", "Calls waiting for a broker executor worker", callback=queued_broker_calls)
+metrics.Gauge("broker_circuit_state", "Broker circuit breaker state (0 closed, 1 half-open, 2 open)", ["endpoint"], callback=resilience.circuit_states)
+metrics.Gauge("broker_bulkhead_in_use", "Broker requests in flight per bulkhead", ["bulkhead"], callback=resilience.bulkhead_usage)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiling.take_armed(request.endpoint) or (PROFILE_ALLOW_HEADER and request.headers.get("X-Profile")):
+        g.profile_capture = profiling.sampler.start()
+
+def _reads_forced_primary():
+    return request.headers.get("X-Read-Primary", "").lower() in ("1", "true", "yes")
+
+def _read_session_factory():
+    """
+    Session factory for this request's reads: the replica, unless the request
+    sends 'X-Read-Primary: 1' or a recent mutation pinned reads to the primary.
+    """
+    factory = read_session_factory(force_primary=_reads_forced_primary())
+    g.read_source = "replica" if factory is ReadSession and ReadSession is not Session else "primary"
+    return factory
+
+def _read_bind():
+    """Engine for this request's Core reads (exports), chosen like _read_session_factory."""
+    bind = read_bind(force_primary=_reads_forced_primary())
+    g.read_source = "primary" if bind is engine else "replica"
+    return bind
+
+@app.after_request
+def pin_reads_after_mutation(response):
+    # Read-your-writes: the next dashboard refresh must see what was just changed
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        pin_reads_to_primary()
+    read_source = g.pop("read_source", None)
+    if read_source:
+        response.headers["X-Read-Source"] = read_source
+    return response
+
+@app.after_request
+def record_request_latency(response):
+    capture = g.pop("profile_capture", None)
+    if capture is not None:
+        stacks, elapsed = profiling.sampler.stop(capture)
+        name = profiling.write_capture(f"{request.method}-{request.endpoint or 'unknown'}", stacks, elapsed)
+        if name:
+            response.headers["X-Profile-Capture"] = name
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=response.status_code
+        )
+    return response
 
-app.json = CustomJSONProvider(app)
+@app.route("/api/admin/profiling", methods=["GET", "POST"])
+def admin_profiling():
+    """
+    GET lists saved captures; POST {"requests": n, "endpoint"?: name} profiles
+    the next n requests (optionally only those to one Flask endpoint).
+    """
+    if request.method == "POST":
+        data = request.get_json() or {}
+        try:
+            count = int(data.get("requests", 1))
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "requests must be an integer"}), 400
+        profiling.arm_requests(count, data.get("endpoint"))
+    return jsonify({
+        "status": "success",
+        "armed": profiling.armed_state(),
+        "header_enabled": PROFILE_ALLOW_HEADER,
+        "captures": profiling.list_captures()
+    })
+
+@app.route("/api/admin/profiling/<path:name>", methods=["GET"])
+def download_profile(name):
+    if name not in profiling.list_captures():
+        return jsonify({"status": "error", "message": f"Capture '{name}' not found"}), 404
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, mimetype="text/plain")
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 def run_scheduler():
     while True:
-        logger.debug(f"🔄 Running scheduler loop at {datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S')}")
-        schedule.run_pending()
+        log_throttled(logger, logging.DEBUG, "scheduler_loop", 60, "🔄 Scheduler loop alive (%d jobs)", len(schedule.jobs))
+        run_pending_jobs()
         time.sleep(1)
 
 def reload_pending_schedules():
     """
-    Reloads all pending schedules from the database and registers them with the scheduler.
-    Marks past schedules as 'expired'.
+    Reloads all runnable schedules (pending, failed or waiting for a retry)
+    from the database and registers them with the scheduler. Marks past
+    pending and retry_later schedules as 'expired'; past failed ones keep
+    their status.
     """
     session = Session()
     try:
         logger.info("🔄 Reloading pending schedules from database on server startup")
         now = datetime.now(IST)
-        
+
         pending_schedules = (
-            session.query(InvestmentSchedule)
+            session.query(InvestmentSchedule, ETF.etf_name)
             .join(InvestmentCycle, InvestmentSchedule.cycle_id == InvestmentCycle.cycle_id)
+            .join(ETF, InvestmentCycle.etf_id == ETF.etf_id)
             .filter(
-                InvestmentSchedule.status == "pending",
+                InvestmentSchedule.status.in_(RUNNABLE_STATUSES),
                 InvestmentCycle.status == "active"
             )
             .all()
@@ -61,13 +157,13 @@ def reload_pending_schedules():
             logger.info("ℹ️ No pending schedules found in database")
             return
 
-        for schedule_item in pending_schedules:
-            cycle = session.query(InvestmentCycle).filter_by(cycle_id=schedule_item.cycle_id).first()
-            etf = session.query(ETF).filter_by(etf_id=cycle.etf_id).first()
-            security_id = get_security_details(etf.etf_name)
-
+        securities = get_security_details_batch([etf_name for _, etf_name in pending_schedules])
+        jobs = []
+        expired = 0
+        for schedule_item, etf_name in pending_schedules:
+            security_id = securities[etf_name][0]
             if not security_id:
-                logger.error(f"⚠️ Could not fetch security details for ETF '{etf.etf_name}' for schedule_id={schedule_item.schedule_id}")
+                logger.error(f"⚠️ Could not fetch security details for ETF '{etf_name}' for schedule_id={schedule_item.schedule_id}")
                 continue
 
             execution_datetime = datetime.combine(
@@ -76,36 +172,28 @@ def reload_pending_schedules():
             ).replace(tzinfo=IST)
 
             if execution_datetime <= now:
+                if schedule_item.status == "failed":
+                    continue
+                # Includes retry_later schedules whose retries died with the previous process
                 schedule_item.status = "expired"
-                session.commit()
+                expired += 1
                 logger.info(f"⏭️ Marked schedule_id={schedule_item.schedule_id} as expired (execution_datetime={execution_datetime})")
                 continue
 
-            time_str = execution_datetime.strftime("%H:%M")
-            target_date = schedule_item.execution_date
-
-            def scheduled_trade(
-                schedule_id=schedule_item.schedule_id,
-                security_id=security_id,
-                amount=schedule_item.amount,
-                etf_name=etf.etf_name,
-                target_date=target_date
-            ):
-                now = datetime.now(IST)
-                if now.date() != target_date:
-                    return
-                logger.info(f"🚀 Executing scheduled trade for schedule_id={schedule_id}")
-                execute_weekly_trade(schedule_id, security_id, amount, etf_name)
-
-            job_tag = f"trade_{schedule_item.cycle_id}_{schedule_item.week_number - 1}"
-            schedule.every().day.at(time_str).do(scheduled_trade).tag(job_tag)
-            logger.info(
-                f"✅ Scheduled job for schedule_id={schedule_item.schedule_id}, "
-                f"cycle_id={schedule_item.cycle_id}, week={schedule_item.week_number}, "
-                f"at {time_str} on {target_date}"
-            )
+            jobs.append({
+                "cycle_id": schedule_item.cycle_id,
+                "week_number": schedule_item.week_number,
+                "schedule_id": schedule_item.schedule_id,
+                "security_id": security_id,
+                "amount": schedule_item.amount,
+                "etf_name": etf_name,
+                "execution_datetime": execution_datetime
+            })
 
-        logger.info(f"✅ Successfully reloaded {len(pending_schedules)} pending schedules")
+        if expired:
+            session.commit()
+        register_trade_jobs(jobs)
+        logger.info(f"✅ Successfully reloaded {len(pending_schedules)} runnable schedules ({len(jobs)} scheduled, {expired} expired)")
         
     except Exception as e:
         logger.error(f"❌ Error reloading pending schedules: {e}", exc_info=True)
@@ -175,27 +263,40 @@ def resume_cycle():
 
         etf = session.query(ETF).filter_by(etf_id=cycle.etf_id).first()
         schedules = session.query(InvestmentSchedule).filter_by(cycle_id=cycle_id, status="pending").all()
-        security_id = get_security_details(etf.etf_name)
         now = datetime.now(IST)
+        upcoming = [
+            (s, datetime.combine(s.execution_date, s.execution_time).replace(tzinfo=IST)) for s in schedules
+        ]
+        upcoming = [(s, dt) for s, dt in upcoming if dt > now]
+
+        # Resolve the security before resuming, so a failed lookup leaves the cycle paused
+        security_id = None
+        if upcoming:
+            security_id, _ = get_security_details(etf.etf_name)
+            if not security_id:
+                logger.error("Could not fetch security details for ETF '%s', cycle %s not resumed", etf.etf_name, cycle_id)
+                return jsonify({
+                    "status": "error",
+                    "message": f"Could not fetch security details for ETF '{etf.etf_name}', cycle not resumed"
+                }), 500
 
-        for s in schedules:
-            dt = datetime.combine(s.execution_date, s.execution_time).replace(tzinfo=IST)
-            if dt > now:
-                time_str = dt.strftime("%H:%M")
-                target_date = s.execution_date
-
-                def resume_trade(schedule_id=s.schedule_id, security_id=security_id, amount=s.amount, etf_name=etf.etf_name, target_date=target_date):
-                    now = datetime.now(IST)
-                    if now.date() != target_date:
-                        return
-                    execute_weekly_trade(schedule_id, security_id, amount, etf_name)
-
-                schedule.every().day.at(time_str).do(resume_trade).tag(f"trade_{cycle_id}_{s.week_number - 1}")
-                logger.info(f"🔁 Rescheduled Week {s.week_number} for cycle {cycle_id} at {time_str} on {target_date}")
+        jobs = []
+        for s, dt in upcoming:
+            jobs.append({
+                "cycle_id": cycle_id,
+                "week_number": s.week_number,
+                "schedule_id": s.schedule_id,
+                "security_id": security_id,
+                "amount": s.amount,
+                "etf_name": etf.etf_name,
+                "execution_datetime": dt
+            })
+            logger.info("🔁 Rescheduled week %s for cycle %s at %s on %s", s.week_number, cycle_id, dt.strftime('%H:%M'), s.execution_date)
 
         cycle.status = "active"
         session.commit()
-        return jsonify({"status": "success", "message": f"Cycle {cycle_id} resumed with {len(schedules)} jobs"})
+        register_trade_jobs(jobs)
+        return jsonify({"status": "success", "message": f"Cycle {cycle_id} resumed with {len(jobs)} jobs"})
 
     except Exception as e:
         logger.error(f"❌ Error in /api/resume_cycle: {e}", exc_info=True)
@@ -203,15 +304,73 @@ def resume_cycle():
     finally:
         session.close()
 
+def _parse_schedule_update(data):
+    """
+    Validates the amount/execution_date/execution_time fields of a schedule edit.
+    Returns (fields, error_message); fields only holds the keys that were provided.
+    """
+    fields = {}
+    new_amount = data.get("amount")
+    new_date = data.get("execution_date")
+    new_time = data.get("execution_time")
+
+    if new_amount is not None:
+        try:
+            new_amount = float(new_amount)
+        except (TypeError, ValueError):
+            return None, "Invalid amount format"
+        if new_amount <= 0:
+            return None, "Amount must be positive"
+        fields["amount"] = new_amount
+
+    if new_date:
+        try:
+            fields["execution_date"] = datetime.strptime(new_date, "%Y-%m-%d").date()
+        except ValueError:
+            return None, "Invalid date format, must be YYYY-MM-DD"
+
+    if new_time:
+        try:
+            fields["execution_time"] = datetime.strptime(new_time, "%H:%M:%S").time()
+        except ValueError:
+            return None, "Invalid time format, must be HH:MM:SS"
+
+    if not fields:
+        return None, "No valid update fields provided"
+    return fields, None
+
+def _needs_job(schedule_item, fields, now):
+    """True if the schedule, with the edited fields applied, still has a trade to run."""
+    execution_datetime = datetime.combine(
+        fields.get("execution_date", schedule_item.execution_date),
+        fields.get("execution_time", schedule_item.execution_time)
+    ).replace(tzinfo=IST)
+    return schedule_item.status in RUNNABLE_STATUSES and execution_datetime > now
+
+def _reschedule_job(schedule_item, security_id, etf_name, now):
+    """
+    Returns the trade job for a schedule if it still needs to run, else None.
+    The caller resolves security_id first and keeps the old job if it cannot.
+    """
+    updated_dt = datetime.combine(schedule_item.execution_date, schedule_item.execution_time).replace(tzinfo=IST)
+    if not _needs_job(schedule_item, {}, now):
+        return None
+    return {
+        "cycle_id": schedule_item.cycle_id,
+        "week_number": schedule_item.week_number,
+        "schedule_id": schedule_item.schedule_id,
+        "security_id": security_id,
+        "amount": schedule_item.amount,
+        "etf_name": etf_name,
+        "execution_datetime": updated_dt
+    }
+
 @app.route("/api/update_schedule", methods=["POST"])
 def update_schedule():
     session = Session()
     try:
         data = request.get_json()
         schedule_id = data.get("schedule_id")
-        new_amount = data.get("amount")
-        new_date = data.get("execution_date")
-        new_time = data.get("execution_time")
 
         if not schedule_id:
             return jsonify({"status": "error", "message": "Missing schedule_id"}), 400
@@ -220,39 +379,30 @@ def update_schedule():
         if not schedule_item:
             return jsonify({"status": "error", "message": "Schedule not found"}), 404
 
-        changes = []
-        if new_amount is not None:
-            try:
-                new_amount = float(new_amount)
-                if new_amount <= 0:
-                    return jsonify({"status": "error", "message": "Amount must be positive"}), 400
-                schedule_item.amount = new_amount
-                changes.append("amount")
-            except ValueError:
-                return jsonify({"status": "error", "message": "Invalid amount format"}), 400
-
-        if new_date:
-            try:
-                parsed_date = datetime.strptime(new_date, "%Y-%m-%d").date()
-                schedule_item.execution_date = parsed_date
-                changes.append("execution_date")
-            except ValueError:
-                return jsonify({"status": "error", "message": "Invalid date format, must be YYYY-MM-DD"}), 400
+        fields, error_message = _parse_schedule_update(data)
+        if error_message:
+            return jsonify({"status": "error", "message": error_message}), 400
 
-        if new_time:
-            try:
-                parsed_time = datetime.strptime(new_time, "%H:%M:%S").time()
-                schedule_item.execution_time = parsed_time
-                changes.append("execution_time")
-            except ValueError:
-                return jsonify({"status": "error", "message": "Invalid time format, must be HH:MM:SS"}), 400
+        # Resolve the security before changing anything, so a failed lookup
+        # leaves both the row and its scheduled job as they were
+        cycle = session.query(InvestmentCycle).filter_by(cycle_id=schedule_item.cycle_id).first()
+        etf = session.query(ETF).filter_by(etf_id=cycle.etf_id).first()
+        security_id = None
+        if _needs_job(schedule_item, fields, datetime.now(IST)):
+            security_id, _ = get_security_details(etf.etf_name)
+            if not security_id:
+                logger.error("Could not fetch security details for ETF '%s', schedule %s not updated", etf.etf_name, schedule_id)
+                return jsonify({
+                    "status": "error",
+                    "message": f"Could not fetch security details for ETF '{etf.etf_name}', schedule not updated"
+                }), 500
 
-        if not changes:
-            return jsonify({"status": "error", "message": "No valid update fields provided"}), 400
+        for field, value in fields.items():
+            setattr(schedule_item, field, value)
+        changes = list(fields)
 
         schedule_item.updated_at = datetime.now(IST)
 
-        cycle = session.query(InvestmentCycle).filter_by(cycle_id=schedule_item.cycle_id).first()
         total = session.query(InvestmentSchedule).filter_by(cycle_id=cycle.cycle_id).with_entities(
             func.sum(InvestmentSchedule.amount)
         ).scalar() or 0.0
@@ -263,26 +413,12 @@ def update_schedule():
         session.commit()
 
         try:
-            schedule.clear(f"trade_{cycle.cycle_id}_{schedule_item.week_number - 1}")
-            logger.info(f"🗑️ Cleared old job for schedule_id={schedule_item.schedule_id}")
-
-            now = datetime.now(IST)
-            updated_dt = datetime.combine(schedule_item.execution_date, schedule_item.execution_time).replace(tzinfo=IST)
-
-            if schedule_item.status in ["pending", "failed"] and updated_dt > now:
-                time_str = updated_dt.strftime("%H:%M")
-                target_date = schedule_item.execution_date
-                etf = session.query(ETF).filter_by(etf_id=cycle.etf_id).first()
-                security_id = get_security_details(etf.etf_name)
-
-                def updated_trade(schedule_id=schedule_item.schedule_id, security_id=security_id, amount=schedule_item.amount, etf_name=etf.etf_name, target_date=target_date):
-                    now = datetime.now(IST)
-                    if now.date() != target_date:
-                        return
-                    execute_weekly_trade(schedule_id, security_id, amount, etf_name)
-
-                schedule.every().day.at(time_str).do(updated_trade).tag(f"trade_{cycle.cycle_id}_{schedule_item.week_number - 1}")
-                logger.info(f"🆕 Rescheduled job for schedule_id={schedule_item.schedule_id} at {time_str} on {target_date}")
+            job = _reschedule_job(schedule_item, security_id, etf.etf_name, datetime.now(IST))
+            apply_schedule_diff([trade_job_tag(cycle.cycle_id, schedule_item.week_number)], [job] if job else [])
+            if job:
+                logger.info(f"🆕 Rescheduled job for schedule_id={schedule_item.schedule_id} at {job['execution_datetime'].strftime('%H:%M')} on {schedule_item.execution_date}")
+            else:
+                logger.info(f"🗑️ Cleared old job for schedule_id={schedule_item.schedule_id}")
 
         except Exception as e:
             logger.warning(f"⚠️ Error during rescheduling: {e}")
@@ -300,81 +436,179 @@ def update_schedule():
     finally:
         session.close()
 
+@app.route("/api/update_schedule/bulk", methods=["POST"])
+def update_schedule_bulk():
+    """
+    Applies many schedule edits in one transaction. Body:
+    {"updates": [{"schedule_id", "amount"?, "execution_date"?, "execution_time"?}, ...]}
+    Each affected cycle's total is recomputed once and the scheduler changes
+    are applied as a single diff after the commit. Schedules whose ETF
+    security cannot be resolved keep their old values and job and are listed
+    under 'failed'.
+    """
+    session = Session()
+    try:
+        data = request.get_json()
+        updates = data.get("updates") if isinstance(data, dict) else None
+        if not updates or not isinstance(updates, list):
+            return jsonify({"status": "error", "message": "Missing updates list in request body"}), 400
+
+        parsed = []
+        errors = []
+        for index, update in enumerate(updates):
+            if not isinstance(update, dict) or not update.get("schedule_id"):
+                errors.append({"index": index, "message": "Missing schedule_id"})
+                continue
+            try:
+                schedule_id = int(update["schedule_id"])
+            except (TypeError, ValueError):
+                errors.append({"index": index, "schedule_id": update["schedule_id"], "message": "Invalid schedule_id, must be an integer"})
+                continue
+            fields, error_message = _parse_schedule_update(update)
+            if error_message:
+                errors.append({"index": index, "schedule_id": schedule_id, "message": error_message})
+                continue
+            parsed.append((schedule_id, fields))
+
+        if errors:
+            return jsonify({"status": "error", "message": "Invalid updates in request body", "errors": errors}), 400
+
+        # Several edits of one schedule apply in order
+        merged = {}
+        for schedule_id, fields in parsed:
+            merged.setdefault(schedule_id, {}).update(fields)
+        schedules = {
+            s.schedule_id: s
+            for s in session.query(InvestmentSchedule).filter(InvestmentSchedule.schedule_id.in_(list(merged))).all()
+        }
+        missing = [schedule_id for schedule_id in merged if schedule_id not in schedules]
+        if missing:
+            return jsonify({"status": "error", "message": f"Schedules not found: {missing}"}), 404
+
+        etf_names = dict(
+            session.query(InvestmentCycle.cycle_id, ETF.etf_name)
+            .join(ETF, ETF.etf_id == InvestmentCycle.etf_id)
+            .filter(InvestmentCycle.cycle_id.in_({s.cycle_id for s in schedules.values()}))
+            .all()
+        )
+        # Resolve securities before writing anything, so the scrip master
+        # download never runs inside the write transaction. A schedule whose
+        # security cannot be resolved is left untouched, old job included
+        now = datetime.now(IST)
+        needs_job = [schedule_id for schedule_id, fields in merged.items() if _needs_job(schedules[schedule_id], fields, now)]
+        securities = get_security_details_batch({etf_names[schedules[schedule_id].cycle_id] for schedule_id in needs_job})
+        failed = [
+            {
+                "schedule_id": schedule_id,
+                "message": f"Could not fetch security details for ETF '{etf_names[schedules[schedule_id].cycle_id]}'"
+            }
+            for schedule_id in needs_job
+            if not securities[etf_names[schedules[schedule_id].cycle_id]][0]
+        ]
+        failed_ids = {entry["schedule_id"] for entry in failed}
+        applied = {schedule_id: fields for schedule_id, fields in merged.items() if schedule_id not in failed_ids}
+        if not applied:
+            logger.error("Could not fetch security details, none of %d schedules updated", len(failed))
+            return jsonify({"status": "error", "message": "No schedules updated", "failed": failed}), 500
+
+        for schedule_id, fields in applied.items():
+            schedule_item = schedules[schedule_id]
+            for field, value in fields.items():
+                setattr(schedule_item, field, value)
+            schedule_item.updated_at = now
+
+        cycle_ids = {schedules[schedule_id].cycle_id for schedule_id in applied}
+        totals = dict(
+            session.query(InvestmentSchedule.cycle_id, func.sum(InvestmentSchedule.amount))
+            .filter(InvestmentSchedule.cycle_id.in_(cycle_ids))
+            .group_by(InvestmentSchedule.cycle_id)
+            .all()
+        )
+        cycles = session.query(InvestmentCycle).filter(InvestmentCycle.cycle_id.in_(cycle_ids)).all()
+        for cycle in cycles:
+            cycle.total_amount = totals.get(cycle.cycle_id) or 0.0
+            cycle.updated_at = now
+
+        clear_tags = [trade_job_tag(schedules[schedule_id].cycle_id, schedules[schedule_id].week_number) for schedule_id in applied]
+        jobs = []
+        for schedule_id in applied:
+            schedule_item = schedules[schedule_id]
+            etf_name = etf_names[schedule_item.cycle_id]
+            job = _reschedule_job(schedule_item, securities.get(etf_name, (None, None))[0], etf_name, now)
+            if job:
+                jobs.append(job)
+
+        session.commit()
+        logger.info("✅ Updated schedules in one transaction", extra=kv(
+            schedules=len(applied), cycles=len(cycles), failed=len(failed)
+        ))
+
+        apply_schedule_diff(clear_tags, jobs)
+
+        response = {
+            "status": "success",
+            "message": f"Updated {len(applied)} schedules",
+            "updated": [
+                {"schedule_id": schedule_id, "updated_fields": list(fields)}
+                for schedule_id, fields in applied.items()
+            ],
+            "new_total_amounts": {str(cycle_id): float(total or 0.0) for cycle_id, total in totals.items()},
+            "rescheduled": [job["schedule_id"] for job in jobs]
+        }
+        if failed:
+            response["message"] += f", {len(failed)} failed"
+            response["failed"] = failed
+        return jsonify(response)
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error in /api/update_schedule/bulk: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        session.close()
+
 @app.route("/api/etf_details/<etf_name>", methods=["GET"])
 def get_etf_details(etf_name):
-    session = Session()
     try:
-        etf = session.query(ETF).filter_by(etf_name=etf_name.strip()).first()
-        if not etf:
-            logger.error(f"ETF '{etf_name}' not found in database")
+        etf_name = etf_name.strip()
+
+        # DB load, holdings and scrip lookup are independent, so issue them together
+        results, failed = fan_out({
+            "db": (load_etf_detail, etf_name, _read_session_factory()),
+            "holdings": (get_holdings_or_stale,),
+            "security": (get_security_details, etf_name),
+        }, timeouts={"db": DB_CALL_TIMEOUT})
+        if "db" in failed:
+            return jsonify({"status": "error", "message": f"Could not load ETF '{etf_name}' from database"}), 500
+        if results["db"] is None:
+            logger.error("ETF '%s' not found in database", etf_name)
             return jsonify({"status": "error", "message": f"ETF '{etf_name}' not found"}), 404
 
-        cycles = session.query(InvestmentCycle).filter_by(etf_id=etf.etf_id).all()
-        cycle_list = []
-        total_invested = 0.0
+        etf_info, cycle_list, total_invested = results["db"]
+        degraded = []
+        # Age in seconds of any last-good broker data served instead of live data
+        stale = {}
 
-        for cycle in cycles:
-            schedules = session.query(InvestmentSchedule).filter_by(cycle_id=cycle.cycle_id).order_by(InvestmentSchedule.week_number).all()
-            schedule_list = []
-            for s in schedules:
-                schedule_list.append({
-                    "schedule_id": s.schedule_id,
-                    "week_number": s.week_number,
-                    "execution_date": s.execution_date.isoformat(),
-                    "execution_time": s.execution_time.strftime("%H:%M:%S"),
-                    "amount": float(s.amount),
-                    "quantity": int(s.quantity),  # Include quantity
-                    "status": s.status,
-                    "created_at": s.created_at.isoformat(),
-                    "updated_at": s.updated_at.isoformat()
-                })
-                if s.status == "executed":
-                    total_invested += float(s.amount)
-
-            cycle_list.append({
-                "cycle_id": cycle.cycle_id,
-                "total_amount": float(cycle.total_amount),
-                "start_date": cycle.start_date.isoformat(),
-                "status": cycle.status,
-                "created_at": cycle.created_at.isoformat(),
-                "updated_at": cycle.updated_at.isoformat(),
-                "schedules": schedule_list
-            })
+        holdings, holdings_age = results["holdings"] or (None, None)
+        if holdings_age is not None:
+            stale["holdings"] = round(holdings_age, 1)
+        if holdings is None:
+            logger.warning("Holdings unavailable, serving ETF '%s' without holding data", etf_name)
+            degraded.append("holdings")
+            holdings = []
 
-        holdings = []
-        try:
-            response = dhan.get_holdings()
-            if response and response.get("status") == "success" and "data" in response:
-                holdings = response["data"]
-                logger.info(f"Fetched {len(holdings)} holdings from Dhan")
-            else:
-                logger.error(f"Failed to fetch holdings. Response: {response}")
-                return jsonify({
-                    "status": "error",
-                    "message": f"Failed to fetch holdings: {response.get('remarks', 'Unknown error')}"
-                }), 500
-        except Exception as e:
-            logger.error(f"Exception while fetching holdings: {e}", exc_info=True)
-            return jsonify({
-                "status": "error",
-                "message": f"Failed to fetch holdings: {str(e)}"
-            }), 500
+        security_id, symbol_name = results["security"] or (None, None)
+        if not security_id:
+            logger.warning("Could not fetch security details for ETF '%s', serving without market data", etf_name)
+            degraded.append("security")
+            symbol_name = etf_name
 
         holding_qty = 0
         current_value = 0.0
         avg_cost_price = 0.0
-        security_id, symbol_name = get_security_details(etf.etf_name)
-        
-        if not security_id:
-            logger.error(f"Could not fetch security details for ETF '{etf_name}'")
-            return jsonify({
-                "status": "error",
-                "message": f"Could not fetch security details for ETF '{etf_name}'"
-            }), 500
-
         ltp = None
         holding_details = None
-        if holdings:
+        if security_id:
             for holding in holdings:
                 if int(holding.get("securityId")) == int(security_id):
                     holding_qty = int(holding.get("availableQty", 0))
@@ -384,23 +618,28 @@ def get_etf_details(etf_name):
                     current_value = holding_qty * ltp
                     break
 
-        if ltp is None or ltp == 0.0:
-            ltp = get_ltp(security_id)
-            if ltp is None:
-                logger.error(f"Could not fetch LTP for ETF '{etf_name}' (security_id: {security_id})")
-                ltp = 0.0
-            current_value = holding_qty * ltp
+            if ltp is None or ltp == 0.0:
+                ltp, ltp_age = get_ltp_or_stale(security_id)
+                if ltp_age is not None:
+                    stale["ltp"] = round(ltp_age, 1)
+                if ltp is None:
+                    logger.error("Could not fetch LTP for ETF '%s' (security_id: %s)", etf_name, security_id)
+                    degraded.append("ltp")
+                    ltp = 0.0
+                current_value = holding_qty * ltp
+        else:
+            ltp = 0.0
 
         profit_percent = ((current_value - total_invested) / total_invested * 100) if total_invested > 0 else 0.0
 
         response = {
             "status": "success",
             "etf": {
-                "etf_id": etf.etf_id,
-                "etf_name": etf.etf_name,
+                "etf_id": etf_info["etf_id"],
+                "etf_name": etf_info["etf_name"],
                 "full_name": symbol_name,
-                "description": etf.description,
-                "created_at": etf.created_at.isoformat(),
+                "description": etf_info["description"],
+                "created_at": etf_info["created_at"],
                 "investment_cycles": cycle_list,
                 "total_invested": round(float(total_invested), 2),
                 "current_value": round(float(current_value), 2),
@@ -411,22 +650,26 @@ def get_etf_details(etf_name):
                 "holding_details": holding_details
             }
         }
-
-        logger.info(f"Successfully fetched details for ETF '{etf_name}': "
-                    f"Total Invested: ₹{total_invested:.2f}, "
-                    f"Current Value: ₹{current_value:.2f}, "
-                    f"Profit: {profit_percent:.2f}%, "
-                    f"Holding Quantity: {holding_qty}, "
-                    f"Avg Cost Price: ₹{avg_cost_price:.2f}, "
-                    f"LTP: ₹{ltp:.2f}")
+        if degraded:
+            response["degraded"] = degraded
+        if stale:
+            response["stale"] = stale
+
+        logger.info("Successfully fetched ETF details", extra=kv(
+            etf_name=etf_name,
+            total_invested=round(float(total_invested), 2),
+            current_value=round(float(current_value), 2),
+            profit_percent=round(float(profit_percent), 2),
+            holding_quantity=holding_qty,
+            avg_cost_price=round(float(avg_cost_price), 2),
+            ltp=round(float(ltp), 2)
+        ))
         
         return jsonify(response)
 
     except Exception as e:
-        logger.error(f"Error in /api/etf_details/{etf_name}: {str(e)}", exc_info=True)
+        logger.error("Error in /api/etf_details/%s: %s", etf_name, e, exc_info=True)
         return jsonify({"status": "error", "message": f"Internal server error: {str(e)}"}), 500
-    finally:
-        session.close()
 
 @app.route("/api/schedule_etf", methods=["POST"])
 def api_schedule_etf():
@@ -522,98 +765,313 @@ def api_schedule_etf():
     finally:
         session.close()
 
-@app.route("/api/all_etf_details", methods=["GET"])
-def get_all_etf_details():
+@app.route("/api/schedule_etf/bulk", methods=["POST"])
+def api_schedule_etf_bulk():
+    """
+    Creates many investment cycles in one request. Body:
+    {"entries": [{"etf_name", "total_amount", "start_date", "start_time"?}, ...]}
+    All entries are validated against one balance snapshot and one scrip master
+    download, then inserted in a single transaction.
+    """
     session = Session()
     try:
-        etfs = session.query(ETF).all()
+        data = request.get_json()
+        entries = data.get("entries") if isinstance(data, dict) else None
+        if not entries or not isinstance(entries, list):
+            logger.error("Missing entries list in request body")
+            return jsonify({"status": "error", "message": "Missing entries list in request body"}), 400
+
+        parsed = []
+        errors = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict) or "etf_name" not in entry or "total_amount" not in entry or "start_date" not in entry:
+                errors.append({"index": index, "message": "Missing etf_name, total_amount, or start_date"})
+                continue
+            try:
+                total_amount = float(entry["total_amount"])
+            except (TypeError, ValueError):
+                errors.append({"index": index, "message": "Invalid total_amount"})
+                continue
+            if total_amount <= 0:
+                errors.append({"index": index, "message": "Total amount must be positive."})
+                continue
+            start_time = entry.get("start_time", "15:00:00")
+            try:
+                start_datetime = datetime.strptime(f"{entry['start_date']} {start_time}", "%Y-%m-%d %H:%M:%S").replace(tzinfo=IST)
+            except ValueError:
+                errors.append({"index": index, "message": "Invalid date or time format. Use 'YYYY-MM-DD' for start_date and 'HH:MM:SS' for start_time."})
+                continue
+            parsed.append({
+                "etf_name": str(entry["etf_name"]).strip(),
+                "total_amount": total_amount,
+                "start_datetime": start_datetime
+            })
 
-        response = dhan.get_holdings()
-        logger.info(f"[Dhan Holdings API Response] => {response}")
+        if errors:
+            logger.error(f"Rejected bulk schedule request with {len(errors)} invalid entries")
+            return jsonify({"status": "error", "message": "Invalid entries in request body", "errors": errors}), 400
 
-        holdings = response.get("data", []) if response and response.get("status") == "success" else []
+        requested_total = sum(entry["total_amount"] for entry in parsed)
+        available_balance, withdrawable_balance = get_balance()
+        if withdrawable_balance is None:
+            logger.error("Could not fetch withdrawable balance.")
+            return jsonify({"status": "error", "message": "Could not fetch withdrawable balance."}), 500
+        if requested_total > withdrawable_balance:
+            logger.error(f"Requested total (₹{requested_total}) exceeds withdrawable balance (₹{withdrawable_balance}).")
+            return jsonify({
+                "status": "error",
+                "message": f"Requested total (₹{requested_total}) exceeds withdrawable balance (₹{withdrawable_balance})."
+            }), 400
 
-        strategies = []
+        etf_names = list(dict.fromkeys(entry["etf_name"] for entry in parsed))
+        securities = get_security_details_batch(etf_names)
+        unresolved = [name for name in etf_names if not securities[name][0]]
+        if unresolved:
+            logger.error(f"Could not fetch security details for ETFs {unresolved}.")
+            return jsonify({"status": "error", "message": f"Could not fetch security details for ETFs: {', '.join(unresolved)}."}), 500
+
+        etf_ids = dict(session.query(ETF.etf_name, ETF.etf_id).filter(ETF.etf_name.in_(etf_names)).all())
+        missing_etfs = [name for name in etf_names if name not in etf_ids]
+        if missing_etfs:
+            created = session.execute(
+                insert(ETF).returning(ETF.etf_name, ETF.etf_id),
+                [{"etf_name": name, "description": f"ETF {name}"} for name in missing_etfs]
+            ).all()
+            etf_ids.update(dict(created))
+            logger.info(f"✅ Created {len(created)} new ETFs")
+
+        cycle_ids = session.scalars(
+            insert(InvestmentCycle).returning(InvestmentCycle.cycle_id, sort_by_parameter_order=True),
+            [
+                {
+                    "etf_id": etf_ids[entry["etf_name"]],
+                    "total_amount": entry["total_amount"],
+                    "start_date": entry["start_datetime"].date(),
+                    "status": "active"
+                }
+                for entry in parsed
+            ]
+        ).all()
+
+        schedule_rows = []
+        jobs = []
+        for entry, cycle_id in zip(parsed, cycle_ids):
+            entry["cycle_id"] = cycle_id
+            entry["plan"] = plan_weekly_schedule(entry["start_datetime"], entry["total_amount"])
+            for week_number, execution_datetime, amount in entry["plan"]:
+                schedule_rows.append({
+                    "cycle_id": cycle_id,
+                    "week_number": week_number,
+                    "execution_date": execution_datetime.date(),
+                    "execution_time": execution_datetime.time(),
+                    "amount": amount,
+                    "quantity": 0,
+                    "status": "pending"
+                })
+                jobs.append({
+                    "cycle_id": cycle_id,
+                    "week_number": week_number,
+                    "security_id": securities[entry["etf_name"]][0],
+                    "amount": amount,
+                    "etf_name": entry["etf_name"],
+                    "execution_datetime": execution_datetime
+                })
 
-        for etf in etfs:
-            security_id, symbol_name = get_security_details(etf.etf_name)
-            if not security_id:
-                logger.warning(f"Could not fetch security details for {etf.etf_name}")
-                symbol_name = etf.etf_name
+        schedule_ids = session.scalars(
+            insert(InvestmentSchedule).returning(InvestmentSchedule.schedule_id, sort_by_parameter_order=True),
+            schedule_rows
+        ).all()
+        for job, schedule_id in zip(jobs, schedule_ids):
+            job["schedule_id"] = schedule_id
 
-            cycles = session.query(InvestmentCycle).filter_by(etf_id=etf.etf_id).all()
-            holding_qty = 0
-            ltp = 0.0
-            avg_cost_price = 0.0
-            current_value = 0.0
-            weeks = []
-
-            holding_details = next((h for h in holdings if int(h.get("securityId")) == int(security_id)), None)
-            if holding_details:
-                holding_qty = int(holding_details.get("availableQty", 0))
-                ltp = float(holding_details.get("lastTradedPrice", 0.0))
-                avg_cost_price = float(holding_details.get("avgCostPrice", 0.0))
-                current_value = holding_qty * ltp
-            else:
-                ltp = get_ltp(security_id) or 0.0
-                current_value = holding_qty * ltp
+        session.commit()
+        logger.info(f"✅ Saved {len(cycle_ids)} cycles and {len(schedule_ids)} schedules in one transaction")
 
-            total_invested = avg_cost_price * holding_qty
-
-            total_cycle_count = 0
-            latest_cycle = None
-            
-            for cycle in cycles:
-                total_cycle_count += 1
-                latest_cycle = cycle  # Keep track of the latest cycle
-                schedules = (
-                    session.query(InvestmentSchedule)
-                    .filter_by(cycle_id=cycle.cycle_id)
-                    .order_by(InvestmentSchedule.week_number)
-                    .all()
-                )
-                for s in schedules:
-                    weeks.append({
-                        "id": f"{cycle.cycle_id}-{s.week_number}",
-                        "schedule_id": s.schedule_id,
-                        "weekNumber": s.week_number,
-                        "amount": float(s.amount),
-                        "date": s.execution_date.strftime("%d/%m/%Y"),
-                        "ltp": round(ltp, 2),
-                        "qty": int(s.quantity),  # Use stored quantity
-                        "status": s.status
-                    })
-
-            profit_percent = ((current_value - total_invested) / total_invested * 100) if total_invested > 0 else 0.0
-
-            strategy = {
-                "id": str(latest_cycle.cycle_id) if latest_cycle else "0",
-                "name": etf.etf_name,
-                "full_name": symbol_name,
-                "totalAmount": round(total_invested, 2),
-                "totalQty": holding_qty,
-                "avgCostPrice": round(avg_cost_price, 2),
-                "ltp": round(ltp, 2),
-                "currentValue": round(current_value, 2),
-                "profit": round(profit_percent, 2),
-                "status": latest_cycle.status if latest_cycle else "inactive",
-                "totalCount": total_cycle_count,
-                "startDate": cycles[0].start_date.strftime("%d/%m/%Y") if cycles else None,
-                "weeks": weeks
-            }
+        register_trade_jobs(jobs)
+
+        return jsonify({
+            "status": "success",
+            "total_amount": requested_total,
+            "cycles": [
+                {
+                    "etf_name": entry["etf_name"],
+                    "cycle_id": entry["cycle_id"],
+                    "total_amount": entry["total_amount"],
+                    "weekly_amount": entry["total_amount"] / 5,
+                    "schedule": [dt.strftime('%Y-%m-%d %H:%M:%S') for _, dt, _ in entry["plan"]]
+                }
+                for entry in parsed
+            ]
+        })
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"❌ Error in /api/schedule_etf/bulk: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": f"Internal server error: {str(e)}"}), 500
+    finally:
+        session.close()
+
+def _iter_strategies(etfs, cycles_by_etf, invested_by_etf, holdings_by_security, securities, ltps):
+    """
+    Yields the dashboard strategy dict for each ETF from preloaded data, so the
+    response can be serialized in one go or streamed item by item.
+    """
+    for etf in etfs:
+        security_id, symbol_name = securities.get(etf.etf_name, (None, None))
+        if not security_id:
+            # Once per ETF and minute, not on every dashboard refresh
+            log_throttled(
+                logger, logging.WARNING, f"strategy_security:{etf.etf_name}", 60,
+                "Could not fetch security details for %s", etf.etf_name
+            )
+            symbol_name = etf.etf_name
+
+        cycles = cycles_by_etf.get(etf.etf_id, [])
+        holding_qty = 0
+        ltp = 0.0
+        avg_cost_price = 0.0
+        current_value = 0.0
+        weeks = []
 
-            strategies.append(strategy)
+        holding_details = holdings_by_security.get(security_id) if security_id else None
+        if holding_details:
+            holding_qty = int(holding_details.get("availableQty", 0))
+            ltp = float(holding_details.get("lastTradedPrice", 0.0))
+            avg_cost_price = float(holding_details.get("avgCostPrice", 0.0))
+            current_value = holding_qty * ltp
+        else:
+            ltp = (ltps.get(int(security_id)) if security_id else None) or 0.0
+            current_value = holding_qty * ltp
 
-        return jsonify(strategies)
+        total_invested = invested_by_etf.get(etf.etf_id, 0.0)
+
+        total_cycle_count = 0
+        latest_cycle = None
+        
+        for cycle, schedules in cycles:
+            total_cycle_count += 1
+            latest_cycle = cycle  # Keep track of the latest cycle
+            for s in schedules:
+                weeks.append({
+                    "id": f"{cycle.cycle_id}-{s.week_number}",
+                    "schedule_id": s.schedule_id,
+                    "weekNumber": s.week_number,
+                    "amount": float(s.amount),
+                    "date": s.execution_date.strftime("%d/%m/%Y"),
+                    "ltp": round(ltp, 2),
+                    "qty": int(s.quantity),  # Use stored quantity
+                    "status": s.status
+                })
+
+        profit_percent = ((current_value - total_invested) / total_invested * 100) if total_invested > 0 else 0.0
+
+        strategy = {
+            "id": str(latest_cycle.cycle_id) if latest_cycle else "0",
+            "name": etf.etf_name,
+            "full_name": symbol_name,
+            "totalAmount": round(total_invested, 2),
+            "totalQty": holding_qty,
+            "avgCostPrice": round(avg_cost_price, 2),
+            "ltp": round(ltp, 2),
+            "currentValue": round(current_value, 2),
+            "profit": round(profit_percent, 2),
+            "status": latest_cycle.status if latest_cycle else "inactive",
+            "totalCount": total_cycle_count,
+            "startDate": cycles[0][0].start_date.strftime("%d/%m/%Y") if cycles else None,
+            "weeks": weeks
+        }
+
+        yield strategy
+
+@app.route("/api/all_etf_details", methods=["GET"])
+def get_all_etf_details():
+    read_session = _read_session_factory()
+    try:
+        etfs = load_etfs(read_session)
+
+        results, failed = fan_out({
+            "db": (load_cycles_by_etf, read_session),
+            "invested": (load_invested_by_etf, read_session),
+            "holdings": (get_holdings_or_stale,),
+            "securities": (get_security_details_batch, [etf.etf_name for etf in etfs]),
+        }, timeouts={"db": DB_CALL_TIMEOUT, "invested": DB_CALL_TIMEOUT})
+        if "db" in failed or "invested" in failed:
+            return jsonify({"status": "error", "message": "Could not load investment cycles from database"}), 500
+
+        cycles_by_etf = results["db"]
+        invested_by_etf = results["invested"]
+        holdings, holdings_age = results["holdings"] or (None, None)
+        holdings = holdings or []
+        stale = {"holdings"} if holdings_age is not None else set()
+        securities = results["securities"] or {}
+        holdings_by_security = {int(h.get("securityId")): h for h in holdings if h.get("securityId") is not None}
+
+        # LTP is only needed for ETFs we do not hold; fetch those in one batch
+        unheld = [
+            security_id for security_id, _ in (securities.get(etf.etf_name, (None, None)) for etf in etfs)
+            if security_id and int(security_id) not in holdings_by_security
+        ]
+        ltps = {}
+        if unheld:
+            ltps, stale_ltps = get_ltps_or_stale(unheld)
+            if stale_ltps:
+                stale.add("ltp")
+
+        strategies = _iter_strategies(etfs, cycles_by_etf, invested_by_etf, holdings_by_security, securities, ltps)
+        if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+            response = Response(stream_json_array(strategies), mimetype="application/json")
+        else:
+            response = jsonify(list(strategies))
+        if stale:
+            # The body is a bare list, so flag last-good broker data in a header
+            response.headers["X-Stale-Data"] = ",".join(sorted(stale))
+        return response
 
     except Exception as e:
         logger.error(f"Error in /api/all_etf_details: {str(e)}", exc_info=True)
         return jsonify({"status": "error", "message": f"Internal server error: {str(e)}"}), 500
+
+@app.route("/api/export/<kind>", methods=["GET"])
+def export_rows(kind):
+    """
+    Streams executions or schedules joined with cycle and ETF as CSV (default)
+    or Parquet. Filters: from/to (YYYY-MM-DD, inclusive) and etf (repeatable
+    or comma-separated).
+    """
+    if kind not in EXPORT_KINDS:
+        return jsonify({"status": "error", "message": f"Unknown export '{kind}'"}), 404
+    fmt = request.args.get("format", "csv").lower()
+    etfs = [name.strip() for value in request.args.getlist("etf") for name in value.split(",") if name.strip()]
+    try:
+        query = build_query(kind, request.args.get("from"), request.args.get("to"), etfs)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    bind = _read_bind()
+    filename = f"{kind}_{datetime.now(IST).strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if fmt == "csv":
+        return Response(iter_csv(query, bind=bind), mimetype="text/csv", headers=headers)
+    if fmt == "parquet":
+        if not PARQUET_AVAILABLE:
+            return jsonify({"status": "error", "message": "Parquet export requires pyarrow (pip install pyarrow)"}), 400
+        return Response(iter_parquet(query, bind=bind), mimetype="application/vnd.apache.parquet", headers=headers)
+    return jsonify({"status": "error", "message": "format must be 'csv' or 'parquet'"}), 400
+
+@app.route("/api/portfolio_analytics", methods=["GET"])
+def get_portfolio_analytics():
+    session = _read_session_factory()()
+    try:
+        return jsonify(compute_portfolio_analytics(session))
+    except Exception as e:
+        logger.error(f"Error in /api/portfolio_analytics: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": f"Internal server error: {str(e)}"}), 500
     finally:
         session.close()
 
 if __name__ == "__main__":
     reload_pending_schedules()
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+    register_reconcile_job()
+    scheduler_thread = threading.Thread(target=run_scheduler, name="scheduler", daemon=True)
     scheduler_thread.start()
     socketio.run(app, debug=True)
\ No newline at end of file
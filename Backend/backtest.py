@@ -0,0 +1,232 @@
+"""
+Backtests the 5-week DCA split used by trade.schedule_weekly_trades against
+locally stored price history.
+
+Each combination of (ETF, start date, amount, execution time) is replayed the
+way the live scheduler runs it: total / 5 every week at the same time, buying
+int(amount // ltp) units at the first price at or after the scheduled time.
+It is compared with investing the whole amount in week 1.
+
+Price history lives in a directory as two NumPy files per ETF, which are
+memory-mapped by every worker:
+    <ETF>.ts.npy  int64 timestamps, seconds since epoch in IST wall-clock time
+    <ETF>.px.npy  float64 prices, same length, sorted by timestamp
+
+Usage:
+    python backtest.py convert --csv NIFTYBEES.csv --etf NIFTYBEES --prices-dir prices
+    python backtest.py run --prices-dir prices --etfs NIFTYBEES GOLDBEES \\
+        --start-from 2023-01-02 --start-to 2023-12-29 --amounts 10000 50000 \\
+        --times 09:30 15:00 --valuation-date 2024-06-28 --out results.csv
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+WEEKS = 5  # Matches the split in trade.schedule_weekly_trades
+SECONDS_PER_DAY = 86400
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+DEFAULT_CHUNK_SIZE = 2000
+
+# Per-process cache of memory-mapped price arrays
+_price_cache = {}
+
+def price_paths(prices_dir, etf_name):
+    return (
+        os.path.join(prices_dir, f"{etf_name}.ts.npy"),
+        os.path.join(prices_dir, f"{etf_name}.px.npy")
+    )
+
+def convert_csv(csv_path, etf_name, prices_dir, timestamp_column="timestamp", price_column="price"):
+    """
+    Converts a CSV of IST timestamps and prices into the memory-mappable
+    .ts.npy/.px.npy pair read by the backtest.
+    """
+    df = pd.read_csv(csv_path, usecols=[timestamp_column, price_column])
+    df = df.dropna().sort_values(timestamp_column)
+    timestamps = pd.to_datetime(df[timestamp_column]).dt.tz_localize(None).values.astype("datetime64[s]").astype(np.int64)
+    prices = df[price_column].to_numpy(dtype=np.float64)
+    os.makedirs(prices_dir, exist_ok=True)
+    ts_path, px_path = price_paths(prices_dir, etf_name)
+    np.save(ts_path, timestamps)
+    np.save(px_path, prices)
+    logger.info(f"✅ Wrote {len(prices)} prices for {etf_name} to {prices_dir}")
+    return len(prices)
+
+def load_prices(prices_dir, etf_name):
+    key = (prices_dir, etf_name)
+    if key not in _price_cache:
+        ts_path, px_path = price_paths(prices_dir, etf_name)
+        _price_cache[key] = (np.load(ts_path, mmap_mode="r"), np.load(px_path, mmap_mode="r"))
+    return _price_cache[key]
+
+def simulate(timestamps, prices, start_days, amounts, time_offsets, valuation_ts):
+    """
+    Replays every combination at once. start_days are epoch days, time_offsets
+    seconds after midnight and valuation_ts the epoch second prices are marked at.
+    Returns a dict of per-combination result arrays.
+    """
+    n = len(start_days)
+    weeks = np.arange(WEEKS, dtype=np.int64)
+    scheduled = (start_days[:, None] * SECONDS_PER_DAY + time_offsets[:, None]) + weeks[None, :] * SECONDS_PER_WEEK
+
+    # Fill at the first tick at or after the scheduled time on the same day
+    idx = np.searchsorted(timestamps, scheduled, side="left")
+    in_range = idx < len(timestamps)
+    safe_idx = np.minimum(idx, len(timestamps) - 1)
+    fill_ts = timestamps[safe_idx]
+    filled = in_range & (fill_ts // SECONDS_PER_DAY == scheduled // SECONDS_PER_DAY) & (scheduled <= valuation_ts)
+    fill_px = np.where(filled, prices[safe_idx], np.nan)
+
+    weekly_amount = amounts / WEEKS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        quantity = np.where(filled, np.floor(weekly_amount[:, None] / fill_px), 0.0)
+    spent = np.where(filled, quantity * fill_px, 0.0)
+    rounding_cash = np.where(filled, weekly_amount[:, None] - spent, 0.0).sum(axis=1)
+    unfilled_cash = (~filled).sum(axis=1) * weekly_amount
+
+    value_idx = np.searchsorted(timestamps, valuation_ts, side="right") - 1
+    valuation_px = prices[value_idx] if value_idx >= 0 else np.nan
+
+    total_qty = quantity.sum(axis=1)
+    dca_value = total_qty * valuation_px + (amounts - spent.sum(axis=1))
+    dca_return = (dca_value - amounts) / amounts
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lump_qty = np.where(filled[:, 0], np.floor(amounts / fill_px[:, 0]), np.nan)
+    lump_value = lump_qty * valuation_px + (amounts - lump_qty * fill_px[:, 0])
+    lump_return = (lump_value - amounts) / amounts
+
+    complete = filled.all(axis=1)
+    return {
+        "filled_weeks": filled.sum(axis=1),
+        "complete": complete,
+        "quantity": total_qty,
+        "avg_fill_price": np.where(total_qty > 0, spent.sum(axis=1) / np.maximum(total_qty, 1), np.nan),
+        "rounding_cash": rounding_cash,
+        "cash_drag_percent": rounding_cash / amounts * 100,
+        "unfilled_cash": unfilled_cash,
+        "dca_value": dca_value,
+        "dca_return_percent": dca_return * 100,
+        "lump_sum_value": lump_value,
+        "lump_sum_return_percent": lump_return * 100,
+        "excess_return_percent": (dca_return - lump_return) * 100,
+        "valuation_price": np.full(n, valuation_px)
+    }
+
+def _evaluate_chunk(prices_dir, etf_name, start_days, amounts, time_offsets, valuation_ts):
+    timestamps, prices = load_prices(prices_dir, etf_name)
+    results = simulate(timestamps, prices, start_days, amounts, time_offsets, valuation_ts)
+    results["etf_name"] = np.full(len(start_days), etf_name, dtype=object)
+    results["start_date"] = start_days.astype("datetime64[D]")
+    results["amount"] = amounts
+    results["execution_time"] = time_offsets
+    return results
+
+def build_grid(start_from, start_to, amounts, times, weekdays_only=True):
+    """Cartesian product of start dates, amounts and execution times."""
+    days = np.arange(np.datetime64(start_from, "D"), np.datetime64(start_to, "D") + np.timedelta64(1, "D"))
+    if weekdays_only:
+        days = days[np.is_busday(days)]
+    parsed = [datetime.strptime(t, "%H:%M") for t in times]
+    offsets = np.array([t.hour * 3600 + t.minute * 60 for t in parsed], dtype=np.int64)
+    day_grid, amount_grid, offset_grid = np.meshgrid(
+        days.astype(np.int64), np.asarray(amounts, dtype=np.float64), offsets, indexing="ij"
+    )
+    return day_grid.ravel(), amount_grid.ravel(), offset_grid.ravel()
+
+def run_backtest(prices_dir, etf_names, start_days, amounts, time_offsets, valuation_date,
+                 workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Evaluates every (ETF, start, amount, time) combination across a process
+    pool and returns the results as a DataFrame.
+    """
+    valuation_end = np.datetime64(valuation_date, "D") + np.timedelta64(1, "D")
+    valuation_ts = int(valuation_end.astype("datetime64[s]").astype(np.int64)) - 1
+    tasks = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for etf_name in etf_names:
+            for offset in range(0, len(start_days), chunk_size):
+                window = slice(offset, offset + chunk_size)
+                tasks.append(pool.submit(
+                    _evaluate_chunk, prices_dir, etf_name,
+                    start_days[window], amounts[window], time_offsets[window], valuation_ts
+                ))
+        frames = [pd.DataFrame(task.result()) for task in tasks]
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        seconds = df["execution_time"]
+        df["execution_time"] = [f"{s // 3600:02d}:{s % 3600 // 60:02d}" for s in seconds]
+    logger.info(f"✅ Evaluated {len(df)} combinations across {len(etf_names)} ETFs")
+    return df
+
+def summarize(df):
+    """Per-ETF summary over combinations whose five weeks all filled."""
+    complete = df[df["complete"]]
+    summary = {}
+    for etf_name, group in complete.groupby("etf_name"):
+        summary[etf_name] = {
+            "combinations": int(len(group)),
+            "mean_dca_return_percent": round(float(group["dca_return_percent"].mean()), 4),
+            "mean_lump_sum_return_percent": round(float(group["lump_sum_return_percent"].mean()), 4),
+            "dca_beats_lump_sum_percent": round(float((group["excess_return_percent"] > 0).mean() * 100), 2),
+            "mean_cash_drag_percent": round(float(group["cash_drag_percent"].mean()), 4),
+            "max_cash_drag_percent": round(float(group["cash_drag_percent"].max()), 4)
+        }
+    summary["incomplete_combinations"] = int(len(df) - len(complete))
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the 5-week ETF DCA schedule")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Convert a CSV price history to memory-mappable arrays")
+    convert.add_argument("--csv", required=True)
+    convert.add_argument("--etf", required=True)
+    convert.add_argument("--prices-dir", required=True)
+    convert.add_argument("--timestamp-column", default="timestamp")
+    convert.add_argument("--price-column", default="price")
+
+    run = subparsers.add_parser("run", help="Run a backtest grid")
+    run.add_argument("--prices-dir", required=True)
+    run.add_argument("--etfs", nargs="+", required=True)
+    run.add_argument("--start-from", required=True, help="First start date, YYYY-MM-DD")
+    run.add_argument("--start-to", required=True, help="Last start date, YYYY-MM-DD")
+    run.add_argument("--amounts", nargs="+", type=float, required=True)
+    run.add_argument("--times", nargs="+", default=["15:00"], help="Execution times, HH:MM")
+    run.add_argument("--valuation-date", required=True, help="Date positions are marked at, YYYY-MM-DD")
+    run.add_argument("--include-weekends", action="store_true")
+    run.add_argument("--workers", type=int, default=None)
+    run.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    run.add_argument("--out", help="Write per-combination results to this CSV")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    if args.command == "convert":
+        convert_csv(args.csv, args.etf, args.prices_dir, args.timestamp_column, args.price_column)
+        return 0
+
+    start_days, amounts, time_offsets = build_grid(
+        args.start_from, args.start_to, args.amounts, args.times, weekdays_only=not args.include_weekends
+    )
+    df = run_backtest(
+        args.prices_dir, args.etfs, start_days, amounts, time_offsets, args.valuation_date,
+        workers=args.workers, chunk_size=args.chunk_size
+    )
+    if args.out:
+        df.to_csv(args.out, index=False)
+        logger.info(f"💾 Wrote results to {args.out}")
+    print(json.dumps(summarize(df), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
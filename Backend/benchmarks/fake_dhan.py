@@ -0,0 +1,231 @@
+"""
+Local stand-in for the Dhan endpoints used by the backend: marketfeed LTP,
+holdings, fund limits, order placement, order/trade books, order lookups,
+trade history and the scrip master CSV. Latency and error rate are configurable so benchmarks can model
+a slow or flaky broker; order_delay holds back the reply to an order that
+was already accepted, to model a placement that times out on the client.
+
+Run standalone:
+    python benchmarks/fake_dhan.py --port 8765 --symbols 50 --latency 0.02
+then start the app with DHAN_API_URL=http://127.0.0.1:8765 and
+DHAN_SCRIP_MASTER_URL=http://127.0.0.1:8765/scrip-master.csv
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRST_SECURITY_ID = 100000
+
+def symbol_names(count):
+    return [f"BENCHETF{i:04d}" for i in range(count)]
+
+class FakeDhanState:
+    def __init__(self, symbols, funds=1e12, latency=0.0, error_rate=0.0, order_delay=0.0, seed=0):
+        self.latency = latency
+        self.order_delay = order_delay
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.securities = {symbol: FIRST_SECURITY_ID + i for i, symbol in enumerate(symbols)}
+        self.prices = {security_id: 100.0 + (security_id % 50) for security_id in self.securities.values()}
+        self.funds = funds
+        self.holdings = {}
+        self.orders = []
+        self.request_count = 0
+
+    def scrip_master_csv(self):
+        lines = ["SECURITY_ID,EXCH_ID,UNDERLYING_SYMBOL,SYMBOL_NAME"]
+        for symbol, security_id in self.securities.items():
+            lines.append(f"{security_id},NSE,{symbol},{symbol} EXCHANGE TRADED FUND")
+        return "\n".join(lines) + "\n"
+
+    def place_order(self, body):
+        security_id = int(body.get("securityId", 0))
+        quantity = int(body.get("quantity", 0))
+        price = self.prices.get(security_id, 100.0)
+        with self.lock:
+            order_id = str(len(self.orders) + 1)
+            self.funds -= quantity * price
+            held = self.holdings.setdefault(security_id, [0, 0.0])
+            held[1] = (held[0] * held[1] + quantity * price) / (held[0] + quantity) if held[0] + quantity else 0.0
+            held[0] += quantity
+            self.orders.append({
+                "orderId": order_id,
+                "correlationId": body.get("correlationId", ""),
+                "orderStatus": "TRADED",
+                "securityId": str(security_id),
+                "quantity": quantity,
+                "filledQty": quantity,
+                "averageTradedPrice": price,
+                "transactionType": body.get("transactionType", "BUY"),
+                "createTime": time.strftime("%Y-%m-%d %H:%M:%S")
+            })
+        return {"orderId": order_id, "orderStatus": "TRANSIT"}
+
+    def holdings_list(self):
+        with self.lock:
+            return [
+                {
+                    "securityId": str(security_id),
+                    "tradingSymbol": str(security_id),
+                    "availableQty": quantity,
+                    "totalQty": quantity,
+                    "avgCostPrice": avg_price,
+                    "lastTradedPrice": self.prices.get(security_id, 0.0)
+                }
+                for security_id, (quantity, avg_price) in self.holdings.items()
+            ]
+
+    def trades_list(self, from_date=None, to_date=None):
+        with self.lock:
+            return [
+                {
+                    "orderId": order["orderId"],
+                    "securityId": order["securityId"],
+                    "tradedQuantity": order["filledQty"],
+                    "tradedPrice": order["averageTradedPrice"]
+                }
+                for order in self.orders
+                if from_date is None or from_date <= order["createTime"][:10] <= to_date
+            ]
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _path(self):
+            path = self.path.split("?", 1)[0]
+            return path[3:] if path.startswith("/v2/") else path
+
+        def _send(self, status, body, content_type="application/json"):
+            payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _delay_or_fail(self):
+            with state.lock:
+                state.request_count += 1
+                fail = state.error_rate > 0 and state.random.random() < state.error_rate
+            if state.latency:
+                time.sleep(state.latency)
+            if fail:
+                self._send(500, {"errorType": "Internal", "errorMessage": "Injected failure"})
+                return True
+            return False
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            path = self._path()
+            if self._delay_or_fail():
+                return
+            if path == "/scrip-master.csv":
+                self._send(200, state.scrip_master_csv(), "text/csv")
+            elif path == "/holdings":
+                self._send(200, state.holdings_list())
+            elif path == "/fundlimit":
+                self._send(200, {"availabelBalance": state.funds, "availableBalance": state.funds, "withdrawableBalance": state.funds})
+            elif path == "/orders":
+                with state.lock:
+                    self._send(200, list(state.orders))
+            elif path.startswith("/orders/external/"):
+                correlation_id = path.rsplit("/", 1)[1]
+                with state.lock:
+                    matches = [order for order in state.orders if order["correlationId"] == correlation_id]
+                if matches:
+                    self._send(200, matches[-1])
+                else:
+                    self._send(404, {"errorType": "Data_Error", "errorCode": "DH-907", "errorMessage": "No order found"})
+            elif path.startswith("/orders/"):
+                order_id = path.rsplit("/", 1)[1]
+                with state.lock:
+                    matches = [order for order in state.orders if order["orderId"] == order_id]
+                if matches:
+                    self._send(200, matches[0])
+                else:
+                    self._send(404, {"errorType": "Data_Error", "errorCode": "DH-907", "errorMessage": "No order found"})
+            elif path == "/trades":
+                self._send(200, state.trades_list())
+            elif path.startswith("/trades/"):
+                # Trade history: /trades/<from>/<to>/<page>, everything on page 0
+                _, from_date, to_date, page = path.rsplit("/", 3)
+                self._send(200, state.trades_list(from_date, to_date) if page == "0" else [])
+            else:
+                self._send(404, {"errorMessage": f"Unknown path {path}"})
+
+        def do_POST(self):
+            path = self._path()
+            body = self._body()
+            if self._delay_or_fail():
+                return
+            if path == "/marketfeed/ltp":
+                ids = body.get("NSE_EQ", [])
+                data = {str(i): {"last_price": state.prices[int(i)]} for i in ids if int(i) in state.prices}
+                self._send(200, {"status": "success", "data": {"NSE_EQ": data}})
+            elif path == "/orders":
+                accepted = state.place_order(body)
+                if state.order_delay:
+                    time.sleep(state.order_delay)
+                self._send(200, accepted)
+            else:
+                self._send(404, {"errorMessage": f"Unknown path {path}"})
+
+    return Handler
+
+class FakeDhanServer:
+    """Threaded HTTP server serving FakeDhanState on 127.0.0.1."""
+
+    def __init__(self, symbols, port=0, **state_kwargs):
+        self.state = FakeDhanState(symbols, **state_kwargs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(self.state))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-dhan", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def scrip_master_url(self):
+        return f"{self.url}/scrip-master.csv"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Dhan API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--order-delay", type=float, default=0.0, help="Seconds an accepted order's reply is held back")
+    args = parser.parse_args()
+
+    server = FakeDhanServer(
+        symbol_names(args.symbols), port=args.port, latency=args.latency, error_rate=args.error_rate, order_delay=args.order_delay
+    )
+    print(f"Fake Dhan listening on {server.url} (scrip master: {server.scrip_master_url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Frozen copies of the ORM loaders the listing endpoints used before
+read_models.py, kept as the baseline for the read-model benchmark.
+"""
+from models import Session, ETF, InvestmentCycle, InvestmentSchedule
+
+def load_etf_cycles(etf_name, session_factory=Session):
+    """
+    Loads an ETF with its cycles and schedules in its own session so it can run
+    alongside the broker calls. Returns None if the ETF does not exist.
+    """
+    session = session_factory()
+    try:
+        etf = session.query(ETF).filter_by(etf_name=etf_name).first()
+        if not etf:
+            return None
+
+        cycles = session.query(InvestmentCycle).filter_by(etf_id=etf.etf_id).order_by(InvestmentCycle.cycle_id).all()
+        cycle_ids = [cycle.cycle_id for cycle in cycles]
+        schedules_by_cycle = {cycle_id: [] for cycle_id in cycle_ids}
+        if cycle_ids:
+            schedules = (
+                session.query(InvestmentSchedule)
+                .filter(InvestmentSchedule.cycle_id.in_(cycle_ids))
+                .order_by(InvestmentSchedule.cycle_id, InvestmentSchedule.week_number)
+                .all()
+            )
+            for s in schedules:
+                schedules_by_cycle[s.cycle_id].append(s)
+
+        cycle_list = []
+        total_invested = 0.0
+        for cycle in cycles:
+            schedule_list = []
+            for s in schedules_by_cycle[cycle.cycle_id]:
+                schedule_list.append({
+                    "schedule_id": s.schedule_id,
+                    "week_number": s.week_number,
+                    "execution_date": s.execution_date.isoformat(),
+                    "execution_time": s.execution_time.strftime("%H:%M:%S"),
+                    "amount": float(s.amount),
+                    "quantity": int(s.quantity),  # Include quantity
+                    "status": s.status,
+                    "created_at": s.created_at.isoformat(),
+                    "updated_at": s.updated_at.isoformat()
+                })
+                if s.status == "executed":
+                    total_invested += float(s.amount)
+
+            cycle_list.append({
+                "cycle_id": cycle.cycle_id,
+                "total_amount": float(cycle.total_amount),
+                "start_date": cycle.start_date.isoformat(),
+                "status": cycle.status,
+                "created_at": cycle.created_at.isoformat(),
+                "updated_at": cycle.updated_at.isoformat(),
+                "schedules": schedule_list
+            })
+
+        etf_info = {
+            "etf_id": etf.etf_id,
+            "etf_name": etf.etf_name,
+            "description": etf.description,
+            "created_at": etf.created_at.isoformat()
+        }
+        return etf_info, cycle_list, total_invested
+    finally:
+        session.close()
+
+def load_all_cycles(session_factory=Session):
+    """
+    Loads every cycle and its schedules with two queries, grouped by ETF.
+    Returns a dict of etf_id -> list of (cycle, schedules) ordered by cycle_id.
+    """
+    session = session_factory()
+    try:
+        cycles = session.query(InvestmentCycle).order_by(InvestmentCycle.cycle_id).all()
+        schedules = (
+            session.query(InvestmentSchedule)
+            .order_by(InvestmentSchedule.cycle_id, InvestmentSchedule.week_number)
+            .all()
+        )
+        schedules_by_cycle = {}
+        for s in schedules:
+            schedules_by_cycle.setdefault(s.cycle_id, []).append(s)
+
+        cycles_by_etf = {}
+        for cycle in cycles:
+            cycles_by_etf.setdefault(cycle.etf_id, []).append((cycle, schedules_by_cycle.get(cycle.cycle_id, [])))
+        return cycles_by_etf
+    finally:
+        session.close()
@@ -0,0 +1,333 @@
+"""
+Reproducible benchmark suite for the backend.
+
+Starts a fake Dhan server (benchmarks/fake_dhan.py), points DB_URL at a
+temporary SQLite file (or --db-url, e.g. a scratch Postgres database), and
+measures:
+  * /api/all_etf_details latency against the number of ETFs and cycles
+  * reload_pending_schedules time against the number of pending schedules
+  * throughput of one execution slot with many due schedules, and the time
+    to reconcile the whole slot against the order and trade books
+  * latency and peak allocation of the listing loaders, row-based read
+    models against the previous ORM path (benchmarks/orm_baseline.py)
+
+Results are written as JSON; pass --compare with an earlier file to print
+the change per measurement.
+
+    python benchmarks/run_benchmarks.py --etfs 5 20 50 --pending 100 500 --slot-size 200
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_dhan import FakeDhanServer, symbol_names
+
+def _configure_environment(server, db_url, broker_mode):
+    # Must happen before anything imports config
+    os.environ["BROKER_MODE"] = broker_mode
+    os.environ["CLIENT_ID"] = "bench-client"
+    os.environ["ACCESS_TOKEN"] = "bench-token"
+    os.environ["DB_URL"] = db_url
+    os.environ["DHAN_API_URL"] = server.url
+    os.environ["DHAN_SCRIP_MASTER_URL"] = server.scrip_master_url
+
+def _latency_stats(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3)
+    }
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        import app as app_module
+        import models
+        import schedule
+        import trade
+        from config import IST
+        self.IST = IST
+        self.app_module = app_module
+        self.models = models
+        self.schedule = schedule
+        self.trade = trade
+        self.client = app_module.app.test_client()
+
+    def tomorrow(self):
+        return datetime.now(self.IST).date() + timedelta(days=1)
+
+    def reset(self):
+        from sqlalchemy import delete
+        self.schedule.clear()
+        with self.models.engine.begin() as conn:
+            for model in (self.models.ExecutionHistory, self.models.InvestmentSchedule, self.models.InvestmentCycle, self.models.ETF):
+                conn.execute(delete(model))
+
+    def seed(self, n_etfs, cycles_per_etf, start_date, status="pending", execution_time="15:00:00"):
+        """Bulk-inserts ETFs, cycles and five schedules per cycle. Returns the schedule count."""
+        from sqlalchemy import insert
+        models = self.models
+        time_value = datetime.strptime(execution_time, "%H:%M:%S").time()
+        with models.engine.begin() as conn:
+            etf_ids = conn.execute(
+                insert(models.ETF).returning(models.ETF.etf_id, sort_by_parameter_order=True),
+                [{"etf_name": name, "description": f"ETF {name}"} for name in symbol_names(n_etfs)]
+            ).scalars().all()
+            cycle_ids = conn.execute(
+                insert(models.InvestmentCycle).returning(models.InvestmentCycle.cycle_id, sort_by_parameter_order=True),
+                [
+                    {"etf_id": etf_id, "total_amount": 5000.0, "start_date": start_date, "status": "active"}
+                    for etf_id in etf_ids for _ in range(cycles_per_etf)
+                ]
+            ).scalars().all()
+            rows = [
+                {
+                    "cycle_id": cycle_id,
+                    "week_number": week + 1,
+                    "execution_date": start_date + timedelta(weeks=week),
+                    "execution_time": time_value,
+                    "amount": 1000.0,
+                    "quantity": 0,
+                    "status": status
+                }
+                for cycle_id in cycle_ids for week in range(5)
+            ]
+            conn.execute(insert(models.InvestmentSchedule), rows)
+        return len(rows)
+
+    def bench_all_etf_details(self):
+        results = []
+        for n_etfs in self.args.etfs:
+            for cycles in self.args.cycles:
+                self.reset()
+                schedules = self.seed(n_etfs, cycles, self.tomorrow())
+                samples = []
+                for _ in range(self.args.repeat):
+                    started = time.perf_counter()
+                    response = self.client.get("/api/all_etf_details")
+                    samples.append(time.perf_counter() - started)
+                    assert response.status_code == 200, response.data[:200]
+                results.append({"etfs": n_etfs, "cycles_per_etf": cycles, "schedules": schedules, **_latency_stats(samples)})
+                print(f"all_etf_details etfs={n_etfs} cycles={cycles}: {results[-1]['median_ms']} ms")
+        return results
+
+    def bench_reload_pending(self):
+        results = []
+        for pending in self.args.pending:
+            samples = []
+            for _ in range(self.args.repeat):
+                self.reset()
+                cycles = max(1, pending // 5)
+                n_etfs = min(self.args.symbols, cycles)
+                self.seed(n_etfs, max(1, cycles // n_etfs), self.tomorrow())
+                started = time.perf_counter()
+                self.app_module.reload_pending_schedules()
+                samples.append(time.perf_counter() - started)
+            jobs = len(self.schedule.jobs)
+            results.append({"pending": pending, "jobs_registered": jobs, **_latency_stats(samples)})
+            print(f"reload_pending_schedules pending={pending}: {results[-1]['median_ms']} ms ({jobs} jobs)")
+        return results
+
+    def bench_slot(self):
+        """Registers slot_size due schedules for today and runs them all back to back."""
+        from sqlalchemy import func, select
+        models = self.models
+        self.reset()
+        slot_time = (datetime.now(self.IST) + timedelta(minutes=2)).replace(second=0, microsecond=0)
+        n_etfs = min(self.args.symbols, max(1, self.args.slot_size))
+        cycles_per_etf = max(1, self.args.slot_size // n_etfs)
+        self.seed(n_etfs, cycles_per_etf, slot_time.date(), execution_time=slot_time.strftime("%H:%M:%S"))
+        # Only the first week of every cycle is due today
+        self.app_module.reload_pending_schedules()
+        due = [job for job in self.schedule.jobs if getattr(job, "trade", None) and job.trade["week_number"] == 1]
+
+        warmup_elapsed = None
+        if self.args.warmup:
+            started = time.perf_counter()
+            self.trade.warm_up_slot(slot_time.strftime("%H:%M"))
+            warmup_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for job in due:
+            job.run()
+        elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.trade.reconcile_orders()
+        reconcile_elapsed = time.perf_counter() - started
+
+        with models.engine.connect() as conn:
+            statuses = dict(conn.execute(
+                select(models.InvestmentSchedule.status, func.count())
+                .where(models.InvestmentSchedule.week_number == 1)
+                .group_by(models.InvestmentSchedule.status)
+            ).all())
+        result = {
+            "due_schedules": len(due),
+            "elapsed_s": round(elapsed, 3),
+            "orders_per_s": round(len(due) / elapsed, 2) if elapsed else None,
+            "reconcile_s": round(reconcile_elapsed, 3),
+            "warmup_s": round(warmup_elapsed, 3) if warmup_elapsed is not None else None,
+            "statuses": statuses
+        }
+        print(f"slot due={len(due)}: {result['elapsed_s']} s ({result['orders_per_s']} orders/s), "
+              f"reconciled in {result['reconcile_s']} s {statuses}")
+        return result
+
+    def _measure(self, func):
+        """Median latency over --repeat runs, then peak traced allocation of one more run."""
+        samples = []
+        for _ in range(self.args.repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result, {"median_ms": _latency_stats(samples)["median_ms"], "peak_kib": round(peak / 1024, 1)}
+
+    def bench_read_models(self):
+        """Compares the row-based read models with the ORM loaders they replaced."""
+        import orm_baseline
+        import read_models
+        results = []
+        for schedules in self.args.read_schedules:
+            self.reset()
+            n_etfs = min(self.args.symbols, 20)
+            cycles_per_etf = max(1, schedules // 5 // n_etfs)
+            seeded = self.seed(n_etfs, cycles_per_etf, self.tomorrow())
+            etf_name = symbol_names(1)[0]
+
+            def listing(load_etfs, load_cycles):
+                etfs = load_etfs()
+                return list(self.app_module._iter_strategies(etfs, load_cycles(), {}, {}, {}, {}))
+
+            def orm_etfs():
+                session = self.models.Session()
+                try:
+                    return session.query(self.models.ETF).all()
+                finally:
+                    session.close()
+
+            orm_all, orm_all_stats = self._measure(lambda: listing(orm_etfs, orm_baseline.load_all_cycles))
+            rows_all, rows_all_stats = self._measure(lambda: listing(read_models.load_etfs, read_models.load_cycles_by_etf))
+            orm_one, orm_one_stats = self._measure(lambda: orm_baseline.load_etf_cycles(etf_name))
+            rows_one, rows_one_stats = self._measure(lambda: read_models.load_etf_detail(etf_name))
+            assert orm_all == rows_all and orm_one == rows_one, "read models and ORM path disagree"
+
+            results.append({
+                "schedules": seeded,
+                "all_etf_details": {"orm": orm_all_stats, "read_models": rows_all_stats},
+                "etf_details": {"orm": orm_one_stats, "read_models": rows_one_stats}
+            })
+            for name in ("all_etf_details", "etf_details"):
+                orm, rows = results[-1][name]["orm"], results[-1][name]["read_models"]
+                print(f"read models {name} schedules={seeded}: {orm['median_ms']} -> {rows['median_ms']} ms, "
+                      f"peak {orm['peak_kib']} -> {rows['peak_kib']} KiB")
+        return results
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def index(rows, keys):
+        return {tuple(row[k] for k in keys): row for row in rows}
+
+    print(f"\nComparison against {baseline_path} (median, negative is faster):")
+    for section, keys in (("all_etf_details", ("etfs", "cycles_per_etf")), ("reload_pending_schedules", ("pending",))):
+        old_rows = index(baseline.get(section, []), keys)
+        for key, row in index(current.get(section, []), keys).items():
+            if key in old_rows and old_rows[key]["median_ms"]:
+                change = (row["median_ms"] - old_rows[key]["median_ms"]) / old_rows[key]["median_ms"] * 100
+                print(f"  {section} {dict(zip(keys, key))}: {old_rows[key]['median_ms']} -> {row['median_ms']} ms ({change:+.1f}%)")
+    old_slot, new_slot = baseline.get("slot"), current.get("slot")
+    if old_slot and new_slot and old_slot.get("orders_per_s"):
+        change = (new_slot["orders_per_s"] - old_slot["orders_per_s"]) / old_slot["orders_per_s"] * 100
+        print(f"  slot orders/s: {old_slot['orders_per_s']} -> {new_slot['orders_per_s']} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmark suite")
+    parser.add_argument("--etfs", nargs="+", type=int, default=[5, 20, 50])
+    parser.add_argument("--cycles", nargs="+", type=int, default=[1, 4], help="Cycles per ETF")
+    parser.add_argument("--pending", nargs="+", type=int, default=[50, 250])
+    parser.add_argument("--slot-size", type=int, default=200)
+    parser.add_argument("--read-schedules", nargs="+", type=int, default=[1000, 10000],
+                        help="Schedule counts for the read-model comparison")
+    parser.add_argument("--symbols", type=int, default=200, help="Securities known to the fake broker")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake broker latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--broker-mode", choices=["live", "paper"], default="live",
+                        help="'live' sends orders to the fake Dhan server, 'paper' fills them in-process")
+    parser.add_argument("--warmup", action="store_true", help="Run the pre-trade warm-up before the slot benchmark")
+    parser.add_argument("--db-url", help="Database to use instead of a temporary SQLite file (it is wiped)")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["all_etf_details", "reload", "slot", "read_models"])
+    parser.add_argument("--out", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    args.symbols = max(args.symbols, max(args.etfs))
+
+    server = FakeDhanServer(symbol_names(args.symbols), latency=args.latency, error_rate=args.error_rate).start()
+    tmpdir = tempfile.mkdtemp(prefix="etf-bench-")
+    db_url = args.db_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    _configure_environment(server, db_url, args.broker_mode)
+
+    try:
+        bench = Bench(args)
+        results = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "git_commit": _git_commit(),
+                "python": platform.python_version(),
+                "db": "sqlite" if not args.db_url else args.db_url.split(":", 1)[0],
+                "broker_mode": args.broker_mode,
+                "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "db_url")}
+            }
+        }
+        if "all_etf_details" not in args.skip:
+            results["all_etf_details"] = bench.bench_all_etf_details()
+        if "reload" not in args.skip:
+            results["reload_pending_schedules"] = bench.bench_reload_pending()
+        if "slot" not in args.skip:
+            results["slot"] = bench.bench_slot()
+        if "read_models" not in args.skip:
+            results["read_models"] = bench.bench_read_models()
+        results["meta"]["broker_requests"] = server.state.request_count
+    finally:
+        server.stop()
+
+    out = args.out or os.path.join(BACKEND_DIR, "benchmarks", "results", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
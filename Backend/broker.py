@@ -0,0 +1,272 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from dhanhq import dhanhq
+from config import (
+    get_logger, IST, CLIENT_ID, ACCESS_TOKEN, DHAN_API_URL, BROKER_MODE, BROKER_MAX_WORKERS,
+    BROKER_CONNECT_TIMEOUT, BROKER_READ_TIMEOUT, PAPER_STARTING_FUNDS, PAPER_SLIPPAGE_BPS, PAPER_DB_PATH, PAPER_LTP_TTL
+)
+from resilience import ResilientAdapter
+
+logger = get_logger(__name__)
+
+class PaperBroker:
+    """
+    In-process stand-in for the dhanhq client used for dry runs and load tests.
+    Market orders fill immediately at the cached LTP plus slippage; funds,
+    holdings and orders live in SQLite (":memory:" by default, or a file to
+    keep state across restarts). Responses mirror dhanhq's
+    {"status", "remarks", "data"} shape so callers need no changes.
+    """
+
+    BUY = "BUY"
+    SELL = "SELL"
+    NSE = "NSE_EQ"
+    CNC = "CNC"
+    MARKET = "MARKET"
+    LIMIT = "LIMIT"
+
+    def __init__(self, price_source, starting_funds, slippage_bps=0.0, db_path=":memory:", ltp_ttl=5.0):
+        """
+        price_source takes a list of security ids and returns a dict of
+        security_id -> ltp; prices are cached for ltp_ttl seconds.
+        """
+        self.price_source = price_source
+        self.slippage = slippage_bps / 10000.0
+        self.ltp_ttl = ltp_ttl
+        self._prices = {}
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS funds (id INTEGER PRIMARY KEY CHECK (id = 1), available REAL NOT NULL)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS holdings (security_id INTEGER PRIMARY KEY, quantity INTEGER NOT NULL, avg_cost REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS orders (order_id INTEGER PRIMARY KEY AUTOINCREMENT, security_id INTEGER NOT NULL, "
+                "transaction_type TEXT NOT NULL, quantity INTEGER NOT NULL, price REAL, status TEXT NOT NULL, "
+                "remarks TEXT, created_at TEXT NOT NULL, correlation_id TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(orders)")}
+            if "correlation_id" not in columns:
+                self._db.execute("ALTER TABLE orders ADD COLUMN correlation_id TEXT")
+            self._db.execute("INSERT OR IGNORE INTO funds (id, available) VALUES (1, ?)", (float(starting_funds),))
+        logger.info(f"🧪 Paper trading enabled (db={db_path}, slippage={slippage_bps} bps)")
+
+    @staticmethod
+    def _success(data):
+        return {"status": "success", "remarks": "", "data": data}
+
+    @staticmethod
+    def _failure(message):
+        return {"status": "failure", "remarks": {"error_message": message}, "data": ""}
+
+    def get_ltp(self, security_id):
+        """Cached LTP for one security, refreshed from price_source once its entry expires."""
+        if isinstance(security_id, tuple):
+            security_id = security_id[0]
+        security_id = int(security_id)
+        now = time.monotonic()
+        cached = self._prices.get(security_id)
+        if cached and now < cached[1]:
+            return cached[0]
+        prices = self.price_source([security_id]) or {}
+        if security_id in prices:
+            self._prices[security_id] = (prices[security_id], now + self.ltp_ttl)
+            return prices[security_id]
+        return cached[0] if cached else None
+
+    def prime_prices(self, security_ids, hold_seconds=0.0):
+        """
+        Loads LTPs for many securities with one price_source call. The prices
+        stay cached for hold_seconds on top of ltp_ttl, so prices primed ahead
+        of a trading slot are still used when the slot fires.
+        """
+        prices = self.price_source(list(security_ids)) or {}
+        expires_at = time.monotonic() + self.ltp_ttl + hold_seconds
+        for security_id, ltp in prices.items():
+            self._prices[int(security_id)] = (ltp, expires_at)
+        return prices
+
+    def place_order(self, security_id, exchange_segment, transaction_type, quantity, order_type,
+                    product_type, price=0, tag=None, **kwargs):
+        security_id = int(security_id)
+        tag = tag or None
+        quantity = int(quantity)
+        created_at = datetime.now(IST).isoformat()
+        if order_type != self.MARKET:
+            return self._failure("Paper broker only supports MARKET orders")
+        if quantity <= 0:
+            return self._failure("Quantity must be positive")
+
+        ltp = self.get_ltp(security_id)
+        with self._lock, self._db:
+            if not ltp:
+                self._db.execute(
+                    "INSERT INTO orders (security_id, transaction_type, quantity, price, status, remarks, created_at, correlation_id) VALUES (?, ?, ?, NULL, 'REJECTED', ?, ?, ?)",
+                    (security_id, transaction_type, quantity, "No LTP available", created_at, tag)
+                )
+                return self._failure("No LTP available")
+
+            sign = 1 if transaction_type == self.BUY else -1
+            fill_price = round(ltp * (1 + sign * self.slippage), 2)
+            value = fill_price * quantity
+            available = self._db.execute("SELECT available FROM funds WHERE id = 1").fetchone()[0]
+            row = self._db.execute("SELECT quantity, avg_cost FROM holdings WHERE security_id = ?", (security_id,)).fetchone()
+            held_qty, avg_cost = row if row else (0, 0.0)
+
+            if transaction_type == self.BUY and value > available:
+                reason = f"Insufficient funds: need ₹{value:.2f}, available ₹{available:.2f}"
+            elif transaction_type == self.SELL and quantity > held_qty:
+                reason = f"Insufficient holdings: have {held_qty}, selling {quantity}"
+            else:
+                reason = None
+            if reason:
+                self._db.execute(
+                    "INSERT INTO orders (security_id, transaction_type, quantity, price, status, remarks, created_at, correlation_id) VALUES (?, ?, ?, ?, 'REJECTED', ?, ?, ?)",
+                    (security_id, transaction_type, quantity, fill_price, reason, created_at, tag)
+                )
+                return self._failure(reason)
+
+            if transaction_type == self.BUY:
+                new_qty = held_qty + quantity
+                new_avg = (held_qty * avg_cost + value) / new_qty
+            else:
+                new_qty = held_qty - quantity
+                new_avg = avg_cost if new_qty else 0.0
+            self._db.execute("UPDATE funds SET available = available - ? WHERE id = 1", (sign * value,))
+            self._db.execute(
+                "INSERT INTO holdings (security_id, quantity, avg_cost) VALUES (?, ?, ?) "
+                "ON CONFLICT(security_id) DO UPDATE SET quantity = excluded.quantity, avg_cost = excluded.avg_cost",
+                (security_id, new_qty, new_avg)
+            )
+            cursor = self._db.execute(
+                "INSERT INTO orders (security_id, transaction_type, quantity, price, status, remarks, created_at, correlation_id) VALUES (?, ?, ?, ?, 'TRADED', NULL, ?, ?)",
+                (security_id, transaction_type, quantity, fill_price, created_at, tag)
+            )
+            order_id = str(cursor.lastrowid)
+        logger.debug(f"🧪 Paper {transaction_type} {quantity} x {security_id} @ ₹{fill_price} (order {order_id})")
+        return self._success({"orderId": order_id, "orderStatus": "TRADED"})
+
+    def get_holdings(self):
+        with self._lock:
+            rows = self._db.execute("SELECT security_id, quantity, avg_cost FROM holdings WHERE quantity > 0").fetchall()
+        holdings = []
+        for security_id, quantity, avg_cost in rows:
+            cached = self._prices.get(security_id)
+            holdings.append({
+                "exchange": "NSE",
+                "tradingSymbol": str(security_id),
+                "securityId": str(security_id),
+                "totalQty": quantity,
+                "availableQty": quantity,
+                "avgCostPrice": round(avg_cost, 4),
+                "lastTradedPrice": cached[0] if cached else avg_cost
+            })
+        return self._success(holdings)
+
+    def get_fund_limits(self):
+        with self._lock:
+            available = self._db.execute("SELECT available FROM funds WHERE id = 1").fetchone()[0]
+        return self._success({
+            "availabelBalance": available,
+            "availableBalance": available,
+            "withdrawableBalance": available,
+            "sodLimit": available
+        })
+
+    def _orders(self, where="", params=()):
+        with self._lock:
+            return self._db.execute(
+                "SELECT order_id, security_id, transaction_type, quantity, price, status, remarks, created_at, correlation_id "
+                f"FROM orders {where} ORDER BY order_id", params
+            ).fetchall()
+
+    def _order(self, order_id, security_id, transaction_type, quantity, price, status, remarks, created_at, correlation_id):
+        return {
+            "orderId": str(order_id),
+            "correlationId": correlation_id or "",
+            "orderStatus": status,
+            "transactionType": transaction_type,
+            "exchangeSegment": self.NSE,
+            "productType": self.CNC,
+            "orderType": self.MARKET,
+            "securityId": str(security_id),
+            "quantity": quantity,
+            "filledQty": quantity if status == "TRADED" else 0,
+            "averageTradedPrice": price if status == "TRADED" else 0.0,
+            "omsErrorDescription": remarks or "",
+            "createTime": created_at
+        }
+
+    def get_order_list(self):
+        return self._success([self._order(*row) for row in self._orders()])
+
+    def get_order_by_correlationID(self, correlationID):
+        rows = self._orders("WHERE correlation_id = ?", (correlationID,))
+        if not rows:
+            failure = self._failure(f"No order with correlation id {correlationID}")
+            failure["remarks"]["error_code"] = "DH-907"
+            return failure
+        return self._success(self._order(*rows[-1]))
+
+    def get_order_by_id(self, order_id):
+        rows = self._orders("WHERE order_id = ?", (order_id,))
+        if not rows:
+            failure = self._failure(f"No order with id {order_id}")
+            failure["remarks"]["error_code"] = "DH-907"
+            return failure
+        return self._success(self._order(*rows[0]))
+
+    @staticmethod
+    def _trades(rows):
+        return [
+            {
+                "orderId": str(oid),
+                "securityId": str(security_id),
+                "transactionType": transaction_type,
+                "tradedQuantity": quantity,
+                "tradedPrice": price,
+                "createTime": created_at
+            }
+            for oid, security_id, transaction_type, quantity, price, status, remarks, created_at, _ in rows
+            if status == "TRADED"
+        ]
+
+    def get_trade_book(self, order_id=None):
+        if order_id is None:
+            return self._success(self._trades(self._orders()))
+        return self._success(self._trades(self._orders("WHERE order_id = ?", (order_id,))))
+
+    def get_trade_history(self, from_date, to_date, page_number=0):
+        # Everything fits on the first page
+        if page_number:
+            return self._success([])
+        return self._success(self._trades(self._orders("WHERE substr(created_at, 1, 10) BETWEEN ? AND ?", (from_date, to_date))))
+
+def create_broker(price_source):
+    """
+    Returns the broker client selected by BROKER_MODE: the live dhanhq client,
+    or a PaperBroker that prices fills through price_source.
+    """
+    if BROKER_MODE == "paper":
+        return PaperBroker(
+            price_source,
+            starting_funds=PAPER_STARTING_FUNDS,
+            slippage_bps=PAPER_SLIPPAGE_BPS,
+            db_path=PAPER_DB_PATH,
+            ltp_ttl=PAPER_LTP_TTL
+        )
+    if BROKER_MODE != "live":
+        raise RuntimeError(f"Unknown BROKER_MODE '{BROKER_MODE}', expected 'live' or 'paper'")
+    client = dhanhq(CLIENT_ID, ACCESS_TOKEN)
+    if "DHAN_API_URL" in os.environ:
+        client.base_url = f"{DHAN_API_URL}/v2"
+    # dhanhq waits up to 60s per call by default; route its session through the
+    # circuit breakers and bulkheads and bound every call
+    client.timeout = (BROKER_CONNECT_TIMEOUT, BROKER_READ_TIMEOUT)
+    for prefix in ("https://", "http://"):
+        client.session.mount(prefix, ResilientAdapter(pool_connections=4, pool_maxsize=BROKER_MAX_WORKERS))
+    return client
@@ -1,5 +1,10 @@
 import os
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 
@@ -13,15 +18,149 @@ DB_URL = os.environ.get("DB_URL")
 if not CLIENT_ID or not ACCESS_TOKEN or not DB_URL:
     raise RuntimeError("CLIENT_ID, ACCESS_TOKEN, and DB_URL must be set in the environment or .env file")
 
+# Optional read replica for GET endpoints, analytics and exports; writes and the
+# trade path always use DB_URL. For a local test, point DB_READ_URL at a
+# copy of a SQLite DB_URL file (or a second Postgres database). Reads go to
+# the primary for READ_YOUR_WRITES_SECONDS after an API mutation
+DB_READ_URL = os.environ.get("DB_READ_URL")
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Dhan endpoints; override to point at a local stand-in (see benchmarks/fake_dhan.py)
+DHAN_API_URL = os.environ.get("DHAN_API_URL", "https://api.dhan.co").rstrip("/")
+DHAN_SCRIP_MASTER_URL = os.environ.get("DHAN_SCRIP_MASTER_URL", "https://images.dhan.co/api-data/api-scrip-master-detailed.csv")
+
+# Broker mode: "live" places real orders through Dhan, "paper" fills them in-process
+BROKER_MODE = os.environ.get("BROKER_MODE", "live").lower()
+PAPER_STARTING_FUNDS = float(os.environ.get("PAPER_STARTING_FUNDS", "1000000"))
+PAPER_SLIPPAGE_BPS = float(os.environ.get("PAPER_SLIPPAGE_BPS", "5"))
+PAPER_DB_PATH = os.environ.get("PAPER_DB_PATH", ":memory:")
+PAPER_LTP_TTL = float(os.environ.get("PAPER_LTP_TTL", "5"))
+
+# Broker fan-out settings: size of the shared executor used for concurrent
+# broker/DB calls, the default per-call deadline in seconds, and the deadline
+# for database loads fanned out alongside broker calls
+BROKER_MAX_WORKERS = int(os.environ.get("BROKER_MAX_WORKERS", "8"))
+BROKER_CALL_TIMEOUT = float(os.environ.get("BROKER_CALL_TIMEOUT", "5"))
+DB_CALL_TIMEOUT = float(os.environ.get("DB_CALL_TIMEOUT", "30"))
+
+# Broker resilience. Every Dhan request gets connect/read timeouts in seconds.
+# Each broker endpoint has a circuit breaker: over its last BREAKER_WINDOW calls
+# (once at least BREAKER_MIN_CALLS were made) it opens when the failure rate
+# reaches BREAKER_FAILURE_RATE or the share of calls slower than
+# BREAKER_SLOW_CALL_SECONDS reaches BREAKER_SLOW_CALL_RATE, rejects calls for
+# BREAKER_OPEN_SECONDS, then lets BREAKER_HALF_OPEN_PROBES probe calls through.
+# Bulkheads cap concurrent broker requests for trade jobs and for everything
+# else (dashboards, analytics) separately; a call waits at most
+# BULKHEAD_WAIT_SECONDS for a slot before it is rejected
+BROKER_CONNECT_TIMEOUT = float(os.environ.get("BROKER_CONNECT_TIMEOUT", "3.05"))
+BROKER_READ_TIMEOUT = float(os.environ.get("BROKER_READ_TIMEOUT", "10"))
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "3"))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.environ.get("BREAKER_HALF_OPEN_PROBES", "2"))
+BULKHEAD_TRADING_LIMIT = int(os.environ.get("BULKHEAD_TRADING_LIMIT", "4"))
+BULKHEAD_DEFAULT_LIMIT = int(os.environ.get("BULKHEAD_DEFAULT_LIMIT", str(BROKER_MAX_WORKERS)))
+BULKHEAD_WAIT_SECONDS = float(os.environ.get("BULKHEAD_WAIT_SECONDS", "0.5"))
+# Portfolio endpoints fall back to the last good holdings and LTPs for up to
+# STALE_DATA_MAX_AGE seconds while the broker is unavailable
+STALE_DATA_MAX_AGE = float(os.environ.get("STALE_DATA_MAX_AGE", "900"))
+# Portfolio analytics reuses its LTP snapshot, and the result computed from it,
+# for up to ANALYTICS_LTP_TTL seconds
+ANALYTICS_LTP_TTL = float(os.environ.get("ANALYTICS_LTP_TTL", "15"))
+# Trade jobs that could not reach the broker are marked 'retry_later' and run
+# again every TRADE_RETRY_SECONDS, at most TRADE_RETRY_ATTEMPTS times that day
+TRADE_RETRY_SECONDS = int(os.environ.get("TRADE_RETRY_SECONDS", "60"))
+TRADE_RETRY_ATTEMPTS = int(os.environ.get("TRADE_RETRY_ATTEMPTS", "3"))
+
+# Pre-trade warm-up: seconds before each execution slot at which due schedules
+# are loaded and connections, balance and prices are primed (0 disables).
+# The primed balance is reused by trades for up to BALANCE_CACHE_TTL seconds
+WARMUP_SECONDS = int(os.environ.get("WARMUP_SECONDS", "30"))
+BALANCE_CACHE_TTL = float(os.environ.get("BALANCE_CACHE_TTL", "120"))
+
+# Seconds between order-book reconciliation passes for placed orders
+RECONCILE_INTERVAL = int(os.environ.get("RECONCILE_INTERVAL", "30"))
+
+# JSON backend for API responses: "orjson" (falls back to "stdlib" if not installed)
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson").lower()
+# Target size in bytes of each chunk written by streamed JSON responses
+JSON_STREAM_CHUNK_SIZE = int(os.environ.get("JSON_STREAM_CHUNK_SIZE", "65536"))
+
+# Rows fetched per server-side cursor batch by the streaming exports (one CSV
+# chunk or Parquet row group each)
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "5000"))
+
+# Profiling: captures are written as collapsed stacks to a bounded ring in PROFILE_DIR.
+# PROFILE_ALLOW_HEADER lets any request opt in with an "X-Profile: 1" header;
+# scheduled jobs slower than JOB_PROFILE_THRESHOLD seconds are kept (0 disables)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_ALLOW_HEADER = os.environ.get("PROFILE_ALLOW_HEADER", "false").lower() in ("1", "true", "yes")
+JOB_PROFILE_THRESHOLD = float(os.environ.get("JOB_PROFILE_THRESHOLD", "0"))
+
 # Set up IST timezone
 IST = timezone(timedelta(hours=5, minutes=30))
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
\ No newline at end of file
+# Records are handed to a queue and written by a background listener thread, so
+# callers (including the order path) never block on stream I/O. Messages are
+# formatted lazily in the listener; structured fields passed with
+# extra=kv(...) are appended as key=value pairs.
+# LOG_LEVEL sets the root level and LOG_LEVELS per-module overrides,
+# e.g. LOG_LEVELS="trade=DEBUG,utils=WARNING".
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(f"{key}={value!r}" if isinstance(value, str) and " " in value else f"{key}={value}"
+                                      for key, value in fields.items())
+        return message
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves the process, so skip QueueHandler's eager
+        # formatting and let the listener thread do it
+        return record
+
+def kv(**fields):
+    """Structured fields for a log call: logger.info("msg", extra=kv(a=1))."""
+    return {"fields": fields}
+
+_throttle_last = {}
+_throttle_lock = threading.Lock()
+
+def log_throttled(log, level, key, interval, msg, *args, **kwargs):
+    """Logs at most once per `interval` seconds for a given key."""
+    if not log.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    with _throttle_lock:
+        if now - _throttle_last.get(key, float("-inf")) < interval:
+            return
+        _throttle_last[key] = now
+    log.log(level, msg, *args, **kwargs)
+
+def get_logger(name):
+    return logging.getLogger("app" if name == "__main__" else name)
+
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(KeyValueFormatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, _stream_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.basicConfig(level=LOG_LEVEL, handlers=[_InProcessQueueHandler(_log_queue)])
+for _entry in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+    _name, _, _level = _entry.partition("=")
+    logging.getLogger(_name.strip()).setLevel(_level.strip().upper())
+
+logger = get_logger(__name__)
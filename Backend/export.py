@@ -0,0 +1,249 @@
+"""
+Streaming exports of execution history and investment schedules, joined with
+their cycle and ETF, for tax reporting and reconciliation.
+
+Rows are read from a server-side cursor EXPORT_CHUNK_SIZE at a time and
+written out chunk by chunk, as CSV text or as one Parquet row group per chunk,
+so memory use does not grow with the size of the export. Parquet needs
+pyarrow, an optional dependency left out of requirements.txt; without it only
+CSV is available.
+
+Used by the /api/export/<kind> endpoint and from the command line:
+    python export.py executions --from 2024-04-01 --to 2025-03-31 --out fy25.csv
+    python export.py schedules --format parquet --etf NIFTYBEES GOLDBEES --out schedules.parquet
+"""
+import argparse
+import csv
+import io
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.types import Date, DateTime, Float, Integer, Time
+from config import get_logger, EXPORT_CHUNK_SIZE
+from models import read_bind, ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule
+from read_models import as_float
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET_AVAILABLE = pa is not None
+
+logger = get_logger(__name__)
+
+EXPORT_KINDS = ("executions", "schedules")
+EXPORT_FORMATS = ("csv", "parquet")
+
+def _parse_date(value, name):
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid {name} date '{value}', must be YYYY-MM-DD")
+
+def build_query(kind, date_from=None, date_to=None, etfs=None):
+    """
+    Returns the select for an export kind. Dates are inclusive and apply to
+    the execution timestamp for executions and the execution date for
+    schedules; etfs limits the export to those ETF names.
+    """
+    date_from = _parse_date(date_from, "from")
+    date_to = _parse_date(date_to, "to")
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("'from' date must not be after 'to' date")
+
+    if kind == "executions":
+        query = (
+            select(
+                ExecutionHistory.execution_id,
+                ExecutionHistory.execution_timestamp,
+                ExecutionHistory.status,
+                as_float(ExecutionHistory.amount),
+                ExecutionHistory.error_message,
+                ExecutionHistory.schedule_id,
+                InvestmentSchedule.week_number,
+                InvestmentSchedule.execution_date,
+                InvestmentSchedule.quantity,
+                InvestmentSchedule.order_id,
+                InvestmentCycle.cycle_id,
+                ETF.etf_name
+            )
+            .join(InvestmentSchedule, ExecutionHistory.schedule_id == InvestmentSchedule.schedule_id)
+            .join(InvestmentCycle, InvestmentSchedule.cycle_id == InvestmentCycle.cycle_id)
+            .join(ETF, InvestmentCycle.etf_id == ETF.etf_id)
+            .order_by(ExecutionHistory.execution_id)
+        )
+        if date_from:
+            query = query.where(ExecutionHistory.execution_timestamp >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            query = query.where(ExecutionHistory.execution_timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    elif kind == "schedules":
+        query = (
+            select(
+                InvestmentSchedule.schedule_id,
+                InvestmentSchedule.execution_date,
+                InvestmentSchedule.execution_time,
+                InvestmentSchedule.week_number,
+                as_float(InvestmentSchedule.amount),
+                InvestmentSchedule.quantity,
+                InvestmentSchedule.status,
+                InvestmentSchedule.order_id,
+                InvestmentCycle.cycle_id,
+                as_float(InvestmentCycle.total_amount, "cycle_total_amount"),
+                InvestmentCycle.start_date.label("cycle_start_date"),
+                InvestmentCycle.status.label("cycle_status"),
+                ETF.etf_name
+            )
+            .join(InvestmentCycle, InvestmentSchedule.cycle_id == InvestmentCycle.cycle_id)
+            .join(ETF, InvestmentCycle.etf_id == ETF.etf_id)
+            .order_by(InvestmentSchedule.schedule_id)
+        )
+        if date_from:
+            query = query.where(InvestmentSchedule.execution_date >= date_from)
+        if date_to:
+            query = query.where(InvestmentSchedule.execution_date <= date_to)
+    else:
+        raise ValueError(f"Unknown export '{kind}', expected one of: {', '.join(EXPORT_KINDS)}")
+
+    if etfs:
+        query = query.where(ETF.etf_name.in_(list(etfs)))
+    return query
+
+def iter_row_chunks(query, chunk_size=EXPORT_CHUNK_SIZE, bind=None):
+    """
+    Yields lists of at most chunk_size row tuples, read through a server-side
+    cursor where the driver supports one (psycopg2 does). Reads go to the
+    read replica unless another bind is given.
+    """
+    with (bind or read_bind()).connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+def iter_csv(query, chunk_size=EXPORT_CHUNK_SIZE, bind=None):
+    """Yields the export as CSV text, one header chunk and then one chunk per row chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in query.selected_columns])
+    yield buffer.getvalue()
+    for rows in iter_row_chunks(query, chunk_size, bind):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+def _arrow_schema(query):
+    fields = []
+    for column in query.selected_columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        elif isinstance(column.type, Time):
+            arrow_type = pa.time64("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.key, arrow_type))
+    return pa.schema(fields)
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out whatever was written since the last drain."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def _write_row_groups(writer, schema, query, chunk_size, bind):
+    for rows in iter_row_chunks(query, chunk_size, bind):
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+        ))
+        yield len(rows)
+
+def iter_parquet(query, chunk_size=EXPORT_CHUNK_SIZE, bind=None):
+    """Yields the export as Parquet bytes, one row group per row chunk."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = _arrow_schema(query)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for _ in _write_row_groups(writer, schema, query, chunk_size, bind):
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def write_export(kind, out, fmt="csv", date_from=None, date_to=None, etfs=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Writes an export to a path (or a text stream for CSV). Returns the row count."""
+    query = build_query(kind, date_from, date_to, etfs)
+    if fmt == "parquet":
+        if pa is None:
+            raise RuntimeError("Parquet export requires pyarrow")
+        schema = _arrow_schema(query)
+        with pq.ParquetWriter(out, schema) as writer:
+            return sum(_write_row_groups(writer, schema, query, chunk_size, None))
+    if fmt != "csv":
+        raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}")
+
+    rows = 0
+    handle = open(out, "w", newline="") if isinstance(out, str) else out
+    try:
+        writer = csv.writer(handle)
+        writer.writerow([column.key for column in query.selected_columns])
+        for chunk in iter_row_chunks(query, chunk_size):
+            writer.writerows(chunk)
+            rows += len(chunk)
+    finally:
+        if handle is not out:
+            handle.close()
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export executions or schedules as CSV or Parquet")
+    parser.add_argument("kind", choices=EXPORT_KINDS)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--from", dest="date_from", help="First date to include, YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="Last date to include, YYYY-MM-DD")
+    parser.add_argument("--etf", nargs="+", dest="etfs", help="Only export these ETFs")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--out", help="Output file (CSV goes to stdout if omitted)")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not args.out:
+        parser.error("--out is required for Parquet exports")
+    try:
+        rows = write_export(
+            args.kind, args.out or sys.stdout, args.format, args.date_from, args.date_to, args.etfs, args.chunk_size
+        )
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+    logger.info(f"💾 Exported {rows} {args.kind} rows{f' to {args.out}' if args.out else ''}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
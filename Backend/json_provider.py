@@ -0,0 +1,99 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+import json
+import numpy as np
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from config import get_logger, JSON_BACKEND, JSON_STREAM_CHUNK_SIZE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = get_logger(__name__)
+
+# Custom JSON Provider to handle NumPy types
+class CustomJSONProvider(DefaultJSONProvider):
+    def default(self, obj):
+        if isinstance(obj, np.integer):
+            return int(obj)
+        if isinstance(obj, np.floating):
+            return float(obj)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        return super().default(obj)
+
+def _orjson_default(obj):
+    # orjson handles NumPy arrays/scalars and datetimes natively; only the
+    # leftovers reach this hook
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson with native NumPy and datetime support."""
+
+    option = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=_orjson_default, option=self.option)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype="application/json")
+
+def _stdlib_default(obj):
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def make_json_provider(app):
+    """Returns the JSON provider selected by JSON_BACKEND."""
+    if JSON_BACKEND == "orjson":
+        if orjson is not None:
+            logger.info("🧾 Using orjson JSON backend")
+            return OrjsonProvider(app)
+        logger.warning("⚠️ JSON_BACKEND=orjson but orjson is not installed, falling back to stdlib")
+    return CustomJSONProvider(app)
+
+def dumps_bytes(obj):
+    """Serializes a single value with the fastest available backend."""
+    if orjson is not None and JSON_BACKEND == "orjson":
+        return orjson.dumps(obj, default=_orjson_default, option=OrjsonProvider.option)
+    return json.dumps(obj, default=_stdlib_default, separators=(",", ":")).encode()
+
+def stream_json_array(items, chunk_size=JSON_STREAM_CHUNK_SIZE):
+    """
+    Serializes an iterable as a JSON array one item at a time, yielding chunks
+    of roughly chunk_size bytes so the full payload never sits in memory.
+    """
+    buffer = bytearray(b"[")
+    first = True
+    for item in items:
+        if not first:
+            buffer += b","
+        buffer += dumps_bytes(item)
+        first = False
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
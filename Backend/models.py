@@ -1,13 +1,39 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, Date, Time, DateTime, Text
+from sqlalchemy import create_engine, inspect, text, Column, Integer, Float, String, Date, Time, DateTime, Text
 from sqlalchemy.orm import declarative_base, sessionmaker
+import time
 from datetime import datetime
-from config import IST, DB_URL
+from config import IST, DB_URL, DB_READ_URL, READ_YOUR_WRITES_SECONDS
 
 # Initialize SQLAlchemy
 Base = declarative_base()
 engine = create_engine(DB_URL, echo=False)
 Session = sessionmaker(bind=engine)
 
+# Read-only engine for dashboard and analytics reads; the primary unless
+# DB_READ_URL points at a replica (or a snapshot copy when testing)
+read_engine = create_engine(DB_READ_URL, echo=False) if DB_READ_URL and DB_READ_URL != DB_URL else engine
+ReadSession = sessionmaker(bind=read_engine) if read_engine is not engine else Session
+
+_primary_pinned_until = 0.0
+
+def pin_reads_to_primary(seconds=READ_YOUR_WRITES_SECONDS):
+    """Routes reads to the primary for a while after a write, so it is visible even with replica lag."""
+    global _primary_pinned_until
+    _primary_pinned_until = max(_primary_pinned_until, time.monotonic() + seconds)
+
+def reads_pinned_to_primary():
+    return time.monotonic() < _primary_pinned_until
+
+def read_session_factory(force_primary=False):
+    """Session factory for a read: the replica, unless forced or pinned to the primary."""
+    if read_engine is engine or force_primary or reads_pinned_to_primary():
+        return Session
+    return ReadSession
+
+def read_bind(force_primary=False):
+    """Engine for a Core read outside a session, chosen like read_session_factory."""
+    return engine if read_session_factory(force_primary) is Session else read_engine
+
 # Define Database Models
 class ETF(Base):
     __tablename__ = 'etfs'
@@ -36,6 +62,7 @@ class InvestmentSchedule(Base):
     amount = Column(Float(15, 2), nullable=False)
     quantity = Column(Integer, default=0)  # New column to store executed quantity
     status = Column(String(20), nullable=False)
+    order_id = Column(String(50), index=True)  # Broker order id, set once the order is placed
     created_at = Column(DateTime, default=lambda: datetime.now(IST))
     updated_at = Column(DateTime, default=lambda: datetime.now(IST))
 
@@ -50,4 +77,24 @@ class ExecutionHistory(Base):
     created_at = Column(DateTime, default=lambda: datetime.now(IST))
 
 # Create tables
-Base.metadata.create_all(engine)
\ No newline at end of file
+Base.metadata.create_all(engine)
+
+# Columns added to existing tables after their first release. create_all()
+# does not alter existing tables, so these are added (nullable, no default)
+# on the primary when missing; other models are not probed
+_ADDED_COLUMNS = (InvestmentSchedule.__table__.c.order_id, )
+
+def _add_missing_columns():
+    inspector = inspect(engine)
+    for column in _ADDED_COLUMNS:
+        table = column.table
+        if column.name in {existing["name"] for existing in inspector.get_columns(table.name)}:
+            continue
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                if column.name in index.columns:
+                    index.create(conn, checkfirst=True)
+
+_add_missing_columns()
\ No newline at end of file
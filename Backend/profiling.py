@@ -0,0 +1,147 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from config import (
+    get_logger, IST, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SAMPLE_INTERVAL, JOB_PROFILE_THRESHOLD
+)
+
+logger = get_logger(__name__)
+
+class _Capture:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+
+class StackSampler:
+    """
+    Samples the stacks of the threads being profiled from one background
+    thread, which only runs while at least one capture is active.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._captures = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        capture = _Capture(thread_id or threading.get_ident())
+        with self._lock:
+            self._captures.add(capture)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return capture
+
+    def stop(self, capture):
+        with self._lock:
+            self._captures.discard(capture)
+        return capture.stacks, time.perf_counter() - capture.started
+
+    def _run(self):
+        while True:
+            with self._lock:
+                captures = list(self._captures)
+                if not captures:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for capture in captures:
+                frame = frames.get(capture.thread_id)
+                if frame is not None:
+                    capture.stacks[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+sampler = StackSampler(PROFILE_SAMPLE_INTERVAL)
+
+# Requests armed through the admin toggle: remaining count and optional endpoint filter
+_armed = {"remaining": 0, "endpoint": None}
+_armed_lock = threading.Lock()
+
+def arm_requests(count, endpoint=None):
+    with _armed_lock:
+        _armed["remaining"] = max(0, int(count))
+        _armed["endpoint"] = endpoint
+    logger.info(f"🔬 Profiling armed for the next {count} request(s){f' to {endpoint}' if endpoint else ''}")
+
+def armed_state():
+    with _armed_lock:
+        return dict(_armed)
+
+def take_armed(endpoint):
+    """Consumes one armed profile if it applies to this endpoint."""
+    if not _armed["remaining"]:
+        return False
+    with _armed_lock:
+        if _armed["remaining"] and _armed["endpoint"] in (None, endpoint):
+            _armed["remaining"] -= 1
+            return True
+    return False
+
+def _safe_tag(tag):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", str(tag)).strip("-")[:80] or "capture"
+
+def write_capture(tag, stacks, elapsed):
+    """
+    Writes a collapsed-stack file (flamegraph.pl / speedscope compatible) and
+    trims PROFILE_DIR to the newest PROFILE_MAX_FILES captures.
+    """
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{datetime.now(IST).strftime('%Y%m%d-%H%M%S-%f')}_{_safe_tag(tag)}_{int(elapsed * 1000)}ms.collapsed"
+        path = os.path.join(PROFILE_DIR, name)
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        captures = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".collapsed"))
+        for old in captures[:-PROFILE_MAX_FILES]:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        logger.info(f"🔬 Saved profile {name} ({sum(stacks.values())} samples)")
+        return name
+    except Exception as e:
+        logger.error(f"❌ Failed to write profile for {tag}: {e}", exc_info=True)
+        return None
+
+def list_captures():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".collapsed")), reverse=True)
+
+def profile_slow_jobs(tag_fn):
+    """
+    Profiles every call of a scheduled job and keeps the capture only if it
+    ran for at least JOB_PROFILE_THRESHOLD seconds. A no-op when the
+    threshold is 0.
+    """
+    def decorator(func):
+        if JOB_PROFILE_THRESHOLD <= 0:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            capture = sampler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stacks, elapsed = sampler.stop(capture)
+                if elapsed >= JOB_PROFILE_THRESHOLD:
+                    logger.warning(f"🐢 Job {func.__name__} took {elapsed:.2f}s, saving profile")
+                    write_capture(tag_fn(*args, **kwargs), stacks, elapsed)
+        return wrapper
+    return decorator
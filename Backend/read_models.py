@@ -0,0 +1,195 @@
+"""
+Row-based read models for the listing endpoints.
+
+The dashboard only needs a handful of columns, so these loaders issue
+column-only selects and work on the returned rows (plain tuples with
+attribute access) instead of hydrating identity-mapped ORM objects. Children
+are attached to their parents in a single pass over rows that arrive already
+ordered.
+"""
+from sqlalchemy import Float, func, select, type_coerce
+from models import Session, ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule
+
+class CycleRecord:
+    """A cycle row plus its schedule rows, in week order."""
+    __slots__ = ("cycle_id", "etf_id", "total_amount", "start_date", "status", "created_at", "updated_at", "schedules")
+
+    def __init__(self, cycle_id, etf_id, total_amount, start_date, status, created_at, updated_at):
+        self.cycle_id = cycle_id
+        self.etf_id = etf_id
+        self.total_amount = total_amount
+        self.start_date = start_date
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.schedules = []
+
+def as_float(column, label=None):
+    # Float(15, 2) columns are declared with asdecimal set; plain floats skip the Decimal round trip
+    return type_coerce(column, Float()).label(label or column.key)
+
+_CYCLE_COLUMNS = (
+    InvestmentCycle.cycle_id,
+    InvestmentCycle.etf_id,
+    as_float(InvestmentCycle.total_amount),
+    InvestmentCycle.start_date,
+    InvestmentCycle.status,
+    InvestmentCycle.created_at,
+    InvestmentCycle.updated_at
+)
+
+def executed_cost_query(*columns):
+    """
+    Select of the given columns for every executed schedule (joined to its
+    cycle) plus "cost": the traded value (quantity x fill price) recorded by
+    reconciliation in the schedule's executed ExecutionHistory row, or the
+    scheduled amount if there is none. This is the single definition of
+    "invested" shared by the dashboard, the ETF detail and analytics.
+    """
+    latest_execution = (
+        select(ExecutionHistory.schedule_id, func.max(ExecutionHistory.execution_id).label("execution_id"))
+        .where(ExecutionHistory.status == "executed")
+        .group_by(ExecutionHistory.schedule_id)
+        .subquery()
+    )
+    return (
+        select(*columns, as_float(func.coalesce(ExecutionHistory.amount, InvestmentSchedule.amount), "cost"))
+        .select_from(InvestmentSchedule)
+        .join(InvestmentCycle, InvestmentCycle.cycle_id == InvestmentSchedule.cycle_id)
+        .outerjoin(latest_execution, latest_execution.c.schedule_id == InvestmentSchedule.schedule_id)
+        .outerjoin(ExecutionHistory, ExecutionHistory.execution_id == latest_execution.c.execution_id)
+        .where(InvestmentSchedule.status == "executed")
+    )
+
+def _invested_by_etf(session, where=None):
+    """etf_id -> total cost of its executed schedules (see executed_cost_query)."""
+    costs = executed_cost_query(InvestmentCycle.etf_id)
+    if where is not None:
+        costs = costs.where(where)
+    costs = costs.subquery()
+    rows = session.execute(select(costs.c.etf_id, func.sum(costs.c.cost)).group_by(costs.c.etf_id)).all()
+    return {etf_id: float(total or 0.0) for etf_id, total in rows}
+
+def _load_cycles(session, where=None):
+    """
+    Returns (cycles in cycle_id order, cycle_id -> CycleRecord) with every
+    cycle's schedules attached, using one select for cycles and one for
+    schedules.
+    """
+    cycle_query = select(*_CYCLE_COLUMNS).order_by(InvestmentCycle.cycle_id)
+    schedule_query = (
+        select(
+            InvestmentSchedule.cycle_id,
+            InvestmentSchedule.schedule_id,
+            InvestmentSchedule.week_number,
+            InvestmentSchedule.execution_date,
+            InvestmentSchedule.execution_time,
+            as_float(InvestmentSchedule.amount),
+            InvestmentSchedule.quantity,
+            InvestmentSchedule.status,
+            InvestmentSchedule.created_at,
+            InvestmentSchedule.updated_at
+        )
+        .order_by(InvestmentSchedule.cycle_id, InvestmentSchedule.week_number)
+    )
+    if where is not None:
+        cycle_query = cycle_query.where(where)
+        schedule_query = schedule_query.join(
+            InvestmentCycle, InvestmentSchedule.cycle_id == InvestmentCycle.cycle_id
+        ).where(where)
+
+    # Core execution on the session's connection skips the ORM result layer
+    conn = session.connection()
+    cycles = [CycleRecord(*row) for row in conn.execute(cycle_query)]
+    by_id = {cycle.cycle_id: cycle for cycle in cycles}
+    current = None
+    for row in conn.execute(schedule_query).all():
+        if current is None or current.cycle_id != row.cycle_id:
+            current = by_id.get(row.cycle_id)
+            if current is None:
+                continue  # Schedule of a cycle created after the cycle select
+        current.schedules.append(row)
+    return cycles, by_id
+
+def load_etfs(session_factory=Session):
+    """All ETFs as (etf_id, etf_name) rows."""
+    session = session_factory()
+    try:
+        return session.execute(select(ETF.etf_id, ETF.etf_name).order_by(ETF.etf_id)).all()
+    finally:
+        session.close()
+
+def load_invested_by_etf(session_factory=Session):
+    """Amount invested per ETF as a dict of etf_id -> traded value of its executed schedules."""
+    session = session_factory()
+    try:
+        return _invested_by_etf(session)
+    finally:
+        session.close()
+
+def load_cycles_by_etf(session_factory=Session):
+    """
+    Loads every cycle and its schedules, grouped by ETF.
+    Returns a dict of etf_id -> list of (cycle, schedules) ordered by cycle_id.
+    """
+    session = session_factory()
+    try:
+        cycles, _ = _load_cycles(session)
+    finally:
+        session.close()
+    cycles_by_etf = {}
+    for cycle in cycles:
+        cycles_by_etf.setdefault(cycle.etf_id, []).append((cycle, cycle.schedules))
+    return cycles_by_etf
+
+def load_etf_detail(etf_name, session_factory=Session):
+    """
+    Loads one ETF with its cycles and schedules as response dicts.
+    Returns (etf_info, cycle_list, total_invested), or None if the ETF does not exist.
+    total_invested is the traded value of the executed schedules (see executed_cost_query).
+    """
+    session = session_factory()
+    try:
+        etf = session.execute(
+            select(ETF.etf_id, ETF.etf_name, ETF.description, ETF.created_at).where(ETF.etf_name == etf_name)
+        ).first()
+        if etf is None:
+            return None
+        cycles, _ = _load_cycles(session, InvestmentCycle.etf_id == etf.etf_id)
+        total_invested = _invested_by_etf(session, InvestmentCycle.etf_id == etf.etf_id).get(etf.etf_id, 0.0)
+    finally:
+        session.close()
+
+    cycle_list = []
+    for cycle in cycles:
+        schedule_list = []
+        for s in cycle.schedules:
+            schedule_list.append({
+                "schedule_id": s.schedule_id,
+                "week_number": s.week_number,
+                "execution_date": s.execution_date.isoformat(),
+                "execution_time": s.execution_time.strftime("%H:%M:%S"),
+                "amount": float(s.amount),
+                "quantity": int(s.quantity),
+                "status": s.status,
+                "created_at": s.created_at.isoformat(),
+                "updated_at": s.updated_at.isoformat()
+            })
+
+        cycle_list.append({
+            "cycle_id": cycle.cycle_id,
+            "total_amount": float(cycle.total_amount),
+            "start_date": cycle.start_date.isoformat(),
+            "status": cycle.status,
+            "created_at": cycle.created_at.isoformat(),
+            "updated_at": cycle.updated_at.isoformat(),
+            "schedules": schedule_list
+        })
+
+    etf_info = {
+        "etf_id": etf.etf_id,
+        "etf_name": etf.etf_name,
+        "description": etf.description,
+        "created_at": etf.created_at.isoformat()
+    }
+    return etf_info, cycle_list, total_invested
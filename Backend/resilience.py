@@ -0,0 +1,297 @@
+"""
+Circuit breakers and bulkheads for broker HTTP calls.
+
+Both are applied in ResilientAdapter, the transport adapter mounted on every
+requests session that talks to Dhan (the marketfeed/scrip master session in
+utils and the dhanhq client's own session), so all broker calls are covered
+without changes at the call sites:
+
+- every request gets the BROKER_CONNECT_TIMEOUT/BROKER_READ_TIMEOUT timeouts
+  unless it passes its own;
+- each endpoint ("GET fundlimit", "GET orders", "POST orders",
+  "POST marketfeed/ltp", ...) has its own CircuitBreaker, which opens on a
+  high failure or slow-call rate and then rejects calls until half-open
+  probes succeed;
+- requests hold a slot in a Bulkhead for their duration: trade jobs (code run
+  inside use_bulkhead("trading")) and everything else get separate limits, so
+  a pile-up of dashboard requests cannot starve order placement.
+
+Rejected calls raise BrokerUnavailable, a requests ConnectionError, so the
+existing error handling around broker calls treats them as failed calls and
+returns at once instead of waiting on the broker.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config import (
+    get_logger, kv, BROKER_CONNECT_TIMEOUT, BROKER_READ_TIMEOUT, BREAKER_WINDOW, BREAKER_MIN_CALLS,
+    BREAKER_FAILURE_RATE, BREAKER_SLOW_CALL_SECONDS, BREAKER_SLOW_CALL_RATE, BREAKER_OPEN_SECONDS,
+    BREAKER_HALF_OPEN_PROBES, BULKHEAD_TRADING_LIMIT, BULKHEAD_DEFAULT_LIMIT, BULKHEAD_WAIT_SECONDS
+)
+from metrics import BROKER_CALLS_REJECTED, BROKER_CIRCUIT_TRANSITIONS, record_cache
+
+logger = get_logger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class BrokerUnavailable(requests.exceptions.ConnectionError):
+    """A broker call rejected before it was sent: the circuit is open or the bulkhead is full."""
+
+    def __init__(self, endpoint, reason, message):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.reason = reason
+
+class CircuitBreaker:
+    """
+    Count-based circuit breaker for one broker endpoint.
+
+    Closed: calls pass and their outcomes fill a rolling window of the last
+    `window` calls. Once it holds at least `min_calls`, the breaker opens when
+    the share of failed calls reaches `failure_rate` or the share of calls
+    slower than `slow_call_seconds` reaches `slow_call_rate`.
+    Open: calls are rejected for `open_seconds`.
+    Half-open: up to `half_open_probes` calls are let through; if all of them
+    succeed in time the breaker closes, any failed or slow probe opens it again.
+    """
+
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+                 slow_call_seconds=BREAKER_SLOW_CALL_SECONDS, slow_call_rate=BREAKER_SLOW_CALL_RATE,
+                 open_seconds=BREAKER_OPEN_SECONDS, half_open_probes=BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=max(self.min_calls, window))
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_passed = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state, **fields):
+        # Called with the lock held
+        previous, self.state = self.state, state
+        BROKER_CIRCUIT_TRANSITIONS.inc(endpoint=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            logger.warning("🔌 Broker circuit opened, failing fast", extra=kv(
+                endpoint=self.name, previous=previous, open_seconds=self.open_seconds, **fields
+            ))
+        elif state == HALF_OPEN:
+            self._probes_started = self._probes_passed = 0
+            logger.info("🔌 Broker circuit half-open, probing", extra=kv(endpoint=self.name, probes=self.half_open_probes))
+        else:
+            self._outcomes.clear()
+            logger.info("✅ Broker circuit closed", extra=kv(endpoint=self.name))
+
+    def before_call(self):
+        """Admits a call or raises BrokerUnavailable."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise self._reject()
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_started >= self.half_open_probes:
+                    raise self._reject()
+                self._probes_started += 1
+
+    def _reject(self):
+        retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+        BROKER_CALLS_REJECTED.inc(endpoint=self.name, reason="circuit_open")
+        return BrokerUnavailable(
+            self.name, "circuit_open", f"Broker endpoint '{self.name}' unavailable (circuit open, retry in {retry_in:.0f}s)"
+        )
+
+    def release_probe(self):
+        """Returns an admitted half-open probe that was never sent."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes_started > self._probes_passed:
+                self._probes_started -= 1
+
+    def record(self, failed, duration):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN, probe="failed" if failed else "slow", duration_s=round(duration, 3))
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.half_open_probes:
+                        self._transition(CLOSED)
+                return
+            if self.state == OPEN:
+                return  # Call admitted before the circuit opened
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failure_rate = sum(1 for failed, _ in self._outcomes if failed) / calls
+            slow_rate = sum(1 for _, slow in self._outcomes if slow) / calls
+            if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                self._transition(OPEN, calls=calls, failure_rate=round(failure_rate, 2), slow_rate=round(slow_rate, 2))
+
+class Bulkhead:
+    """Caps concurrent broker requests; callers wait up to `wait` seconds for a slot."""
+
+    def __init__(self, name, limit, wait=BULKHEAD_WAIT_SECONDS):
+        self.name = name
+        self.limit = max(1, limit)
+        self.wait = wait
+        self.in_use = 0
+        self._semaphore = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, endpoint):
+        if not self._semaphore.acquire(timeout=self.wait):
+            BROKER_CALLS_REJECTED.inc(endpoint=endpoint, reason="bulkhead_full")
+            raise BrokerUnavailable(
+                endpoint, "bulkhead_full", f"Broker endpoint '{endpoint}' unavailable ({self.limit} '{self.name}' calls already in flight)"
+            )
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._semaphore.release()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+bulkheads = {
+    "trading": Bulkhead("trading", BULKHEAD_TRADING_LIMIT),
+    "default": Bulkhead("default", BULKHEAD_DEFAULT_LIMIT),
+}
+_bulkhead = ContextVar("broker_bulkhead", default="default")
+_send_errors = threading.local()
+
+def breaker(endpoint):
+    """The circuit breaker of an endpoint, created on first use."""
+    with _breakers_lock:
+        found = _breakers.get(endpoint)
+        if found is None:
+            found = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return found
+
+def circuit_states():
+    """endpoint -> state code (0 closed, 1 half-open, 2 open), shaped for a labelled Gauge callback."""
+    with _breakers_lock:
+        return {(name, ): _STATE_CODES[found.state] for name, found in _breakers.items()}
+
+def bulkhead_usage():
+    return {(name, ): bulkhead.in_use for name, bulkhead in bulkheads.items()}
+
+@contextmanager
+def use_bulkhead(name):
+    """Runs broker calls made inside the block (or decorated function) in the named bulkhead."""
+    token = _bulkhead.set(name)
+    try:
+        yield
+    finally:
+        _bulkhead.reset(token)
+
+def take_send_error():
+    """
+    Returns and clears the last exception a broker request raised on this
+    thread (BrokerUnavailable, a timeout, a connection error), if any. Lets
+    callers of clients that swallow exceptions, like dhanhq, see what happened.
+    """
+    error = getattr(_send_errors, "last", None)
+    _send_errors.last = None
+    return error
+
+def never_sent(error):
+    """
+    True if a request that raised `error` certainly did not reach the broker:
+    it was rejected by a breaker or bulkhead, or no connection could be
+    established (refused, unresolvable host, connect timeout). Errors on an
+    open connection, such as a read timeout or a reset, are ambiguous.
+    """
+    if isinstance(error, (BrokerUnavailable, requests.exceptions.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests wraps urllib3's MaxRetryError, whose reason is the actual failure
+        reason = getattr(error.args[0], "reason", error.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+def endpoint_key(method, url):
+    """
+    Groups requests into breaker endpoints by method and path:
+    GET '/v2/orders/123' -> 'GET orders', POST '/v2/marketfeed/ltp' -> 'POST marketfeed/ltp'.
+    The method keeps order placement (POST orders) apart from order book
+    polling and lookups (GET orders), so failing polls cannot block new orders.
+    """
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if segments and segments[0] in ("v1", "v2"):
+        segments = segments[1:]
+    named = []
+    for segment in segments[:2]:
+        if any(char.isdigit() for char in segment):
+            break
+        named.append(segment)
+    return f"{method.upper()} {'/'.join(named) or 'root'}"
+
+class ResilientAdapter(HTTPAdapter):
+    """HTTPAdapter that applies the default timeouts, the endpoint's circuit breaker and the caller's bulkhead."""
+
+    def send(self, request, timeout=None, **kwargs):
+        endpoint = endpoint_key(request.method, request.url)
+        circuit = breaker(endpoint)
+        try:
+            circuit.before_call()
+            bulkhead = bulkheads[_bulkhead.get()]
+            with bulkhead.slot(endpoint):
+                started = time.monotonic()
+                try:
+                    response = super().send(request, timeout=timeout or (BROKER_CONNECT_TIMEOUT, BROKER_READ_TIMEOUT), **kwargs)
+                except Exception as e:
+                    circuit.record(True, time.monotonic() - started)
+                    _send_errors.last = e
+                    raise
+        except BrokerUnavailable as e:
+            if e.reason == "bulkhead_full":
+                circuit.release_probe()
+            _send_errors.last = e
+            raise
+        # Client errors (bad order, insufficient funds) say nothing about broker health
+        circuit.record(response.status_code >= 500 or response.status_code == 429, time.monotonic() - started)
+        return response
+
+class LastGood:
+    """
+    Last successful value per key, served while the broker is unavailable for
+    up to max_age seconds. Lookups are counted under cache_requests_total.
+    """
+
+    def __init__(self, name, max_age):
+        self.name = name
+        self.max_age = max_age
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = (value, time.monotonic())
+
+    def get(self, key):
+        """Returns (value, age in seconds), or (None, None) if nothing fresh enough is cached."""
+        with self._lock:
+            entry = self._values.get(key)
+        age = time.monotonic() - entry[1] if entry else None
+        hit = entry is not None and age <= self.max_age
+        record_cache(self.name, hit)
+        return (entry[0], age) if hit else (None, None)
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+# config refuses to import without credentials; point everything at throwaway
+# values and a scratch SQLite database before any module under test is loaded
+_scratch = tempfile.mkdtemp(prefix="etf-tests-")
+os.environ["CLIENT_ID"] = "test-client"
+os.environ["ACCESS_TOKEN"] = "test-token"
+os.environ["DB_URL"] = f"sqlite:///{_scratch}/test.db"
+os.environ.pop("DB_READ_URL", None)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def db():
+    """A session on the scratch database, with every table emptied first."""
+    from models import Base, Session, engine
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    session = Session()
+    yield session
+    session.close()
@@ -0,0 +1,103 @@
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pytest
+
+import analytics
+from config import IST
+from models import ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule
+
+def test_xirr_of_a_single_outflow_is_the_simple_annual_return():
+    rates = analytics.vectorized_xirr(
+        np.array([0]), 1, np.array([100.0]), np.array([1.0]), np.array([110.0])
+    )
+    assert rates[0] == pytest.approx(0.10)
+
+def test_xirr_solves_every_group_at_once():
+    # Group 0: two yearly outflows of 100 growing at 5% into 100 * (1.05 ** 2 + 1.05)
+    # Group 1: half a year at -20%
+    groups = np.array([0, 0, 1])
+    amounts = np.array([100.0, 100.0, 50.0])
+    years = np.array([2.0, 1.0, 0.5])
+    terminal = np.array([100 * (1.05 ** 2 + 1.05), 50 * 0.8 ** 0.5])
+    rates = analytics.vectorized_xirr(groups, 2, amounts, years, terminal)
+    assert rates == pytest.approx([0.05, -0.20])
+
+def test_xirr_is_nan_without_a_terminal_value_or_investment():
+    rates = analytics.vectorized_xirr(
+        np.array([0, 1]), 3, np.array([100.0, 100.0]), np.array([1.0, 1.0]), np.array([0.0, 120.0, 50.0])
+    )
+    assert np.isnan(rates[0]) and np.isnan(rates[2])
+    assert rates[1] == pytest.approx(0.20)
+
+def columns(**values):
+    return {key: np.asarray(value, dtype=np.float64) for key, value in values.items()}
+
+def test_aggregate_sums_each_group_with_bincount():
+    data = columns(cost=[400.0, 600.0, 300.0], amount=[405.0, 610.0, 300.0], quantity=[4, 6, 3])
+    prices = np.array([110.0, 110.0, 90.0])
+    result = analytics._aggregate(np.array([0, 0, 1]), 2, data, prices, np.zeros(3))
+    assert result["invested"].tolist() == [1000.0, 300.0]
+    assert result["uninvested"].tolist() == [15.0, 0.0]
+    assert result["quantity"].tolist() == [10.0, 3.0]
+    assert result["value"].tolist() == pytest.approx([1100.0, 270.0])
+    assert result["avg_cost"].tolist() == [100.0, 100.0]
+    assert result["unrealised"].tolist() == pytest.approx([100.0, -30.0])
+    assert result["return_percent"].tolist() == pytest.approx([10.0, -10.0])
+
+def test_aggregate_reports_nan_for_groups_missing_a_price():
+    data = columns(cost=[100.0, 100.0], amount=[100.0, 100.0], quantity=[1, 1])
+    result = analytics._aggregate(np.array([0, 1]), 2, data, np.array([np.nan, 120.0]), np.array([1.0, 1.0]))
+    assert np.isnan(result["value"][0]) and np.isnan(result["xirr"][0])
+    assert result["invested"][0] == 100.0
+    assert result["value"][1] == 120.0
+
+@pytest.fixture
+def portfolio(db, monkeypatch):
+    """One ETF with two executed weeks a year ago and LTPs served from a dict."""
+    monkeypatch.setattr(analytics, "_cache", dict.fromkeys(analytics._cache))
+    monkeypatch.setattr(analytics, "get_security_details_batch", lambda names: {name: (101, name) for name in names})
+    fetches = []
+
+    def ltps(security_ids):
+        fetches.append(security_ids)
+        return {101: 110.0}, []
+
+    monkeypatch.setattr(analytics, "get_ltps_or_stale", ltps)
+    etf = ETF(etf_name="NIFTYBEES")
+    db.add(etf)
+    db.flush()
+    start = datetime.now(IST).date() - timedelta(days=365)
+    cycle = InvestmentCycle(etf_id=etf.etf_id, total_amount=1000.0, start_date=start, status="active")
+    db.add(cycle)
+    db.flush()
+    for week, (quantity, cost) in enumerate([(2, 198.0), (2, 202.0)], start=1):
+        schedule = InvestmentSchedule(
+            cycle_id=cycle.cycle_id, week_number=week, execution_date=start, execution_time=time(15),
+            amount=200.0, quantity=quantity, status="executed"
+        )
+        db.add(schedule)
+        db.flush()
+        db.add(ExecutionHistory(
+            schedule_id=schedule.schedule_id, execution_timestamp=datetime.now(IST), amount=cost, status="executed"
+        ))
+    db.commit()
+    return fetches
+
+def test_portfolio_analytics_uses_the_traded_value_as_cost(db, portfolio):
+    result = analytics.compute_portfolio_analytics(db)
+    totals = result["totals"]
+    assert totals["invested"] == 400.0
+    assert totals["current_value"] == 440.0
+    assert totals["xirr_percent"] == pytest.approx(10.0, abs=0.01)
+    etf = result["etfs"][0]
+    assert (etf["quantity"], etf["avg_cost_price"], etf["ltp"]) == (4, 100.0, 110.0)
+    assert [cycle["invested"] for cycle in etf["cycles"]] == [400.0]
+
+def test_repeat_calls_within_the_ltp_ttl_skip_the_broker(db, portfolio, monkeypatch):
+    first = analytics.compute_portfolio_analytics(db)
+    assert analytics.compute_portfolio_analytics(db) is first
+    assert len(portfolio) == 1
+    monkeypatch.setattr(analytics, "ANALYTICS_LTP_TTL", 0)
+    analytics.compute_portfolio_analytics(db)
+    assert len(portfolio) == 2
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+
+START = np.datetime64("2030-01-07", "D")  # A Monday
+FIFTEEN = 15 * 3600
+
+def daily_ticks(days=41, offset=FIFTEEN):
+    """One tick a day at 15:00 priced 100, 101, 102, ..."""
+    day_numbers = START.astype(np.int64) + np.arange(days)
+    return day_numbers * backtest.SECONDS_PER_DAY + offset, 100.0 + np.arange(days)
+
+def run(amount=5000.0, offset=FIFTEEN, valuation_day=40):
+    timestamps, prices = daily_ticks()
+    return backtest.simulate(
+        timestamps, prices, np.array([START.astype(np.int64)]), np.array([amount]),
+        np.array([offset]), int(timestamps[valuation_day])
+    )
+
+def test_weekly_tranches_buy_whole_units_at_each_weeks_price():
+    result = run()
+    # Weekly 1000 at 100, 107, 114, 121, 128 buys 10, 9, 8, 8, 7 units
+    assert result["complete"][0]
+    assert result["quantity"][0] == 42
+    assert result["rounding_cash"][0] == pytest.approx(0 + 37 + 88 + 32 + 104)
+    assert result["dca_value"][0] == pytest.approx(42 * 140 + 261)
+    assert result["avg_fill_price"][0] == pytest.approx((5000 - 261) / 42)
+
+def test_dca_is_compared_with_a_week_one_lump_sum():
+    result = run()
+    assert result["lump_sum_value"][0] == pytest.approx(50 * 140)
+    assert result["lump_sum_return_percent"][0] == pytest.approx(40.0)
+    assert result["excess_return_percent"][0] == pytest.approx((6141 - 5000) / 5000 * 100 - 40.0)
+
+def test_a_tick_on_a_later_day_does_not_fill():
+    result = run(offset=FIFTEEN + 1800)
+    assert result["filled_weeks"][0] == 0
+    assert result["unfilled_cash"][0] == 5000.0
+
+def test_weeks_after_the_valuation_date_stay_unfilled():
+    result = run(valuation_day=15)
+    assert result["filled_weeks"][0] == 3
+    assert not result["complete"][0]
+    assert result["unfilled_cash"][0] == 2000.0
+
+def test_build_grid_skips_weekends_unless_asked():
+    days, amounts, offsets = backtest.build_grid("2030-01-10", "2030-01-14", [1000, 5000], ["09:30", "15:00"])
+    assert sorted(set(days.astype("datetime64[D]").astype(str))) == ["2030-01-10", "2030-01-11", "2030-01-14"]
+    assert len(days) == 3 * 2 * 2
+    assert set(offsets.tolist()) == {9 * 3600 + 1800, FIFTEEN}
+    days, _, _ = backtest.build_grid("2030-01-10", "2030-01-14", [1000], ["15:00"], weekdays_only=False)
+    assert len(days) == 5
+
+# The logging listener thread is running when the pool forks its worker
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+def test_run_backtest_over_converted_prices(tmp_path):
+    timestamps, prices = daily_ticks()
+    pd.DataFrame({
+        "timestamp": pd.to_datetime(timestamps, unit="s"),
+        "price": prices
+    }).to_csv(tmp_path / "NIFTYBEES.csv", index=False)
+    assert backtest.convert_csv(tmp_path / "NIFTYBEES.csv", "NIFTYBEES", str(tmp_path)) == 41
+
+    start_days, amounts, offsets = backtest.build_grid("2030-01-07", "2030-01-08", [5000], ["15:00"])
+    df = backtest.run_backtest(str(tmp_path), ["NIFTYBEES"], start_days, amounts, offsets, "2030-02-16", workers=1, chunk_size=1)
+    assert len(df) == 2
+    assert df["execution_time"].tolist() == ["15:00", "15:00"]
+    assert df.loc[0, "quantity"] == 42
+
+    summary = backtest.summarize(df)
+    assert summary["NIFTYBEES"]["combinations"] == 2
+    assert summary["incomplete_combinations"] == 0
@@ -0,0 +1,105 @@
+import pytest
+
+import broker
+from broker import PaperBroker
+
+class Prices:
+    """price_source stand-in that counts lookups."""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = 0
+
+    def __call__(self, security_ids):
+        self.calls += 1
+        return {security_id: self.prices[security_id] for security_id in security_ids if security_id in self.prices}
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(broker.time, "monotonic", clock)
+    return clock
+
+def test_get_ltp_refreshes_after_ttl(clock):
+    prices = Prices({101: 50.0})
+    paper = PaperBroker(prices, 10000, ltp_ttl=5)
+    assert paper.get_ltp(101) == 50.0
+    clock.now += 4
+    assert paper.get_ltp(101) == 50.0
+    assert prices.calls == 1
+    prices.prices[101] = 51.0
+    clock.now += 2
+    assert paper.get_ltp(101) == 51.0
+    assert prices.calls == 2
+
+def test_primed_prices_last_through_the_warm_up(clock):
+    prices = Prices({101: 50.0, 102: 20.0})
+    paper = PaperBroker(prices, 10000, ltp_ttl=5)
+    paper.prime_prices([101, 102], hold_seconds=30)
+    clock.now += 30  # The slot fires WARMUP_SECONDS after the warm-up
+    assert paper.get_ltp(101) == 50.0
+    assert paper.get_ltp(102) == 20.0
+    assert prices.calls == 1
+
+def buy(paper, security_id, quantity, tag=None, order_type=PaperBroker.MARKET):
+    return paper.place_order(
+        security_id=security_id, exchange_segment=PaperBroker.NSE, transaction_type=PaperBroker.BUY,
+        quantity=quantity, order_type=order_type, product_type=PaperBroker.CNC, tag=tag
+    )
+
+def test_market_buy_fills_at_ltp_plus_slippage(clock):
+    paper = PaperBroker(Prices({101: 100.0}), 10000, slippage_bps=50)
+    response = buy(paper, 101, 10, tag="etf-1-20300107")
+    assert response["status"] == "success"
+    assert response["data"]["orderStatus"] == "TRADED"
+
+    assert paper.get_fund_limits()["data"]["availableBalance"] == pytest.approx(10000 - 10 * 100.5)
+    holding, = paper.get_holdings()["data"]
+    assert (holding["securityId"], holding["availableQty"], holding["avgCostPrice"]) == ("101", 10, 100.5)
+    order = paper.get_order_by_correlationID("etf-1-20300107")["data"]
+    assert (order["orderId"], order["filledQty"], order["averageTradedPrice"]) == (response["data"]["orderId"], 10, 100.5)
+    trade, = paper.get_trade_book()["data"]
+    assert (trade["tradedQuantity"], trade["tradedPrice"]) == (10, 100.5)
+
+def test_repeat_buys_average_the_cost(clock):
+    prices = Prices({101: 100.0})
+    paper = PaperBroker(prices, 10000, ltp_ttl=0)
+    buy(paper, 101, 10)
+    prices.prices[101] = 110.0
+    buy(paper, 101, 10)
+    holding, = paper.get_holdings()["data"]
+    assert (holding["availableQty"], holding["avgCostPrice"]) == (20, 105.0)
+
+def test_buy_beyond_available_funds_is_rejected_and_recorded(clock):
+    paper = PaperBroker(Prices({101: 100.0}), 500)
+    response = buy(paper, 101, 10)
+    assert response["status"] == "failure"
+    assert response["remarks"]["error_message"].startswith("Insufficient funds")
+    order, = paper.get_order_list()["data"]
+    assert (order["orderStatus"], order["filledQty"]) == ("REJECTED", 0)
+    assert paper.get_holdings()["data"] == []
+    assert paper.get_trade_book()["data"] == []
+    assert paper.get_fund_limits()["data"]["availableBalance"] == 500
+
+@pytest.mark.parametrize("prices, quantity, order_type, message", [
+    ({}, 1, PaperBroker.MARKET, "No LTP available"),
+    ({101: 100.0}, 0, PaperBroker.MARKET, "Quantity must be positive"),
+    ({101: 100.0}, 1, PaperBroker.LIMIT, "Paper broker only supports MARKET orders"),
+])
+def test_unfillable_orders_fail(clock, prices, quantity, order_type, message):
+    paper = PaperBroker(Prices(prices), 10000)
+    response = buy(paper, 101, quantity, order_type=order_type)
+    assert response["status"] == "failure"
+    assert response["remarks"]["error_message"] == message
+
+def test_unknown_order_lookups_report_not_found(clock):
+    paper = PaperBroker(Prices({}), 10000)
+    assert paper.get_order_by_id("42")["remarks"]["error_code"] == "DH-907"
+    assert paper.get_order_by_correlationID("etf-1-20300107")["remarks"]["error_code"] == "DH-907"
@@ -0,0 +1,73 @@
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import export
+from models import ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule, engine
+
+@pytest.fixture
+def rows(db):
+    """Two ETFs with five schedules each, one executed history row per schedule."""
+    for name in ("NIFTYBEES", "GOLDBEES"):
+        etf = ETF(etf_name=name)
+        db.add(etf)
+        db.flush()
+        cycle = InvestmentCycle(etf_id=etf.etf_id, total_amount=500.0, start_date=date(2030, 1, 7), status="active")
+        db.add(cycle)
+        db.flush()
+        for week in range(1, 6):
+            day = date(2030, 1, 7) + timedelta(weeks=week - 1)
+            schedule = InvestmentSchedule(
+                cycle_id=cycle.cycle_id, week_number=week, execution_date=day,
+                execution_time=time(15), amount=100.0, quantity=week, status="executed"
+            )
+            db.add(schedule)
+            db.flush()
+            db.add(ExecutionHistory(
+                schedule_id=schedule.schedule_id, execution_timestamp=datetime.combine(day, time(15)),
+                amount=99.5, status="executed"
+            ))
+    db.commit()
+
+def test_row_chunks_are_bounded_by_chunk_size(rows):
+    query = export.build_query("schedules")
+    chunks = list(export.iter_row_chunks(query, chunk_size=4, bind=engine))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert [row[0] for chunk in chunks for row in chunk] == sorted(row[0] for chunk in chunks for row in chunk)
+
+def test_filters_apply_to_dates_and_etfs(rows):
+    query = export.build_query("executions", "2030-01-14", "2030-01-21", ["GOLDBEES"])
+    chunk, = export.iter_row_chunks(query, bind=engine)
+    names = [column.key for column in query.selected_columns]
+    assert [row[names.index("etf_name")] for row in chunk] == ["GOLDBEES", "GOLDBEES"]
+    assert [row[names.index("week_number")] for row in chunk] == [2, 3]
+
+def test_csv_has_a_header_and_every_row(rows):
+    query = export.build_query("executions")
+    chunks = list(export.iter_csv(query, chunk_size=3, bind=engine))
+    assert len(chunks) == 1 + 4
+    records = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(records) == 10
+    assert records[0]["etf_name"] == "NIFTYBEES"
+    assert float(records[0]["amount"]) == 99.5
+
+def test_parquet_writes_one_row_group_per_chunk(rows):
+    pq = pytest.importorskip("pyarrow.parquet")
+    query = export.build_query("schedules")
+    data = b"".join(export.iter_parquet(query, chunk_size=4, bind=engine))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.num_rows == 10
+    assert table.column("amount").to_pylist() == [100.0] * 10
+
+@pytest.mark.parametrize("kind, date_from, date_to, message", [
+    ("trades", None, None, "Unknown export 'trades'"),
+    ("schedules", "07-01-2030", None, "Invalid from date"),
+    ("schedules", "2030-02-01", "2030-01-01", "'from' date must not be after 'to' date"),
+])
+def test_invalid_requests_raise_value_error(kind, date_from, date_to, message):
+    with pytest.raises(ValueError, match=message):
+        export.build_query(kind, date_from, date_to)
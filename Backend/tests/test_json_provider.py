@@ -0,0 +1,31 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+import json_provider
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(json_provider, "JSON_BACKEND", request.param)
+    return request.param
+
+def test_stream_json_array_yields_bounded_chunks_of_one_array(backend):
+    items = [{"id": i, "name": f"ETF{i}"} for i in range(50)]
+    chunks = list(json_provider.stream_json_array(iter(items), chunk_size=100))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 100 + 30 for chunk in chunks)
+    assert json.loads(b"".join(chunks)) == items
+
+def test_stream_json_array_of_nothing_is_an_empty_array(backend):
+    assert b"".join(json_provider.stream_json_array(iter([]))) == b"[]"
+
+def test_numpy_decimal_and_dates_serialize_in_every_backend(backend):
+    value = {"qty": np.int64(3), "ltp": np.float64(1.5), "weeks": np.arange(2), "amount": Decimal("4050.25"), "on": date(2030, 1, 7)}
+    assert json.loads(json_provider.dumps_bytes(value)) == {
+        "qty": 3, "ltp": 1.5, "weeks": [0, 1], "amount": 4050.25, "on": "2030-01-07"
+    }
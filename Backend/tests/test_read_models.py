@@ -0,0 +1,74 @@
+from datetime import date, datetime, time
+
+import pytest
+
+import read_models
+from config import IST
+from models import ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule
+
+@pytest.fixture
+def portfolio(db):
+    """
+    NIFTYBEES with two cycles and GOLDBEES with one. Week 1 of every cycle is
+    executed; NIFTYBEES' first cycle recorded a traded value of 990.
+    """
+    ids = {}
+    for name, cycles in (("NIFTYBEES", 2), ("GOLDBEES", 1)):
+        etf = ETF(etf_name=name, description=f"{name} ETF")
+        db.add(etf)
+        db.flush()
+        ids[name] = etf.etf_id
+        for _ in range(cycles):
+            cycle = InvestmentCycle(etf_id=etf.etf_id, total_amount=5000.0, start_date=date(2030, 1, 7), status="active")
+            db.add(cycle)
+            db.flush()
+            # Added out of week order; loaders return schedules by week
+            for week in (3, 1, 2, 5, 4):
+                db.add(InvestmentSchedule(
+                    cycle_id=cycle.cycle_id, week_number=week, execution_date=date(2030, 1, 7),
+                    execution_time=time(15), amount=1000.0, quantity=10 if week == 1 else 0,
+                    status="executed" if week == 1 else "pending"
+                ))
+    db.flush()
+    first_week = db.query(InvestmentSchedule).filter_by(cycle_id=1, week_number=1).one()
+    db.add(ExecutionHistory(
+        schedule_id=first_week.schedule_id, execution_timestamp=datetime.now(IST), amount=990.0, status="executed"
+    ))
+    db.commit()
+    return ids
+
+def test_cycles_are_grouped_by_etf_with_schedules_in_week_order(portfolio):
+    cycles_by_etf = read_models.load_cycles_by_etf()
+    assert {etf_id: [cycle.cycle_id for cycle, _ in cycles] for etf_id, cycles in cycles_by_etf.items()} == {
+        portfolio["NIFTYBEES"]: [1, 2], portfolio["GOLDBEES"]: [3]
+    }
+    for cycles in cycles_by_etf.values():
+        for cycle, schedules in cycles:
+            assert [s.week_number for s in schedules] == [1, 2, 3, 4, 5]
+            assert {s.cycle_id for s in schedules} == {cycle.cycle_id}
+            assert type(cycle.total_amount) is float and type(schedules[0].amount) is float
+
+def test_etf_detail_lists_only_that_etfs_cycles(portfolio):
+    etf_info, cycle_list, _ = read_models.load_etf_detail("GOLDBEES")
+    assert (etf_info["etf_id"], etf_info["description"]) == (portfolio["GOLDBEES"], "GOLDBEES ETF")
+    assert [cycle["cycle_id"] for cycle in cycle_list] == [3]
+    schedule = cycle_list[0]["schedules"][0]
+    assert schedule == {
+        "schedule_id": schedule["schedule_id"],
+        "week_number": 1,
+        "execution_date": "2030-01-07",
+        "execution_time": "15:00:00",
+        "amount": 1000.0,
+        "quantity": 10,
+        "status": "executed",
+        "created_at": schedule["created_at"],
+        "updated_at": schedule["updated_at"]
+    }
+
+def test_unknown_etf_has_no_detail(portfolio):
+    assert read_models.load_etf_detail("MISSING") is None
+
+def test_invested_is_the_traded_value_of_executed_schedules(portfolio):
+    # NIFTYBEES: 990 traded in cycle 1 plus cycle 2's scheduled 1000 without a history row
+    assert read_models.load_invested_by_etf() == {portfolio["NIFTYBEES"]: 1990.0, portfolio["GOLDBEES"]: 1000.0}
+    assert read_models.load_etf_detail("NIFTYBEES")[2] == 1990.0
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app as app_module
+import models
+from models import Base, ETF
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch, db):
+    """A separate SQLite database standing in for the read replica, holding one ETF."""
+    read_engine = create_engine(f"sqlite:///{tmp_path}/replica.db")
+    Base.metadata.create_all(read_engine)
+    ReadSession = sessionmaker(bind=read_engine)
+    with ReadSession() as session:
+        session.add(ETF(etf_name="REPLICAETF"))
+        session.commit()
+    monkeypatch.setattr(models, "read_engine", read_engine)
+    monkeypatch.setattr(models, "ReadSession", ReadSession)
+    monkeypatch.setattr(app_module, "ReadSession", ReadSession)
+    monkeypatch.setattr(models, "_primary_pinned_until", 0.0)
+    yield read_engine
+    read_engine.dispose()
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client with the broker calls of the listing endpoint stubbed out."""
+    monkeypatch.setattr(app_module, "get_holdings_or_stale", lambda: ([], None))
+    monkeypatch.setattr(app_module, "get_security_details_batch", lambda names: {})
+    return app_module.app.test_client()
+
+def test_without_a_replica_reads_use_the_primary(monkeypatch):
+    monkeypatch.setattr(models, "_primary_pinned_until", 0.0)
+    assert models.read_session_factory() is models.Session
+    assert models.read_bind() is models.engine
+
+def test_reads_go_to_the_replica_unless_forced(replica):
+    assert models.read_session_factory() is models.ReadSession
+    assert models.read_bind() is replica
+    assert models.read_session_factory(force_primary=True) is models.Session
+    assert models.read_bind(force_primary=True) is models.engine
+
+def test_a_write_pins_reads_to_the_primary_for_a_while(replica, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(models.time, "monotonic", lambda: now[0])
+    models.pin_reads_to_primary(5)
+    assert models.read_session_factory() is models.Session
+    now[0] += 6
+    assert models.read_session_factory() is models.ReadSession
+
+def test_listing_endpoint_reads_from_the_replica(replica, client):
+    response = client.get("/api/all_etf_details")
+    assert response.headers["X-Read-Source"] == "replica"
+    assert [strategy["name"] for strategy in response.get_json()] == ["REPLICAETF"]
+
+def test_read_primary_header_bypasses_the_replica(replica, client):
+    response = client.get("/api/all_etf_details", headers={"X-Read-Primary": "1"})
+    assert response.headers["X-Read-Source"] == "primary"
+    assert response.get_json() == []
+
+def test_successful_mutation_pins_the_next_reads(replica, client):
+    with app_module.app.test_request_context("/api/anything", method="POST"):
+        app_module.pin_reads_after_mutation(app_module.app.response_class(status=200))
+    assert client.get("/api/all_etf_details").headers["X-Read-Source"] == "primary"
+
+def test_failed_mutation_does_not_pin(replica, client):
+    with app_module.app.test_request_context("/api/anything", method="POST"):
+        app_module.pin_reads_after_mutation(app_module.app.response_class(status=400))
+    assert client.get("/api/all_etf_details").headers["X-Read-Source"] == "replica"
@@ -0,0 +1,164 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+import trade
+from config import IST
+from models import ETF, ExecutionHistory, InvestmentCycle, InvestmentSchedule
+
+TODAY = datetime.now(IST).date()
+YESTERDAY = TODAY - timedelta(days=1)
+
+@pytest.fixture
+def broker(monkeypatch):
+    """Stands in for the broker reads reconcile_orders makes, recording lookups."""
+    state = {"orders": [], "trades": [], "history": [], "by_correlation": {}, "by_id": {}, "lookups": [], "events": []}
+    monkeypatch.setattr(trade, "get_order_book", lambda: state["orders"])
+    monkeypatch.setattr(trade, "get_trade_book", lambda: state["trades"])
+
+    def trade_history(from_date, to_date):
+        state["lookups"].append(("history", from_date, to_date))
+        return state["history"]
+
+    def by_correlation(correlation_id):
+        state["lookups"].append(("correlation", correlation_id))
+        return state["by_correlation"].get(correlation_id, {})
+
+    def by_id(order_id):
+        state["lookups"].append(("order_id", order_id))
+        return state["by_id"].get(order_id, {})
+
+    monkeypatch.setattr(trade, "get_trade_history", trade_history)
+    monkeypatch.setattr(trade, "get_order_by_correlation_id", by_correlation)
+    monkeypatch.setattr(trade, "get_order_by_id", by_id)
+    monkeypatch.setattr(trade.socketio, "emit", lambda event, data: state["events"].append((event, data)))
+    return state
+
+def place(db, order_id, quantity=10, amount=1000.0, execution_date=TODAY, week_number=1, cycle=None):
+    """Adds a 'placed' schedule and its 'placed' history row; returns the schedule."""
+    if cycle is None:
+        etf = ETF(etf_name=f"ETF{db.query(ETF).count()}")
+        db.add(etf)
+        db.flush()
+        cycle = InvestmentCycle(etf_id=etf.etf_id, total_amount=amount * 5, start_date=execution_date, status="active")
+        db.add(cycle)
+        db.flush()
+    schedule = InvestmentSchedule(
+        cycle_id=cycle.cycle_id, week_number=week_number, execution_date=execution_date, execution_time=time(15),
+        amount=amount, quantity=quantity, status="placed", order_id=order_id
+    )
+    db.add(schedule)
+    db.flush()
+    db.add(ExecutionHistory(
+        schedule_id=schedule.schedule_id, execution_timestamp=datetime.now(IST), amount=amount, status="placed"
+    ))
+    db.commit()
+    return schedule
+
+def reload(db, schedule):
+    db.expire_all()
+    history = db.query(ExecutionHistory).filter_by(schedule_id=schedule.schedule_id).all()
+    return db.get(InvestmentSchedule, schedule.schedule_id), history
+
+def test_traded_order_is_executed_with_the_trade_book_fills(db, broker):
+    schedule = place(db, "1001")
+    broker["orders"] = [{"orderId": "1001", "orderStatus": "TRADED", "filledQty": 10, "averageTradedPrice": 99.0}]
+    broker["trades"] = [
+        {"orderId": "1001", "tradedQuantity": 6, "tradedPrice": 98.0},
+        {"orderId": "1001", "tradedQuantity": 4, "tradedPrice": 99.5},
+    ]
+    trade.reconcile_orders()
+    row, history = reload(db, schedule)
+    assert (row.status, row.quantity) == ("executed", 10)
+    # The 'placed' history row is settled in place with the traded value
+    assert [(h.status, float(h.amount)) for h in history] == [("executed", 986.0)]
+    event, data = broker["events"][0]
+    assert event == "order_updates"
+    assert data["updates"][0]["average_price"] == 98.6
+
+def test_rejected_order_without_fills_fails_with_the_broker_reason(db, broker):
+    schedule = place(db, "1002")
+    broker["orders"] = [{"orderId": "1002", "orderStatus": "REJECTED", "filledQty": 0, "omsErrorDescription": "RMS: margin"}]
+    trade.reconcile_orders()
+    row, history = reload(db, schedule)
+    assert (row.status, row.quantity) == ("failed", 0)
+    assert [(h.status, h.error_message) for h in history] == [("failed", "RMS: margin")]
+
+def test_cancelled_order_with_a_partial_fill_is_executed_for_the_filled_quantity(db, broker):
+    schedule = place(db, "1003")
+    broker["orders"] = [{"orderId": "1003", "orderStatus": "CANCELLED", "filledQty": 4, "averageTradedPrice": 100.0}]
+    trade.reconcile_orders()
+    row, history = reload(db, schedule)
+    assert (row.status, row.quantity) == ("executed", 4)
+    assert float(history[0].amount) == 400.0
+
+def test_working_order_keeps_placed_with_the_quantity_filled_so_far(db, broker):
+    partly = place(db, "1004")
+    untouched = place(db, "1005")
+    broker["orders"] = [
+        {"orderId": "1004", "orderStatus": "PART_TRADED", "filledQty": 3, "averageTradedPrice": 100.0},
+        {"orderId": "1005", "orderStatus": "PENDING", "filledQty": 0},
+    ]
+    trade.reconcile_orders()
+    row, history = reload(db, partly)
+    assert (row.status, row.quantity) == ("placed", 3)
+    assert [h.status for h in history] == ["placed"]
+    row, _ = reload(db, untouched)
+    assert (row.status, row.quantity) == ("placed", 10)
+    assert [update["schedule_id"] for update in broker["events"][0][1]["updates"]] == [partly.schedule_id]
+
+def test_unknown_outcome_is_found_by_correlation_id(db, broker):
+    schedule = place(db, None)
+    correlation_id = trade.order_correlation_id(schedule.schedule_id, TODAY)
+    broker["by_correlation"][correlation_id] = {"orderId": "2001", "orderStatus": "TRADED", "filledQty": 10, "averageTradedPrice": 100.0}
+    trade.reconcile_orders()
+    row, _ = reload(db, schedule)
+    assert (row.status, row.order_id, row.quantity) == ("executed", "2001", 10)
+
+def test_unknown_outcome_waits_until_the_day_is_over(db, broker):
+    today = place(db, None)
+    yesterday = place(db, None, execution_date=YESTERDAY)
+    trade.reconcile_orders()
+    row, _ = reload(db, today)
+    assert row.status == "placed"
+    row, history = reload(db, yesterday)
+    assert row.status == "failed"
+    assert history[0].error_message == "Order never reached the broker"
+
+def test_past_day_orders_settle_from_one_trade_history_fetch(db, broker):
+    filled = place(db, "3001", execution_date=YESTERDAY)
+    lost = place(db, "3002", execution_date=YESTERDAY)
+    broker["history"] = [{"orderId": "3001", "tradedQuantity": 10, "tradedPrice": 101.0}]
+    trade.reconcile_orders()
+    assert [lookup[0] for lookup in broker["lookups"]] == ["history", "order_id"]
+    row, history = reload(db, filled)
+    assert (row.status, row.quantity, float(history[0].amount)) == ("executed", 10, 1010.0)
+    row, history = reload(db, lost)
+    assert (row.status, history[0].error_message) == ("unreconciled", "Order not found at the broker")
+
+def test_unavailable_order_book_postpones_the_pass(db, broker):
+    schedule = place(db, "4001")
+    broker["orders"] = None
+    trade.reconcile_orders()
+    row, _ = reload(db, schedule)
+    assert row.status == "placed"
+    assert broker["events"] == []
+
+def test_cycle_completes_once_all_five_weeks_executed(db, broker):
+    first = place(db, "5001")
+    cycle = db.get(InvestmentCycle, first.cycle_id)
+    for week in range(2, 6):
+        schedule = place(db, f"500{week}", week_number=week, cycle=cycle)
+        if week < 5:
+            schedule.status = "executed"
+    db.commit()
+    broker["orders"] = [{"orderId": "5001", "orderStatus": "TRADED", "filledQty": 10, "averageTradedPrice": 100.0}]
+    trade.reconcile_orders()
+    db.expire_all()
+    assert db.get(InvestmentCycle, cycle.cycle_id).status == "active"
+
+    broker["orders"].append({"orderId": "5005", "orderStatus": "TRADED", "filledQty": 10, "averageTradedPrice": 100.0})
+    trade.reconcile_orders()
+    db.expire_all()
+    assert db.get(InvestmentCycle, cycle.cycle_id).status == "completed"
+    assert broker["events"][-1][1]["completed_cycles"] == [cycle.cycle_id]
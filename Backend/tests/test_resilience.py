@@ -0,0 +1,146 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+import resilience
+from resilience import (
+    CLOSED, HALF_OPEN, OPEN, Bulkhead, BrokerUnavailable, CircuitBreaker, endpoint_key, never_sent
+)
+
+def make_breaker(**overrides):
+    settings = dict(
+        window=4, min_calls=4, failure_rate=0.5, slow_call_seconds=1.0, slow_call_rate=0.75,
+        open_seconds=60, half_open_probes=2
+    )
+    settings.update(overrides)
+    return CircuitBreaker("test", **settings)
+
+def test_breaker_stays_closed_below_min_calls():
+    circuit = make_breaker()
+    for _ in range(3):
+        circuit.before_call()
+        circuit.record(True, 0.01)
+    assert circuit.state == CLOSED
+
+def test_breaker_opens_on_failure_rate():
+    circuit = make_breaker()
+    for failed in (False, True, False, True):
+        circuit.before_call()
+        circuit.record(failed, 0.01)
+    assert circuit.state == OPEN
+    with pytest.raises(BrokerUnavailable) as rejected:
+        circuit.before_call()
+    assert rejected.value.reason == "circuit_open"
+
+def test_breaker_opens_on_slow_call_rate():
+    circuit = make_breaker()
+    for duration in (2.0, 2.0, 2.0, 0.1):
+        circuit.before_call()
+        circuit.record(False, duration)
+    assert circuit.state == OPEN
+
+def test_breaker_window_forgets_old_failures():
+    circuit = make_breaker()
+    for failed in (True, False, False, False, False, False):
+        circuit.before_call()
+        circuit.record(failed, 0.01)
+    assert circuit.state == CLOSED
+
+def test_half_open_closes_after_successful_probes():
+    circuit = make_breaker(open_seconds=0)
+    for _ in range(4):
+        circuit.record(True, 0.01)
+    assert circuit.state == OPEN
+
+    circuit.before_call()
+    assert circuit.state == HALF_OPEN
+    circuit.before_call()
+    with pytest.raises(BrokerUnavailable):
+        circuit.before_call()  # Only half_open_probes calls are let through
+    circuit.record(False, 0.01)
+    assert circuit.state == HALF_OPEN
+    circuit.record(False, 0.01)
+    assert circuit.state == CLOSED
+
+@pytest.mark.parametrize("failed, duration", [(True, 0.01), (False, 5.0)])
+def test_half_open_reopens_on_failed_or_slow_probe(failed, duration):
+    circuit = make_breaker(open_seconds=0)
+    for _ in range(4):
+        circuit.record(True, 0.01)
+    circuit.before_call()
+    circuit.record(failed, duration)
+    assert circuit.state == OPEN
+
+def test_release_probe_returns_an_unsent_probe():
+    circuit = make_breaker(open_seconds=0, half_open_probes=1)
+    for _ in range(4):
+        circuit.record(True, 0.01)
+    circuit.before_call()
+    circuit.release_probe()
+    circuit.before_call()  # The slot is free again
+    assert circuit.state == HALF_OPEN
+
+def test_bulkhead_rejects_when_full():
+    bulkhead = Bulkhead("test", limit=1, wait=0)
+    with bulkhead.slot("GET holdings"):
+        assert bulkhead.in_use == 1
+        with pytest.raises(BrokerUnavailable) as rejected:
+            with bulkhead.slot("GET holdings"):
+                pass
+        assert rejected.value.reason == "bulkhead_full"
+    assert bulkhead.in_use == 0
+    with bulkhead.slot("GET holdings"):
+        pass
+
+@pytest.mark.parametrize("method, url, expected", [
+    ("POST", "https://api.dhan.co/v2/orders", "POST orders"),
+    ("GET", "https://api.dhan.co/v2/orders", "GET orders"),
+    ("GET", "https://api.dhan.co/v2/orders/112233", "GET orders"),
+    ("GET", "https://api.dhan.co/v2/orders/external/etf-1-20240102", "GET orders/external"),
+    ("GET", "https://api.dhan.co/v2/trades/2024-01-01/2024-01-02/0", "GET trades"),
+    ("post", "https://api.dhan.co/v2/marketfeed/ltp", "POST marketfeed/ltp"),
+    ("GET", "https://images.dhan.co/api-data/api-scrip-master-detailed.csv", "GET api-data/api-scrip-master-detailed.csv"),
+    ("GET", "https://api.dhan.co/", "GET root"),
+])
+def test_endpoint_key(method, url, expected):
+    assert endpoint_key(method, url) == expected
+
+def _refused():
+    reason = NewConnectionError(None, "Failed to establish a new connection: [Errno 111] Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/v2/orders", reason))
+
+@pytest.mark.parametrize("error, expected", [
+    (BrokerUnavailable("POST orders", "circuit_open", "open"), True),
+    (requests.exceptions.ConnectTimeout(), True),
+    (_refused(), True),
+    (requests.exceptions.ReadTimeout(), False),
+    (requests.exceptions.ConnectionError(ProtocolError("Connection aborted.")), False),
+    (requests.exceptions.ConnectionError(), False),
+    (ValueError("bad response"), False),
+])
+def test_never_sent(error, expected):
+    assert never_sent(error) is expected
+
+def test_take_send_error_clears_the_last_error():
+    error = requests.exceptions.ReadTimeout()
+    resilience._send_errors.last = error
+    assert resilience.take_send_error() is error
+    assert resilience.take_send_error() is None
+
+def test_failing_order_polls_do_not_block_order_placement(monkeypatch):
+    def fake_send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 500 if request.method == "GET" else 200
+        return response
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", fake_send)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    session = requests.Session()
+    session.mount("http://", resilience.ResilientAdapter())
+
+    for _ in range(resilience.BREAKER_MIN_CALLS):
+        session.get("http://broker.test/v2/orders")
+    assert resilience.breaker("GET orders").state == OPEN
+    with pytest.raises(BrokerUnavailable):
+        session.get("http://broker.test/v2/orders/1")
+    assert session.post("http://broker.test/v2/orders", json={}).status_code == 200
+    assert resilience.breaker("POST orders").state == CLOSED
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+import schedule
+
+import trade
+from config import IST
+from models import InvestmentSchedule
+
+START = datetime(2030, 1, 7, 15, 0, tzinfo=IST)
+
+def test_plan_splits_the_amount_into_equal_weekly_tranches():
+    plan = trade.plan_weekly_schedule(START, 20250)
+    assert [week for week, _, _ in plan] == [1, 2, 3, 4, 5]
+    assert [dt for _, dt, _ in plan] == [START + timedelta(weeks=week) for week in range(5)]
+    assert {amount for _, _, amount in plan} == {4050.0}
+
+def test_plan_honours_the_number_of_weeks():
+    plan = trade.plan_weekly_schedule(START, 1000, weeks=4)
+    assert len(plan) == 4
+    assert sum(amount for _, _, amount in plan) == pytest.approx(1000)
+    assert plan[-1][1] == START + timedelta(weeks=3)
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """An empty default scheduler, restored afterwards."""
+    jobs = list(schedule.default_scheduler.jobs)
+    schedule.clear()
+    yield schedule.default_scheduler
+    schedule.default_scheduler.jobs[:] = jobs
+
+def test_schedule_weekly_trades_saves_and_registers_the_plan(db, scheduler, monkeypatch):
+    monkeypatch.setattr(trade, "WARMUP_SECONDS", 0)
+    dates, total = trade.schedule_weekly_trades(7, 101, 20250, START, "NIFTYBEES")
+    plan = trade.plan_weekly_schedule(START, 20250)
+    assert dates == [dt.isoformat() for _, dt, _ in plan]
+    assert total == 20250
+
+    rows = db.query(InvestmentSchedule).filter_by(cycle_id=7).order_by(InvestmentSchedule.week_number).all()
+    assert [(row.week_number, row.execution_date, float(row.amount), row.status) for row in rows] == [
+        (week, dt.date(), amount, "pending") for week, dt, amount in plan
+    ]
+    jobs = sorted(scheduler.jobs, key=lambda job: job.trade["week_number"])
+    assert [job.tags for job in jobs] == [{trade.trade_job_tag(7, week)} for week in range(1, 6)]
+    assert [job.trade["schedule_id"] for job in jobs] == [row.schedule_id for row in rows]
+
+def test_schedule_diff_replaces_tagged_jobs_and_adds_one_warm_up_per_slot(scheduler, monkeypatch):
+    monkeypatch.setattr(trade, "WARMUP_SECONDS", 30)
+    job = {"cycle_id": 1, "week_number": 1, "schedule_id": 1, "security_id": 101, "amount": 100.0,
+           "etf_name": "NIFTYBEES", "execution_datetime": START}
+    trade.register_trade_jobs([job, dict(job, cycle_id=2, schedule_id=2)])
+    trade.apply_schedule_diff([trade.trade_job_tag(1, 1)], [dict(job, schedule_id=3)])
+    trade_jobs = [job for job in scheduler.jobs if "warmup" not in job.tags]
+    assert sorted(job.trade["schedule_id"] for job in trade_jobs) == [2, 3]
+    warm_ups = [job for job in scheduler.jobs if "warmup" in job.tags]
+    assert [job.at_time.strftime("%H:%M:%S") for job in warm_ups] == ["14:59:30"]
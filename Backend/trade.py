@@ -1,9 +1,29 @@
 from datetime import datetime, timedelta
+import logging
+import threading
+import time
 import schedule
-from config import logger, IST
-from models import Session, InvestmentSchedule, InvestmentCycle
-from utils import get_balance, get_ltp, save_execution_to_db, dhan
+from sqlalchemy import func, insert, select, update
+from config import get_logger, kv, log_throttled, IST, RECONCILE_INTERVAL, WARMUP_SECONDS, TRADE_RETRY_SECONDS, TRADE_RETRY_ATTEMPTS
+from models import Session, InvestmentSchedule, InvestmentCycle, ExecutionHistory
+from utils import (
+    get_cached_balance, debit_cached_balance, prime_balance, prime_ltps, get_ltp,
+    get_order_book, get_trade_book, get_trade_history, get_order_by_id, get_order_by_correlation_id,
+    save_execution_to_db, fan_out, dhan
+)
 from socketio_instance import socketio
+from metrics import BROKER_CALL_SECONDS, SCHEDULER_LAG_SECONDS, ORDER_SUBMIT_LAG_SECONDS
+from profiling import profile_slow_jobs
+from resilience import never_sent, take_send_error, use_bulkhead
+
+logger = get_logger(__name__)
+
+# Schedule statuses a trade job will (re)try to execute
+RUNNABLE_STATUSES = ("pending", "failed", "retry_later")
+
+def order_correlation_id(schedule_id, trade_date):
+    """Correlation id sent as the order tag, so an order can be found without its order id."""
+    return f"etf-{schedule_id}-{trade_date:%Y%m%d}"
 
 def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, ltp, amount, etf_name):
     try:
@@ -11,8 +31,6 @@ def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, l
             security_id = security_id[0]
         security_id = int(security_id)
 
-        logger.info(f"📦 Attempting to place buy order with SECURITY_ID: {security_id}")
-
         if ltp <= 0:
             raise ValueError("LTP must be positive to calculate quantity.")
         if amount <= 0:
@@ -24,28 +42,31 @@ def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, l
         if quantity <= 0:
             raise ValueError("Amount is less than LTP, cannot execute trade.")
 
-        logger.info(f"💵 Withdrawable Balance: ₹{withdrawable_balance}")
-        logger.info(f"💰 Amount: ₹{amount}")
-        logger.info(f"📊 LTP: ₹{ltp}")
-        logger.info(f"🧮 Calculated Quantity: {quantity}")
-
-        response = dhan.place_order(
-            tag='',
-            transaction_type=dhan.BUY,
-            exchange_segment=dhan.NSE,
-            product_type=dhan.CNC,
-            order_type=dhan.MARKET,
-            validity='DAY',
-            security_id=str(security_id),
-            quantity=quantity,
-            disclosed_quantity=0,
-            price=0,
-            trigger_price=0,
-            after_market_order=False,
-            amo_time='OPEN',
-            bo_profit_value=0,
-            bo_stop_loss_Value=0
-        )
+        logger.info("📦 Placing buy order", extra=kv(
+            schedule_id=schedule_id, security_id=security_id, quantity=quantity,
+            amount=amount, ltp=ltp, withdrawable=withdrawable_balance
+        ))
+
+        correlation_id = order_correlation_id(schedule_id, datetime.now(IST).date())
+        take_send_error()
+        with BROKER_CALL_SECONDS.time(call="place_order"):
+            response = dhan.place_order(
+                tag=correlation_id,
+                transaction_type=dhan.BUY,
+                exchange_segment=dhan.NSE,
+                product_type=dhan.CNC,
+                order_type=dhan.MARKET,
+                validity='DAY',
+                security_id=str(security_id),
+                quantity=quantity,
+                disclosed_quantity=0,
+                price=0,
+                trigger_price=0,
+                after_market_order=False,
+                amo_time='OPEN',
+                bo_profit_value=0,
+                bo_stop_loss_Value=0
+            )
 
         session = Session()
         try:
@@ -53,26 +74,64 @@ def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, l
             timestamp = datetime.now(IST)
 
             if response.get('status') == 'success':
-                order_id = response.get('data', {}).get('orderId', 'Unknown')
-                logger.info(f"✅ Buy order placed successfully for {quantity} units: Order ID {order_id}")
+                order_id = (response.get('data') or {}).get('orderId')
+                logger.info("✅ Buy order placed", extra=kv(schedule_id=schedule_id, order_id=order_id, quantity=quantity))
                 socketio.emit('trade_update', {
                     'status': 'success',
+                    'schedule_id': schedule_id,
                     'order_id': order_id,
+                    'order_status': 'placed',
                     'quantity': quantity,
                     'security_id': security_id,
                     'amount': amount,
                     'ltp': ltp,
                     'etf_name': etf_name
                 })
-                schedule.status = 'executed'
-                schedule.quantity = quantity  # Save quantity to InvestmentSchedule
+                # Accepted is not filled: the schedule stays 'placed' with the
+                # requested quantity until reconcile_orders sees the fill
+                schedule.status = 'placed'
+                schedule.order_id = str(order_id) if order_id else None
+                schedule.quantity = quantity
                 schedule.updated_at = timestamp
                 session.commit()
-                save_execution_to_db(schedule_id, amount, ltp, quantity, timestamp, 'success')
+                save_execution_to_db(schedule_id, amount, ltp, quantity, timestamp, 'placed')
                 return quantity, order_id, None
             else:
-                error_message = response.get('remarks', {}).get('error_message', 'Unknown error')
-                logger.error(f"❌ Failed to place buy order: {response}")
+                send_error = take_send_error()
+                if send_error is not None and never_sent(send_error):
+                    # Rejected by a circuit breaker or bulkhead, or no connection could be opened: safe to retry
+                    defer_trade(session, schedule, security_id, amount, etf_name, ltp, str(send_error))
+                    return None, None, str(send_error)
+                if send_error is not None:
+                    # The request may have reached the broker (e.g. read timeout), so the
+                    # order may be live. Keep the schedule 'placed' without an order id;
+                    # reconcile_orders looks it up by correlation id
+                    message = f"Order status unknown ({type(send_error).__name__}), awaiting reconciliation"
+                    logger.warning("❓ Buy order outcome unknown", extra=kv(
+                        schedule_id=schedule_id, correlation_id=correlation_id, error=str(send_error)
+                    ))
+                    socketio.emit('trade_update', {
+                        'status': 'unknown',
+                        'schedule_id': schedule_id,
+                        'order_id': None,
+                        'order_status': 'unknown',
+                        'quantity': quantity,
+                        'security_id': security_id,
+                        'amount': amount,
+                        'ltp': ltp,
+                        'etf_name': etf_name
+                    })
+                    schedule.status = 'placed'
+                    schedule.order_id = None
+                    schedule.quantity = quantity
+                    schedule.updated_at = timestamp
+                    session.commit()
+                    save_execution_to_db(schedule_id, amount, ltp, quantity, timestamp, 'placed', message)
+                    return quantity, None, None
+                remarks = response.get('remarks')
+                # dhanhq reports transport errors (e.g. timeouts) as a plain string
+                error_message = remarks.get('error_message', 'Unknown error') if isinstance(remarks, dict) else str(remarks or 'Unknown error')
+                logger.error("❌ Failed to place buy order: %s", response, extra=kv(schedule_id=schedule_id))
                 socketio.emit('trade_update', {
                     'status': 'error',
                     'message': error_message,
@@ -87,14 +146,14 @@ def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, l
                 return None, None, error_message
 
         except Exception as e:
-            logger.error(f"❌ Error updating schedule: {e}", exc_info=True)
+            logger.error("❌ Error updating schedule: %s", e, exc_info=True, extra=kv(schedule_id=schedule_id))
             session.rollback()
             return None, None, str(e)
         finally:
             session.close()
 
     except Exception as e:
-        logger.error(f"❌ Exception while placing buy order: {e}", exc_info=True)
+        logger.error("❌ Exception while placing buy order: %s", e, exc_info=True, extra=kv(schedule_id=schedule_id))
         socketio.emit('trade_update', {
             'status': 'error',
             'message': str(e),
@@ -117,62 +176,60 @@ def place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, l
 
         return None, None, str(e)
 
-def execute_weekly_trade(schedule_id, security_id, amount, etf_name):
-    logger.info(f"⏰ Executing scheduled trade: schedule_id={schedule_id}, security_id={security_id}, amount={amount}, etf_name={etf_name} at {datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S')}")
+@profile_slow_jobs(lambda schedule_id, *args, **kwargs: f"schedule_{schedule_id}")
+@use_bulkhead("trading")
+def execute_weekly_trade(schedule_id, security_id, amount, etf_name, retry=False):
+    logger.info("⏰ Executing scheduled trade", extra=kv(
+        schedule_id=schedule_id, security_id=security_id, amount=amount, etf_name=etf_name, retry=retry
+    ))
     session = Session()
     try:
         schedule = session.query(InvestmentSchedule).filter_by(schedule_id=schedule_id).one()
-        if schedule.status not in ["pending", "failed"]:
-            logger.info(f"⏭️ Skipping trade for schedule {schedule_id} (status: {schedule.status})")
+        planned_at = datetime.combine(schedule.execution_date, schedule.execution_time).replace(tzinfo=IST)
+        if not retry:
+            # Retries run TRADE_RETRY_SECONDS late on purpose; only the first firing measures the scheduler
+            SCHEDULER_LAG_SECONDS.observe(max(0.0, (datetime.now(IST) - planned_at).total_seconds()))
+        if schedule.status not in RUNNABLE_STATUSES:
+            logger.info("⏭️ Skipping trade, schedule not runnable", extra=kv(schedule_id=schedule_id, status=schedule.status))
             return
         cycle = session.query(InvestmentCycle).filter_by(cycle_id=schedule.cycle_id).one()
         if cycle.status != 'active':
-            logger.info(f"⏭️ Skipping trade for cycle {cycle.cycle_id} (status: {cycle.status})")
+            logger.info("⏭️ Skipping trade, cycle not active", extra=kv(schedule_id=schedule_id, cycle_id=cycle.cycle_id, status=cycle.status))
             schedule.status = 'skipped'
             schedule.quantity = 0  # Ensure quantity is 0 for skipped trades
             schedule.updated_at = datetime.now(IST)
             session.commit()
             save_execution_to_db(schedule_id, amount, 0, 0, datetime.now(IST), 'skipped', 'Cycle not active')
             return
-        available_balance, withdrawable_balance = get_balance()
+        available_balance, withdrawable_balance = get_cached_balance()
         if withdrawable_balance is None:
-            logger.error("❌ Failed to fetch balance for weekly trade.")
-            schedule.status = 'failed'
-            schedule.quantity = 0  # Set quantity to 0 for failed trades
-            schedule.updated_at = datetime.now(IST)
-            session.commit()
-            save_execution_to_db(schedule_id, amount, 0, 0, datetime.now(IST), 'failed', 'Failed to fetch balance')
+            logger.error("❌ Failed to fetch balance for weekly trade.", extra=kv(schedule_id=schedule_id))
+            defer_trade(session, schedule, security_id, amount, etf_name, 0, 'Failed to fetch balance')
             return
         ltp = get_ltp(security_id)
         if ltp is None:
-            logger.error(f"❌ Failed to fetch LTP for security ID {security_id}.")
-            schedule.status = 'failed'
-            schedule.quantity = 0  # Set quantity to 0 for failed trades
-            schedule.updated_at = datetime.now(IST)
-            session.commit()
-            save_execution_to_db(schedule_id, amount, 0, 0, datetime.now(IST), 'failed', 'Failed to fetch LTP')
+            logger.error("❌ Failed to fetch LTP for weekly trade.", extra=kv(schedule_id=schedule_id, security_id=security_id))
+            defer_trade(session, schedule, security_id, amount, etf_name, 0, 'Failed to fetch LTP')
             return
         quantity = int(float(amount) / float(ltp)) if ltp > 0 else 0
         if quantity <= 0:
-            logger.warning("Amount is less than LTP, trade will not execute until amount >= LTP.")
+            logger.warning("Amount is less than LTP, trade will not execute until amount >= LTP.", extra=kv(schedule_id=schedule_id, amount=amount, ltp=ltp))
             schedule.status = 'failed'
             schedule.quantity = 0  # Set quantity to 0 for failed trades
             schedule.updated_at = datetime.now(IST)
             session.commit()
             save_execution_to_db(schedule_id, amount, ltp, 0, datetime.now(IST), 'failed', 'Amount less than LTP')
             return
+        ORDER_SUBMIT_LAG_SECONDS.observe(max(0.0, (datetime.now(IST) - planned_at).total_seconds()))
         quantity, order_id, error_message = place_cnc_market_buy_order(schedule_id, security_id, withdrawable_balance, ltp, amount, etf_name)
+        if not error_message:
+            debit_cached_balance(quantity * ltp)
         if error_message:
-            logger.error(f"❌ Weekly trade failed: {error_message}")
+            logger.error("❌ Weekly trade failed: %s", error_message, extra=kv(schedule_id=schedule_id))
         else:
-            logger.info(f"✅ Weekly trade executed: Order ID {order_id}, Quantity {quantity}")
-            completed_count = session.query(InvestmentSchedule).filter_by(cycle_id=cycle.cycle_id, status='executed').count()
-            if completed_count == 5:
-                cycle.status = 'completed'
-                cycle.updated_at = datetime.now(IST)
-                session.commit()
+            logger.info("✅ Weekly trade placed", extra=kv(schedule_id=schedule_id, order_id=order_id, quantity=quantity))
     except Exception as e:
-        logger.error(f"❌ Error in execute_weekly_trade: {e}", exc_info=True)
+        logger.error("❌ Error in execute_weekly_trade: %s", e, exc_info=True, extra=kv(schedule_id=schedule_id))
         try:
             schedule = session.query(InvestmentSchedule).filter_by(schedule_id=schedule_id).one()
             schedule.status = 'failed'
@@ -185,64 +242,428 @@ def execute_weekly_trade(schedule_id, security_id, amount, etf_name):
     finally:
         session.close()
 
+# Retries used per (schedule_id, date) by trades waiting for the broker
+_retry_attempts = {}
+
+def defer_trade(session, schedule_item, security_id, amount, etf_name, ltp, reason):
+    """
+    Handles a trade that could not reach the broker (nothing was sent): marks
+    the schedule 'retry_later' and runs it again in TRADE_RETRY_SECONDS, at most
+    TRADE_RETRY_ATTEMPTS times on the same day, after which it is 'failed'.
+    The retry job carries the schedule's trade tag, so pausing or rescheduling
+    the cycle drops it too.
+    """
+    schedule_id = schedule_item.schedule_id
+    now = datetime.now(IST)
+    key = (schedule_id, now.date())
+    attempts = _retry_attempts.get(key, 0)
+    retry = attempts < TRADE_RETRY_ATTEMPTS
+    status = 'retry_later' if retry else 'failed'
+    message = reason if retry else f"{reason} (broker still unavailable after {attempts} retries)"
+
+    schedule_item.status = status
+    schedule_item.quantity = 0
+    schedule_item.updated_at = now
+    session.commit()
+    save_execution_to_db(schedule_id, amount, ltp, 0, now, status, message)
+    socketio.emit('trade_update', {
+        'status': status if retry else 'error',
+        'schedule_id': schedule_id,
+        'message': message,
+        'retry_in': TRADE_RETRY_SECONDS if retry else None,
+        'security_id': security_id,
+        'etf_name': etf_name
+    })
+    if not retry:
+        _retry_attempts.pop(key, None)
+        logger.error("❌ Giving up on trade, broker unavailable", extra=kv(schedule_id=schedule_id, retries=attempts, reason=reason))
+        return
+
+    for stale_key in [k for k in _retry_attempts if k[1] != now.date()]:
+        del _retry_attempts[stale_key]
+    _retry_attempts[key] = attempts + 1
+
+    def retry_job():
+        if datetime.now(IST).date() == now.date():
+            execute_weekly_trade(schedule_id, security_id, amount, etf_name, retry=True)
+        return schedule.CancelJob
+
+    with scheduler_lock:
+        schedule.every(TRADE_RETRY_SECONDS).seconds.do(retry_job).tag(
+            "retry", trade_job_tag(schedule_item.cycle_id, schedule_item.week_number)
+        )
+    logger.warning("⏳ Broker unavailable, trade marked retry_later", extra=kv(
+        schedule_id=schedule_id, attempt=attempts + 1, max_attempts=TRADE_RETRY_ATTEMPTS,
+        retry_in_s=TRADE_RETRY_SECONDS, reason=reason
+    ))
+
 def schedule_weekly_trades(cycle_id, security_id, total_amount, start_datetime, etf_name):
     session = Session()
     try:
-        scheduled_times = []
-        weekly_amount = total_amount / 5
-        schedule_entries = []
-
-        for week in range(5):
-            execution_datetime = start_datetime + timedelta(weeks=week)
-            schedule_entry = InvestmentSchedule(
+        plan = plan_weekly_schedule(start_datetime, total_amount)
+        schedule_entries = [
+            InvestmentSchedule(
                 cycle_id=cycle_id,
-                week_number=week + 1,
+                week_number=week_number,
                 execution_date=execution_datetime.date(),
                 execution_time=execution_datetime.time(),
-                amount=weekly_amount,
+                amount=amount,
                 quantity=0,  # Initialize quantity to 0
                 status='pending'
             )
-            session.add(schedule_entry)
-            schedule_entries.append(schedule_entry)
-            scheduled_times.append(execution_datetime.isoformat())
-
+            for week_number, execution_datetime, amount in plan
+        ]
+        session.add_all(schedule_entries)
         session.flush()
         session.commit()
-        logger.info(f"✅ Saved {len(schedule_entries)} schedules for cycle {cycle_id} to database")
-
-        for week, schedule_entry in enumerate(schedule_entries):
-            execution_datetime = start_datetime + timedelta(weeks=week)
-            time_str = execution_datetime.strftime("%H:%M")
-            target_date = execution_datetime.date()
-
-            def trade_job(schedule_id=schedule_entry.schedule_id, security_id=security_id, amount=weekly_amount, etf_name=etf_name, target_date=target_date):
-                now = datetime.now(IST)
-                if now.date() != target_date:
-                    logger.debug(f"⏭️ Skipping job for schedule_id={schedule_id}, not today ({now.date()} != {target_date})")
-                    return
-                execute_weekly_trade(schedule_id, security_id, amount, etf_name)
+        logger.info("✅ Saved %d schedules for cycle %s to database", len(schedule_entries), cycle_id)
 
-            schedule.every().day.at(time_str).do(trade_job).tag(f"trade_{cycle_id}_{week}")
-            logger.info(f"📅 Job scheduled for {target_date} at {time_str} [Week {week + 1}]")
+        register_trade_jobs([
+            {
+                "cycle_id": cycle_id,
+                "week_number": week_number,
+                "schedule_id": schedule_entry.schedule_id,
+                "security_id": security_id,
+                "amount": amount,
+                "etf_name": etf_name,
+                "execution_datetime": execution_datetime
+            }
+            for (week_number, execution_datetime, amount), schedule_entry in zip(plan, schedule_entries)
+        ])
 
-        logger.info("🗓️ Current Scheduled Jobs:")
-        for job in schedule.jobs:
-            logger.info(f"⏰ {job}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🗓️ Current Scheduled Jobs:\n%s", "\n".join(f"⏰ {job}" for job in schedule.jobs))
 
-        return scheduled_times, total_amount
+        return [execution_datetime.isoformat() for _, execution_datetime, _ in plan], total_amount
 
     except Exception as e:
-        logger.error(f"❌ Error scheduling trades: {e}", exc_info=True)
+        logger.error("❌ Error scheduling trades: %s", e, exc_info=True)
         session.rollback()
         return None, None
     finally:
         session.close()
 
+def plan_weekly_schedule(start_datetime, total_amount, weeks=5):
+    """
+    Splits a cycle into equal weekly tranches starting at start_datetime.
+    Returns a list of (week_number, execution_datetime, amount).
+    """
+    weekly_amount = total_amount / weeks
+    return [(week + 1, start_datetime + timedelta(weeks=week), weekly_amount) for week in range(weeks)]
+
+def _make_trade_job(schedule_id, security_id, amount, etf_name, target_date):
+    def trade_job():
+        now = datetime.now(IST)
+        if now.date() != target_date:
+            log_throttled(logger, logging.DEBUG, "skip_not_today", 60, "⏭️ Skipping jobs not due today", extra=kv(schedule_id=schedule_id, target_date=target_date))
+            return
+        execute_weekly_trade(schedule_id, security_id, amount, etf_name)
+    return trade_job
+
+# Guards every mutation of the scheduler's job list; held only for list
+# changes, never while a job runs
+scheduler_lock = threading.RLock()
+
+def run_pending_jobs():
+    """
+    Runs the jobs that are due, like schedule.run_pending(), but holds
+    scheduler_lock only to snapshot the due jobs and to drop cancelled ones,
+    so API changes to the job list never wait for a trading slot's broker calls.
+    Jobs removed by another thread after the snapshot are skipped.
+    """
+    with scheduler_lock:
+        due = sorted(job for job in schedule.jobs if job.should_run)
+    for job in due:
+        with scheduler_lock:
+            if job not in schedule.default_scheduler.jobs:
+                continue
+        result = job.run()
+        if isinstance(result, schedule.CancelJob) or result is schedule.CancelJob:
+            with scheduler_lock:
+                schedule.cancel_job(job)
+
+def trade_job_tag(cycle_id, week_number):
+    return f"trade_{cycle_id}_{week_number - 1}"
+
+def apply_schedule_diff(clear_tags, jobs):
+    """
+    Atomically removes the jobs carrying any of clear_tags and registers jobs.
+    The new jobs are built on a staging scheduler and swapped into the default
+    scheduler in one list assignment, so the scheduler thread never sees a
+    half-applied change. Jobs use the same dict shape as register_trade_jobs.
+    """
+    staging = schedule.Scheduler()
+    for job in jobs:
+        execution_datetime = job["execution_datetime"]
+        trade_job = _make_trade_job(
+            job["schedule_id"], job["security_id"], job["amount"], job["etf_name"], execution_datetime.date()
+        )
+        scheduled = staging.every().day.at(execution_datetime.strftime("%H:%M")).do(trade_job).tag(
+            trade_job_tag(job["cycle_id"], job["week_number"])
+        )
+        # Read by warm_up_slot to find what a slot will trade
+        scheduled.trade = job
+    slots = {job["execution_datetime"].strftime("%H:%M") for job in jobs}
+
+    clear_tags = set(clear_tags)
+    with scheduler_lock:
+        kept = [job for job in schedule.default_scheduler.jobs if not (job.tags & clear_tags)]
+        removed = len(schedule.default_scheduler.jobs) - len(kept)
+        if WARMUP_SECONDS > 0:
+            warmed = {tag for job in kept for tag in job.tags if tag.startswith("warmup_")}
+            for slot in sorted(slots):
+                if warmup_job_tag(slot) not in warmed:
+                    warm_at = datetime.strptime(slot, "%H:%M") - timedelta(seconds=WARMUP_SECONDS)
+                    staging.every().day.at(warm_at.strftime("%H:%M:%S")).do(warm_up_slot, slot).tag("warmup", warmup_job_tag(slot))
+        for job in staging.jobs:
+            job.scheduler = schedule.default_scheduler
+        schedule.default_scheduler.jobs[:] = kept + staging.jobs
+    logger.info("🔀 Scheduler diff applied", extra=kv(removed=removed, added=len(staging.jobs), scheduled=len(schedule.jobs)))
+
+def warmup_job_tag(slot):
+    return f"warmup_{slot}"
+
+@use_bulkhead("trading")
+def warm_up_slot(slot):
+    """
+    Pre-trade stage that runs WARMUP_SECONDS before an execution slot
+    ("HH:MM"). Loads the schedules due at the slot, which also checks out a
+    pooled DB connection, then primes the balance cache and the LTPs of the
+    due securities in parallel, opening the broker connections on the way.
+    At the deadline a trade then only re-checks the price and places the
+    order. Cancels itself once no trade job uses the slot any more.
+    """
+    started = time.perf_counter()
+    now = datetime.now(IST)
+    slot_datetime = datetime.combine(now.date(), datetime.strptime(slot, "%H:%M").time()).replace(tzinfo=IST)
+    if slot_datetime < now - timedelta(hours=12):
+        slot_datetime += timedelta(days=1)  # Warm-up before a slot just after midnight
+
+    with scheduler_lock:
+        slot_jobs = [
+            job.trade for job in schedule.jobs
+            if getattr(job, "trade", None) and job.trade["execution_datetime"].strftime("%H:%M") == slot
+        ]
+    if not slot_jobs:
+        logger.info("🧹 No trade jobs left at %s, removing its warm-up", slot)
+        return schedule.CancelJob
+    candidates = {job["schedule_id"]: job for job in slot_jobs if job["execution_datetime"].date() == slot_datetime.date()}
+    if not candidates:
+        return
+
+    session = Session()
+    try:
+        due_ids = session.execute(
+            select(InvestmentSchedule.schedule_id)
+            .join(InvestmentCycle, InvestmentSchedule.cycle_id == InvestmentCycle.cycle_id)
+            .where(
+                InvestmentSchedule.schedule_id.in_(candidates),
+                InvestmentSchedule.status.in_(RUNNABLE_STATUSES),
+                InvestmentCycle.status == "active"
+            )
+        ).scalars().all()
+    finally:
+        session.close()
+    if not due_ids:
+        return
+
+    security_ids = {
+        int(security_id[0] if isinstance(security_id, tuple) else security_id)
+        for security_id in (candidates[schedule_id]["security_id"] for schedule_id in due_ids)
+    }
+    results, failed = fan_out({"balance": (prime_balance,), "prices": (prime_ltps, security_ids, WARMUP_SECONDS)})
+    logger.info("🔥 Warm-up finished", extra=kv(
+        slot=slot, due=len(due_ids), securities=len(security_ids), priced=len(results["prices"] or {}),
+        failed=",".join(failed) or None, elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+    ))
+
+def register_trade_jobs(jobs):
+    """
+    Registers many trade jobs with the scheduler in one call.
+    Each job is a dict with cycle_id, week_number, schedule_id, security_id,
+    amount, etf_name and execution_datetime.
+    """
+    apply_schedule_diff([], jobs)
+
 def unschedule_jobs_for_cycle(cycle_id):
     tags_to_remove = [f"trade_{cycle_id}_{i}" for i in range(5)]
     count = 0
-    for tag in tags_to_remove:
-        schedule.clear(tag)
-        count += 1
-    logger.info(f"🛑 Unscheduled {count} jobs for cycle {cycle_id}")
\ No newline at end of file
+    with scheduler_lock:
+        for tag in tags_to_remove:
+            schedule.clear(tag)
+            count += 1
+    logger.info(f"🛑 Unscheduled {count} jobs for cycle {cycle_id}")
+
+
+# Dhan order statuses after which an order will not fill any further
+TERMINAL_ORDER_STATUSES = {"TRADED", "REJECTED", "CANCELLED", "EXPIRED"}
+
+def _fills_by_order(trades):
+    """Sums the trade book into order_id -> (filled quantity, traded value)."""
+    fills = {}
+    for trade in trades:
+        order_id = str(trade.get("orderId"))
+        quantity = int(trade.get("tradedQuantity") or 0)
+        filled, value = fills.get(order_id, (0, 0.0))
+        fills[order_id] = (filled + quantity, value + quantity * float(trade.get("tradedPrice") or 0.0))
+    return fills
+
+@use_bulkhead("trading")
+def reconcile_orders():
+    """
+    Settles every 'placed' schedule against the broker's order book and trade
+    book, each fetched once per pass however many orders are open. Filled
+    orders become 'executed' with the traded quantity, orders that ended
+    without a fill become 'failed', and working orders stay 'placed' with the
+    quantity filled so far. Schedules whose placement outcome was unknown
+    (no order id) are looked up by their correlation id first. Orders of past
+    days, which the order book no longer lists, are settled from the trade
+    history (fetched once per pass) or looked up by order id. Schedule changes
+    are written with one bulk UPDATE, the schedule's 'placed' history row is
+    updated to the final outcome, and the changes are pushed to clients as a
+    single 'order_updates' event.
+    """
+    session = Session()
+    try:
+        placed = session.execute(
+            select(
+                InvestmentSchedule.schedule_id, InvestmentSchedule.cycle_id, InvestmentSchedule.order_id,
+                InvestmentSchedule.quantity, InvestmentSchedule.amount, InvestmentSchedule.execution_date
+            ).where(InvestmentSchedule.status == "placed")
+        ).all()
+        if not placed:
+            return
+
+        results, failed = fan_out({"orders": (get_order_book,), "trades": (get_trade_book,)})
+        if results["orders"] is None:
+            logger.warning("⚠️ Order book unavailable, reconciliation of %d placed schedules postponed", len(placed))
+            return
+        orders = {str(order.get("orderId")): order for order in results["orders"]}
+        fills = _fills_by_order(results["trades"]) if results["trades"] is not None else {}
+
+        now = datetime.now(IST)
+        past_fills = None
+        updates, history, changes, executed_cycles = [], [], [], set()
+        for row in placed:
+            order_id = row.order_id
+            if not order_id:
+                found = get_order_by_correlation_id(order_correlation_id(row.schedule_id, row.execution_date))
+                if found is None:
+                    continue  # Broker unreachable, try again next pass
+                if found:
+                    order_id = str(found.get("orderId"))
+                    orders.setdefault(order_id, found)
+                elif row.execution_date >= now.date():
+                    continue  # The request may still show up today
+            order = orders.get(order_id) if order_id else None
+            if order is None and order_id and row.execution_date < now.date():
+                if past_fills is None:
+                    oldest = min(r.execution_date for r in placed)
+                    trades = get_trade_history(oldest, now.date() - timedelta(days=1))
+                    past_fills = _fills_by_order(trades) if trades is not None else {}
+                if order_id in past_fills:
+                    # Day orders end with the day, so an order with trades on a past day is done
+                    fills[order_id] = past_fills[order_id]
+                    order = {"orderId": order_id, "orderStatus": "TRADED"}
+                else:
+                    order = get_order_by_id(order_id)
+                    if order is None:
+                        continue  # Broker unreachable, try again next pass
+                    order = order or None
+            if order is None and not order_id:
+                status, quantity, value = "failed", 0, 0.0
+                error_message = "Order never reached the broker"
+            elif order is None:
+                # Today's orders may not be listed yet
+                if row.execution_date >= now.date():
+                    continue
+                status, quantity, value = "unreconciled", row.quantity, 0.0
+                error_message = "Order not found at the broker"
+            else:
+                order_status = order.get("orderStatus")
+                filled, value = fills.get(order_id) or (
+                    int(order.get("filledQty") or 0),
+                    int(order.get("filledQty") or 0) * float(order.get("averageTradedPrice") or 0.0)
+                )
+                if order_status in TERMINAL_ORDER_STATUSES:
+                    status = "executed" if filled > 0 else "failed"
+                    quantity = filled
+                    error_message = None if filled > 0 else (order.get("omsErrorDescription") or f"Order {order_status}")
+                elif 0 < filled != row.quantity:
+                    status, quantity, error_message = "placed", filled, None
+                else:
+                    continue
+
+            updates.append({
+                "schedule_id": row.schedule_id, "order_id": order_id, "status": status, "quantity": quantity, "updated_at": now
+            })
+            changes.append({
+                "schedule_id": row.schedule_id,
+                "cycle_id": row.cycle_id,
+                "order_id": order_id,
+                "status": status,
+                "quantity": quantity,
+                "average_price": round(value / quantity, 4) if quantity and value else None
+            })
+            if status != "placed":
+                history.append({
+                    "schedule_id": row.schedule_id,
+                    "amount": round(value, 2) if value else row.amount,
+                    "status": status,
+                    "error_message": error_message
+                })
+            if status == "executed":
+                executed_cycles.add(row.cycle_id)
+
+        if not updates:
+            return
+        session.execute(update(InvestmentSchedule), updates)
+        if history:
+            # Settle the row written when the order was placed instead of adding a second one
+            placed_rows = dict(session.execute(
+                select(ExecutionHistory.schedule_id, func.max(ExecutionHistory.execution_id))
+                .where(
+                    ExecutionHistory.schedule_id.in_([entry["schedule_id"] for entry in history]),
+                    ExecutionHistory.status == "placed"
+                )
+                .group_by(ExecutionHistory.schedule_id)
+            ).all())
+            settled = [dict(entry, execution_id=placed_rows[entry["schedule_id"]]) for entry in history if entry["schedule_id"] in placed_rows]
+            missing = [dict(entry, execution_timestamp=now) for entry in history if entry["schedule_id"] not in placed_rows]
+            if settled:
+                session.execute(update(ExecutionHistory), settled)
+            if missing:
+                session.execute(insert(ExecutionHistory), missing)
+
+        completed_cycles = []
+        if executed_cycles:
+            completed_cycles = session.execute(
+                select(InvestmentSchedule.cycle_id)
+                .where(InvestmentSchedule.cycle_id.in_(executed_cycles), InvestmentSchedule.status == "executed")
+                .group_by(InvestmentSchedule.cycle_id)
+                .having(func.count() >= 5)
+            ).scalars().all()
+            if completed_cycles:
+                session.execute(
+                    update(InvestmentCycle)
+                    .where(InvestmentCycle.cycle_id.in_(completed_cycles), InvestmentCycle.status == "active")
+                    .values(status="completed", updated_at=now)
+                )
+        session.commit()
+
+        socketio.emit('order_updates', {'updates': changes, 'completed_cycles': completed_cycles})
+        logger.info("🔁 Reconciled placed orders", extra=kv(
+            placed=len(placed), changed=len(updates), settled=len(history), completed_cycles=len(completed_cycles)
+        ))
+    except Exception as e:
+        logger.error("❌ Error reconciling orders: %s", e, exc_info=True)
+        session.rollback()
+    finally:
+        session.close()
+
+def register_reconcile_job():
+    """Runs reconcile_orders every RECONCILE_INTERVAL seconds on the trade scheduler."""
+    with scheduler_lock:
+        schedule.clear("reconcile")
+        schedule.every(RECONCILE_INTERVAL).seconds.do(reconcile_orders).tag("reconcile")
+    logger.info(f"🔁 Order reconciliation scheduled every {RECONCILE_INTERVAL}s")
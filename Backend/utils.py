@@ -1,14 +1,103 @@
+import time
+import threading
+import contextvars
 import requests
 import pandas as pd
 from io import StringIO
-from config import logger, CLIENT_ID, ACCESS_TOKEN
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import get_logger, kv, CLIENT_ID, ACCESS_TOKEN, BROKER_MAX_WORKERS, BROKER_CALL_TIMEOUT, BALANCE_CACHE_TTL, DHAN_API_URL, DHAN_SCRIP_MASTER_URL, BROKER_MODE, STALE_DATA_MAX_AGE
 from models import Session, ExecutionHistory
 from datetime import datetime
 from config import IST
-from dhanhq import dhanhq
+from metrics import timed_broker_call
+from broker import create_broker
+from resilience import LastGood, ResilientAdapter
 
-# Initialize Dhan client
-dhan = dhanhq(CLIENT_ID, ACCESS_TOKEN)
+logger = get_logger(__name__)
+
+# Initialize broker client (live Dhan or paper trading, see BROKER_MODE);
+# paper fills are priced through get_ltp_batch, which is resolved at call time
+dhan = create_broker(lambda security_ids: get_ltp_batch(security_ids))
+
+# Shared bounded executor for independent broker and DB calls
+broker_executor = ThreadPoolExecutor(max_workers=BROKER_MAX_WORKERS, thread_name_prefix="broker")
+
+# fan_out calls submitted but not yet picked up by a worker
+_queued_calls = 0
+_queued_lock = threading.Lock()
+
+def _count_queued(delta):
+    global _queued_calls
+    with _queued_lock:
+        _queued_calls += delta
+
+def queued_broker_calls():
+    return _queued_calls
+
+def _dequeue_and_run(run, func, *args):
+    _count_queued(-1)
+    return run(func, *args)
+
+# Pooled keep-alive session for the marketfeed and scrip master requests,
+# behind the broker timeouts, circuit breakers and bulkheads
+http_session = requests.Session()
+http_session.mount("https://", ResilientAdapter(pool_connections=4, pool_maxsize=BROKER_MAX_WORKERS))
+http_session.mount("http://", ResilientAdapter(pool_connections=4, pool_maxsize=BROKER_MAX_WORKERS))
+
+# Last good holdings and prices, for the portfolio endpoints to fall back on
+last_good = LastGood("stale_broker_data", STALE_DATA_MAX_AGE)
+
+SCRIP_MASTER_URL = DHAN_SCRIP_MASTER_URL
+LTP_URL = f"{DHAN_API_URL}/v2/marketfeed/ltp"
+LTP_BATCH_SIZE = 1000  # Dhan accepts up to 1000 instruments per marketfeed request
+
+def fan_out(calls, timeouts=None, default_timeout=BROKER_CALL_TIMEOUT):
+    """
+    Runs independent calls concurrently on the shared broker executor.
+    `calls` maps a name to a tuple of (func, *args). Each call gets its own
+    deadline (from `timeouts` or `default_timeout`), so total latency is that
+    of the slowest call rather than the sum of all of them.
+    Returns (results, failed): results maps every name to its return value,
+    or None if the call raised or missed its deadline; failed lists those names.
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    # Each call runs in a copy of the caller's context so request-scoped state
+    # (e.g. the Flask request used for metrics labels) is still visible
+    _count_queued(len(calls))
+    futures = {
+        name: broker_executor.submit(_dequeue_and_run, contextvars.copy_context().run, func, *args)
+        for name, (func, *args) in calls.items()
+    }
+    results = {}
+    failed = []
+    for name, future in futures.items():
+        deadline = started + timeouts.get(name, default_timeout)
+        try:
+            results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.warning("⌛ '%s' missed its %ss deadline, continuing without it", name, timeouts.get(name, default_timeout))
+            if future.cancel():
+                _count_queued(-1)  # Never started, so never dequeued
+            results[name] = None
+            failed.append(name)
+        except Exception as e:
+            logger.error("❌ '%s' failed during fan-out: %s", name, e, exc_info=True)
+            results[name] = None
+            failed.append(name)
+    return results, failed
+
+@timed_broker_call("scrip_master")
+def _load_scrip_master(required_columns):
+    response = http_session.get(SCRIP_MASTER_URL, verify=False)
+    df = pd.read_csv(StringIO(response.text))
+    df.columns = df.columns.str.strip()
+    for col in required_columns:
+        if col not in df.columns:
+            raise KeyError(f"Required column '{col}' not found.")
+    df["UNDERLYING_SYMBOL"] = df["UNDERLYING_SYMBOL"].astype(str).str.strip()
+    df["EXCH_ID"] = df["EXCH_ID"].astype(str).str.strip()
+    return df
 
 # def get_security_details(symbol, exchange="NSE"):
 #     try:
@@ -31,39 +120,59 @@ dhan = dhanhq(CLIENT_ID, ACCESS_TOKEN)
 #         else:
 #             raise ValueError(f"❌ Symbol '{symbol}' not found in Dhan CSV for exchange {exchange}.")
 #     except Exception as e:
-#         logger.error(f"❌ Error in get_security_details: {e}", exc_info=True)
+#         logger.error("❌ Error in get_security_details: %s", e, exc_info=True)
 #         return None
 def get_security_details(symbol, exchange="NSE"):
     try:
-        logger.info(f"🔍 Fetching SECURITY_ID and SYMBOL_NAME for '{symbol}' on exchange '{exchange}'...")
-        url = "https://images.dhan.co/api-data/api-scrip-master-detailed.csv"
-        response = requests.get(url, verify=False)
-        df = pd.read_csv(StringIO(response.text))
-        df.columns = df.columns.str.strip()
-        required_columns = ["UNDERLYING_SYMBOL", "SECURITY_ID", "EXCH_ID", "SYMBOL_NAME"]
-        for col in required_columns:
-            if col not in df.columns:
-                raise KeyError(f"Required column '{col}' not found.")
-        df["UNDERLYING_SYMBOL"] = df["UNDERLYING_SYMBOL"].astype(str).str.strip()
-        df["EXCH_ID"] = df["EXCH_ID"].astype(str).str.strip()
+        logger.debug("🔍 Fetching SECURITY_ID and SYMBOL_NAME for '%s' on exchange '%s'...", symbol, exchange)
+        df = _load_scrip_master(["UNDERLYING_SYMBOL", "SECURITY_ID", "EXCH_ID", "SYMBOL_NAME"])
         match = df[(df["UNDERLYING_SYMBOL"] == symbol) & (df["EXCH_ID"] == exchange)]
         if not match.empty:
             security_id = match.iloc[0]["SECURITY_ID"]
             symbol_name = match.iloc[0]["SYMBOL_NAME"]
-            logger.info(f"✅ Found SECURITY_ID: {security_id} and SYMBOL_NAME: {symbol_name} for {symbol} on {exchange}")
+            logger.info("✅ Resolved security", extra=kv(symbol=symbol, exchange=exchange, security_id=security_id, symbol_name=symbol_name))
             return int(security_id), symbol_name
         else:
             raise ValueError(f"❌ Symbol '{symbol}' not found in Dhan CSV for exchange {exchange}.")
     except Exception as e:
-        logger.error(f"❌ Error in get_security_details: {e}", exc_info=True)
+        logger.error("❌ Error in get_security_details: %s", e, exc_info=True)
         return None, None
+
+def get_security_details_batch(symbols, exchange="NSE"):
+    """
+    Resolves SECURITY_ID and SYMBOL_NAME for many symbols with a single
+    scrip master download. Returns a dict of symbol -> (security_id, symbol_name);
+    symbols that cannot be resolved map to (None, None).
+    """
+    symbols = list(dict.fromkeys(symbols))
+    resolved = {symbol: (None, None) for symbol in symbols}
+    if not symbols:
+        return resolved
+    try:
+        logger.info("🔍 Fetching SECURITY_ID and SYMBOL_NAME for %d symbols on exchange '%s'...", len(symbols), exchange)
+        df = _load_scrip_master(["UNDERLYING_SYMBOL", "SECURITY_ID", "EXCH_ID", "SYMBOL_NAME"])
+        matches = df[(df["UNDERLYING_SYMBOL"].isin(symbols)) & (df["EXCH_ID"] == exchange)]
+        matches = matches.drop_duplicates(subset="UNDERLYING_SYMBOL", keep="first")
+        for symbol, security_id, symbol_name in zip(matches["UNDERLYING_SYMBOL"], matches["SECURITY_ID"], matches["SYMBOL_NAME"]):
+            resolved[symbol] = (int(security_id), symbol_name)
+        missing = [symbol for symbol, (security_id, _) in resolved.items() if security_id is None]
+        if missing:
+            logger.warning("⚠️ Symbols not found in Dhan CSV for exchange %s: %s", exchange, missing)
+        logger.info("✅ Resolved %d/%d symbols on %s", len(symbols) - len(missing), len(symbols), exchange)
+    except Exception as e:
+        logger.error("❌ Error in get_security_details_batch: %s", e, exc_info=True)
+    return resolved
+
+@timed_broker_call("get_ltp")
 def get_ltp(security_id):
+    if BROKER_MODE == "paper":
+        return dhan.get_ltp(security_id)
     try:
         # Handle case where security_id is a tuple (e.g., from get_security_details)
         if isinstance(security_id, tuple):
             security_id = security_id[0]  # Take the first element (security_id)
         security_id = int(security_id)
-        url = "https://api.dhan.co/v2/marketfeed/ltp"
+        url = LTP_URL
         headers = {
             "Accept": "application/json",
             "Content-Type": "application/json",
@@ -74,23 +183,56 @@ def get_ltp(security_id):
             "NSE_EQ": [security_id],
             "NSE_FNO": []
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = http_session.post(url, headers=headers, json=payload)
         if response.status_code == 200:
             data = response.json()
             ltp_info = data.get("data", {}).get("NSE_EQ", {}).get(str(security_id))
             if ltp_info and "last_price" in ltp_info:
                 ltp = float(ltp_info["last_price"])
-                logger.info(f"📈 LTP for SECURITY_ID {security_id}: ₹{ltp}")
+                logger.debug("📈 LTP", extra=kv(security_id=security_id, ltp=ltp))
                 return ltp
             else:
-                logger.warning(f"⚠️ 'last_price' not found in response: {data}")
+                logger.warning("⚠️ 'last_price' not found in response: %s", data)
         else:
-            logger.error(f"❌ Failed to fetch LTP. Status: {response.status_code}, Response: {response.text}")
+            logger.error("❌ Failed to fetch LTP. Status: %s, Response: %s", response.status_code, response.text)
             return None
     except Exception as e:
-        logger.error(f"❌ Exception while fetching LTP: {e}", exc_info=True)
+        logger.error("❌ Exception while fetching LTP: %s", e, exc_info=True)
         return None
 
+@timed_broker_call("get_ltp_batch")
+def get_ltp_batch(security_ids):
+    """
+    Fetches LTPs for many NSE_EQ securities with one marketfeed request per
+    LTP_BATCH_SIZE ids. Returns a dict of security_id -> ltp; ids without a
+    price are left out.
+    """
+    security_ids = list(dict.fromkeys(int(security_id) for security_id in security_ids))
+    ltps = {}
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "access-token": ACCESS_TOKEN,
+        "client-id": CLIENT_ID
+    }
+    for offset in range(0, len(security_ids), LTP_BATCH_SIZE):
+        batch = security_ids[offset:offset + LTP_BATCH_SIZE]
+        try:
+            response = http_session.post(LTP_URL, headers=headers, json={"NSE_EQ": batch, "NSE_FNO": []})
+            if response.status_code != 200:
+                logger.error("❌ Failed to fetch LTP batch. Status: %s, Response: %s", response.status_code, response.text)
+                continue
+            prices = response.json().get("data", {}).get("NSE_EQ", {})
+            for security_id in batch:
+                ltp_info = prices.get(str(security_id))
+                if ltp_info and "last_price" in ltp_info:
+                    ltps[security_id] = float(ltp_info["last_price"])
+        except Exception as e:
+            logger.error("❌ Exception while fetching LTP batch: %s", e, exc_info=True)
+    logger.debug("📈 Fetched LTP for %d/%d securities", len(ltps), len(security_ids))
+    return ltps
+
+@timed_broker_call("get_balance")
 def get_balance():
     try:
         response = dhan.get_fund_limits()
@@ -98,16 +240,207 @@ def get_balance():
             data = response["data"]
             available_balance = float(data.get("availableBalance", 0.0))
             withdrawable_balance = float(data.get("withdrawableBalance", 0.0))
-            logger.info(f"💰 Available Balance: ₹{available_balance}")
-            logger.info(f"🏦 Withdrawable Balance: ₹{withdrawable_balance}")
+            logger.debug("💰 Balance", extra=kv(available=available_balance, withdrawable=withdrawable_balance))
             return available_balance, withdrawable_balance
         else:
-            logger.error(f"❌ Failed to fetch balance. Response: {response}")
+            logger.error("❌ Failed to fetch balance. Response: %s", response)
             return None, None
     except Exception as e:
-        logger.error(f"❌ Exception while fetching balance: {e}", exc_info=True)
+        logger.error("❌ Exception while fetching balance: %s", e, exc_info=True)
         return None, None
 
+# Balance primed by the pre-trade warm-up. Orders placed against it are
+# debited locally so trades in the same slot cannot spend the same cash twice.
+_balance_cache = {"balance": None, "fetched_at": 0.0}
+_balance_lock = threading.Lock()
+
+def prime_balance():
+    balance = get_balance()
+    if balance[1] is not None:
+        with _balance_lock:
+            _balance_cache["balance"] = balance
+            _balance_cache["fetched_at"] = time.monotonic()
+    return balance
+
+def get_cached_balance(max_age=BALANCE_CACHE_TTL):
+    """Returns the primed balance while it is younger than max_age, else fetches it."""
+    with _balance_lock:
+        if _balance_cache["balance"] is not None and time.monotonic() - _balance_cache["fetched_at"] < max_age:
+            return _balance_cache["balance"]
+    return get_balance()
+
+def debit_cached_balance(amount):
+    with _balance_lock:
+        if _balance_cache["balance"] is not None:
+            available, withdrawable = _balance_cache["balance"]
+            _balance_cache["balance"] = (available - amount, withdrawable - amount)
+
+def prime_ltps(security_ids, hold_seconds=0.0):
+    """
+    Loads LTPs for the given securities in one marketfeed call, which also
+    opens the pooled connection. In paper mode the prices seed the paper
+    broker's LTP cache and are kept for hold_seconds (the warm-up lead time),
+    so fills at the deadline need no request at all.
+    """
+    if BROKER_MODE == "paper":
+        return dhan.prime_prices(security_ids, hold_seconds)
+    return get_ltp_batch(security_ids)
+
+@timed_broker_call("get_holdings")
+def get_holdings():
+    try:
+        response = dhan.get_holdings()
+        if response and response.get("status") == "success" and "data" in response:
+            holdings = response["data"]
+            logger.debug("📦 Fetched %d holdings from Dhan", len(holdings))
+            return holdings
+        else:
+            logger.error("❌ Failed to fetch holdings. Response: %s", response)
+            return None
+    except Exception as e:
+        logger.error("❌ Exception while fetching holdings: %s", e, exc_info=True)
+        return None
+
+@timed_broker_call("get_order_book")
+def get_order_book():
+    """Today's full order book in one call, or None on failure."""
+    try:
+        response = dhan.get_order_list()
+        if response and response.get("status") == "success" and "data" in response:
+            orders = response["data"] or []
+            logger.debug("📒 Fetched %d orders from Dhan", len(orders))
+            return orders
+        else:
+            logger.error("❌ Failed to fetch order book. Response: %s", response)
+            return None
+    except Exception as e:
+        logger.error("❌ Exception while fetching order book: %s", e, exc_info=True)
+        return None
+
+def _single_order(response, lookup):
+    """
+    Order dict from a single-order lookup response, {} if the broker answered
+    that no such order exists, or None if the answer was inconclusive.
+    """
+    if response and response.get("status") == "success":
+        order = response.get("data") or {}
+        # Dhan may return the matching orders as a list
+        if isinstance(order, list):
+            order = order[-1] if order else {}
+        return order
+    remarks = (response or {}).get("remarks")
+    # DH-907 is Dhan's "no data present" error; anything else is inconclusive
+    if isinstance(remarks, dict) and remarks.get("error_code") == "DH-907":
+        logger.debug("📒 No broker order for %s", lookup)
+        return {}
+    logger.error("❌ Failed to look up order by %s. Response: %s", lookup, response)
+    return None
+
+@timed_broker_call("get_order_by_correlation_id")
+def get_order_by_correlation_id(correlation_id):
+    """
+    Looks up the order placed with a correlation id (the place_order tag).
+    Returns the order dict, {} if the broker answered that no such order
+    exists, or None if the broker could not be reached.
+    """
+    try:
+        return _single_order(dhan.get_order_by_correlationID(correlation_id), f"correlation id {correlation_id}")
+    except Exception as e:
+        logger.error("❌ Exception while looking up order by correlation id: %s", e, exc_info=True)
+        return None
+
+@timed_broker_call("get_order_by_id")
+def get_order_by_id(order_id):
+    """Looks up one order by its order id; same return values as get_order_by_correlation_id."""
+    try:
+        return _single_order(dhan.get_order_by_id(order_id), f"order id {order_id}")
+    except Exception as e:
+        logger.error("❌ Exception while looking up order by id: %s", e, exc_info=True)
+        return None
+
+@timed_broker_call("get_trade_book")
+def get_trade_book():
+    """Today's full trade book (individual fills) in one call, or None on failure."""
+    try:
+        response = dhan.get_trade_book()
+        if response and response.get("status") == "success" and "data" in response:
+            trades = response["data"] or []
+            logger.debug("📒 Fetched %d trades from Dhan", len(trades))
+            return trades
+        else:
+            logger.error("❌ Failed to fetch trade book. Response: %s", response)
+            return None
+    except Exception as e:
+        logger.error("❌ Exception while fetching trade book: %s", e, exc_info=True)
+        return None
+
+@timed_broker_call("get_trade_history")
+def get_trade_history(from_date, to_date):
+    """Fills of past trading days between two dates (inclusive), all pages, or None on failure."""
+    trades, page = [], 0
+    try:
+        while True:
+            response = dhan.get_trade_history(from_date.isoformat(), to_date.isoformat(), page)
+            if not (response and response.get("status") == "success"):
+                logger.error("❌ Failed to fetch trade history. Response: %s", response)
+                return None
+            batch = response.get("data") or []
+            if not batch:
+                break
+            trades.extend(batch)
+            page += 1
+        logger.debug("📒 Fetched %d historical trades from Dhan (%s to %s)", len(trades), from_date, to_date)
+        return trades
+    except Exception as e:
+        logger.error("❌ Exception while fetching trade history: %s", e, exc_info=True)
+        return None
+
+def with_stale_fallback(key, fetch, *args):
+    """
+    Calls fetch(*args) and remembers a successful (not None) result under key.
+    If the call fails, returns the last good value while it is younger than
+    STALE_DATA_MAX_AGE. Returns (value, stale_age) where stale_age is None for
+    fresh data and the age in seconds for a fallback; value is None if neither
+    is available.
+    """
+    value = fetch(*args)
+    if value is not None:
+        last_good.put(key, value)
+        return value, None
+    value, age = last_good.get(key)
+    if value is not None:
+        logger.warning("🕰️ Broker call failed, serving last good data", extra=kv(key=key, age_s=round(age, 1)))
+    return value, age
+
+def get_holdings_or_stale():
+    return with_stale_fallback("holdings", get_holdings)
+
+def get_ltp_or_stale(security_id):
+    if isinstance(security_id, tuple):
+        security_id = security_id[0]
+    return with_stale_fallback(("ltp", int(security_id)), get_ltp, security_id)
+
+def get_ltps_or_stale(security_ids):
+    """
+    LTPs for many securities from one get_ltp_batch call. Ids the batch could
+    not price fall back to their last good LTP, shared with get_ltp_or_stale.
+    Returns (ltps, stale_ids): ltps maps int security_id -> ltp, stale_ids
+    lists the ids served from the fallback.
+    """
+    ltps = get_ltp_batch(security_ids)
+    stale_ids = []
+    for security_id in dict.fromkeys(int(security_id) for security_id in security_ids):
+        if security_id in ltps:
+            last_good.put(("ltp", security_id), ltps[security_id])
+            continue
+        value, _ = last_good.get(("ltp", security_id))
+        if value is not None:
+            ltps[security_id] = value
+            stale_ids.append(security_id)
+    if stale_ids:
+        logger.warning("🕰️ Broker call failed, serving last good LTPs", extra=kv(count=len(stale_ids)))
+    return ltps, stale_ids
+
 def save_execution_to_db(schedule_id, amount, ltp, quantity, execution_timestamp, status, error_message=None):
     session = Session()
     try:
@@ -120,9 +453,9 @@ def save_execution_to_db(schedule_id, amount, ltp, quantity, execution_timestamp
         )
         session.add(execution)
         session.commit()
-        logger.info(f"✅ Execution saved to database: Schedule ID {schedule_id}, Status {status}")
+        logger.debug("✅ Execution saved to database", extra=kv(schedule_id=schedule_id, status=status))
     except Exception as e:
-        logger.error(f"❌ Error saving execution to database: {e}", exc_info=True)
+        logger.error("❌ Error saving execution to database: %s", e, exc_info=True, extra=kv(schedule_id=schedule_id))
         session.rollback()
     finally:
         session.close()
\ No newline at end of file